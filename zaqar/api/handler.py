@@ -21,6 +21,8 @@ from zaqar.common import consts
 from zaqar.common import errors
 from zaqar.common import urls
 
+_VALIDATOR = schema_validator.RequestSchema()
+
 
 class Handler(object):
     """Defines API handler
@@ -45,6 +47,21 @@ class Handler(object):
     def set_subscription_factory(self, factory):
         self._subscription_factory = factory
 
+    def get_claim_subscriber(self, protocol, queue_name):
+        """Returns the URL notifying `protocol` of posts to a queue.
+
+        :returns: None if the transport can't be notified
+        """
+        if self._subscription_factory is None:
+            return None
+        return self._subscription_factory.get_claim_subscriber(protocol,
+                                                               queue_name)
+
+    def get_subscription_options(self):
+        """Returns the options of the subscriptions of the transport."""
+        return {consts.SUBSCRIPTION_BATCH_URL:
+                self._subscription_factory.get_batch_url()}
+
     def clean_subscriptions(self, subscriptions):
         for resp in subscriptions:
             body = {'queue_name': resp._request._body.get('queue_name'),
@@ -61,6 +78,9 @@ class Handler(object):
                 # Default to the connected websocket as subscriber
                 subscriber = self._subscription_factory.get_subscriber(
                     protocol)
+                return self.v2_endpoints.subscription_create(
+                    req, subscriber,
+                    extra_options=self.get_subscription_options())
             return self.v2_endpoints.subscription_create(req, subscriber)
 
         return getattr(self.v2_endpoints, req._action)(req)
@@ -73,8 +93,7 @@ class Handler(object):
         """
         try:
             action = payload.get('action')
-            validator = schema_validator.RequestSchema()
-            is_valid = validator.validate(action=action, body=payload)
+            is_valid = _VALIDATOR.validate(action=action, body=payload)
         except errors.InvalidAction as ex:
             body = {'error': str(ex)}
             headers = {'status': 400}
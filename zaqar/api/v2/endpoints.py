@@ -12,8 +12,6 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
-from stevedore import driver
-
 from oslo_log import log as logging
 from oslo_utils import netutils
 
@@ -21,6 +19,7 @@ from zaqar.common.api import errors as api_errors
 from zaqar.common.api import response
 from zaqar.common.api import utils as api_utils
 from zaqar.i18n import _
+from zaqar.notification import tasks
 from zaqar.storage import errors as storage_errors
 from zaqar.transport import validation
 
@@ -222,6 +221,57 @@ class Endpoints(object):
             headers = {'status': 200}
             return response.Response(req, body, headers)
 
+    @api_utils.on_exception_sends_500
+    def queue_get_stats_many(self, req):
+        """Gets the stats of several queues
+
+        The stats of the queues given in `queue_names` are returned,
+        or else the stats of a page of the project's queues.
+
+        :param req: Request instance ready to be sent.
+        :type req: `api.common.Request`
+        :return: resp: Response instance
+        :type: resp: `api.common.Response`
+        """
+        project_id = req._headers.get('X-Project-ID')
+        queue_names = req._body.get('queue_names')
+
+        LOG.debug(u'Get queues stats - project: %(project)s',
+                  {'project': project_id})
+
+        body = {}
+        try:
+            if queue_names:
+                self._validate.queue_listing(limit=len(queue_names))
+                for queue_name in queue_names:
+                    self._validate.queue_identification(queue_name,
+                                                        project_id)
+            else:
+                kwargs = api_utils.get_headers(req)
+                self._validate.queue_listing(**kwargs)
+                results = self._queue_controller.list(
+                    project=project_id, **kwargs)
+                queue_names = [queue['name'] for queue in next(results)]
+                body['marker'] = next(results) or kwargs.get('marker', '')
+
+            stats = self._queue_controller.bulk_stats(queue_names,
+                                                      project=project_id)
+        except (ValueError, validation.ValidationFailed) as ex:
+            LOG.debug(ex)
+            headers = {'status': 400}
+            return api_utils.error_response(req, ex, headers)
+        except storage_errors.ExceptionBase as ex:
+            LOG.exception(ex)
+            error = _('Cannot retrieve queues stats.')
+            headers = {'status': 503}
+            return api_utils.error_response(req, ex, headers, error)
+
+        body['queues'] = [dict(stats[queue_name], name=queue_name)
+                          for queue_name in queue_names
+                          if queue_name in stats]
+        headers = {'status': 200}
+        return response.Response(req, body, headers)
+
     @api_utils.on_exception_sends_500
     def queue_purge(self, req):
         """Purge queue
@@ -839,17 +889,21 @@ class Endpoints(object):
         return response.Response(req, body, headers)
 
     @api_utils.on_exception_sends_500
-    def subscription_create(self, req, subscriber):
+    def subscription_create(self, req, subscriber, extra_options=None):
         """Create a subscription for a queue.
 
         :param req: Request instance ready to be sent.
         :type req: `api.common.Request`
+        :param extra_options: Options added to the ones of the request.
+        :type extra_options: dict
         :return: resp: Response instance
         :type: resp: `api.common.Response`
         """
         project_id = req._headers.get('X-Project-ID')
         queue_name = req._body.get('queue_name')
         options = req._body.get('options', {})
+        if extra_options:
+            options = dict(options, **extra_options)
         ttl = req._body.get('ttl', self._defaults.subscription_ttl)
 
         LOG.debug(
@@ -859,10 +913,9 @@ class Endpoints(object):
 
         try:
             url = netutils.urlsplit(subscriber)
-            mgr = driver.DriverManager('zaqar.notification.tasks', url.scheme,
-                                       invoke_on_load=True)
             req_data = req._env.copy()
-            mgr.driver.register(subscriber, options, ttl, project_id, req_data)
+            tasks.get_task(url.scheme).register(
+                subscriber, options, ttl, project_id, req_data)
 
             data = {'subscriber': subscriber,
                     'options': options,
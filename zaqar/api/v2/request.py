@@ -105,6 +105,30 @@ class RequestSchema(v1_1.RequestSchema):
             'required': ['action', 'headers', 'body']
         },
 
+        consts.QUEUE_GET_STATS_MANY: {
+            'properties': {
+                'action': {'enum': [consts.QUEUE_GET_STATS_MANY]},
+                'headers': {
+                    'type': 'object',
+                    'properties': headers,
+                    'required': ['Client-ID', 'X-Project-ID']
+                },
+                'body': {
+                    'type': 'object',
+                    'properties': {
+                        'queue_names': {
+                            'type': 'array',
+                            'items': {'type': 'string'},
+                        },
+                        'marker': {'type': 'string'},
+                        'limit': {'type': 'integer'},
+                    },
+                }
+            },
+            'required': ['action', 'headers'],
+            'admin': True
+        },
+
         consts.QUEUE_PURGE: {
             'properties': {
                 'action': {'enum': [consts.QUEUE_PURGE]},
@@ -123,4 +147,67 @@ class RequestSchema(v1_1.RequestSchema):
             },
             'required': ['action', 'headers', 'body']
         },
+
+        # Claims pushed to the consumer
+        consts.CLAIM_SUBSCRIBE: {
+            'properties': {
+                'action': {'enum': [consts.CLAIM_SUBSCRIBE]},
+                'headers': {
+                    'type': 'object',
+                    'properties': headers,
+                    'required': ['Client-ID', 'X-Project-ID']
+                },
+                'body': {
+                    'type': 'object',
+                    'properties': {
+                        'queue_name': {'type': 'string'},
+                        'credit': {'type': 'integer', 'minimum': 1},
+                        'limit': {'type': 'integer', 'minimum': 1},
+                        'ttl': {'type': 'integer'},
+                        'grace': {'type': 'integer'}
+                    },
+                    'required': ['queue_name', 'credit'],
+                }
+            },
+            'required': ['action', 'headers', 'body']
+        },
+
+        consts.CLAIM_CREDIT: {
+            'properties': {
+                'action': {'enum': [consts.CLAIM_CREDIT]},
+                'headers': {
+                    'type': 'object',
+                    'properties': headers,
+                    'required': ['Client-ID', 'X-Project-ID']
+                },
+                'body': {
+                    'type': 'object',
+                    'properties': {
+                        'queue_name': {'type': 'string'},
+                        'credit': {'type': 'integer', 'minimum': 1}
+                    },
+                    'required': ['queue_name', 'credit'],
+                }
+            },
+            'required': ['action', 'headers', 'body']
+        },
+
+        consts.CLAIM_UNSUBSCRIBE: {
+            'properties': {
+                'action': {'enum': [consts.CLAIM_UNSUBSCRIBE]},
+                'headers': {
+                    'type': 'object',
+                    'properties': headers,
+                    'required': ['Client-ID', 'X-Project-ID']
+                },
+                'body': {
+                    'type': 'object',
+                    'properties': {
+                        'queue_name': {'type': 'string'}
+                    },
+                    'required': ['queue_name'],
+                }
+            },
+            'required': ['action', 'headers', 'body']
+        },
     })
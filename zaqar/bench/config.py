@@ -58,6 +58,11 @@ _CLI_OPTIONS = (
     cfg.IntOpt('messages_per_claim', short='cno', default=5,
                help=('Number of messages the consumer will attempt to '
                      'claim at a time')),
+    cfg.IntOpt('messages_per_pop', short='pno', default=0,
+               help=('Number of messages the consumer will attempt to '
+                     'pop at a time. If greater than zero, the consumer '
+                     'pops messages instead of claiming and deleting '
+                     'them')),
     cfg.IntOpt('messages_per_list', short='lno', default=5,
                help=('Number of messages the observer will attempt to '
                      'list at a time')),
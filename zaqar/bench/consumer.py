@@ -92,39 +92,90 @@ def claim_delete(queues, stats, test_duration, ttl, grace, limit):
     })
 
 
+def pop(queues, stats, test_duration, limit):
+    """Consumer Worker
+
+    The Consumer Worker continuously pops messages for the
+    specified duration. The time taken for each pop is recorded
+    for calculating throughput and latency.
+    """
+
+    end = time.time() + test_duration
+    pop_total_elapsed = 0
+    total_failed_requests = 0
+    pop_total_requests = 0
+    popped_messages = 0
+
+    while time.time() < end:
+        # NOTE(kgriffs): Distribute requests across all queues evenly.
+        queue = random.choice(queues)
+
+        try:
+            marktime.start('pop_message')
+
+            messages = queue.pop(count=limit)
+
+            pop_total_elapsed += marktime.stop('pop_message').seconds
+            pop_total_requests += 1
+            popped_messages += len(list(messages))
+
+        except errors.TransportError as ex:
+            sys.stderr.write("Could not pop messages : {0}\n".format(ex))
+            total_failed_requests += 1
+
+    total_requests = pop_total_requests + total_failed_requests
+
+    stats.put({
+        'total_requests': total_requests,
+        'pop_total_requests': pop_total_requests,
+        'pop_total_elapsed': pop_total_elapsed,
+        'popped_messages': popped_messages,
+    })
+
+
 def load_generator(stats, num_workers, num_queues,
-                   test_duration, url, ttl, grace, limit):
+                   test_duration, url, ttl, grace, limit, pop_limit):
 
     cli = helpers.get_new_client()
     queues = []
     for queue_name in helpers.queue_names:
         queues.append(cli.queue(queue_name))
 
-    gevent.joinall([
-        gevent.spawn(claim_delete,
-                     queues, stats, test_duration, ttl, grace, limit)
+    if pop_limit:
+        workers = [gevent.spawn(pop, queues, stats, test_duration, pop_limit)
+                   for _ in range(num_workers)]
+    else:
+        workers = [gevent.spawn(claim_delete, queues, stats, test_duration,
+                                ttl, grace, limit)
+                   for _ in range(num_workers)]
 
-        for _ in range(num_workers)
-    ])
+    gevent.joinall(workers)
 
 
 def crunch(stats):
     total_requests = 0
     claim_total_elapsed = 0.0
     delete_total_elapsed = 0.0
+    pop_total_elapsed = 0.0
     claim_total_requests = 0
     delete_total_requests = 0
+    pop_total_requests = 0
+    popped_messages = 0
 
     while not stats.empty():
         entry = stats.get_nowait()
         total_requests += entry['total_requests']
-        claim_total_elapsed += entry['claim_total_elapsed']
-        delete_total_elapsed += entry['delete_total_elapsed']
-        claim_total_requests += entry['claim_total_requests']
-        delete_total_requests += entry['delete_total_requests']
+        claim_total_elapsed += entry.get('claim_total_elapsed', 0)
+        delete_total_elapsed += entry.get('delete_total_elapsed', 0)
+        pop_total_elapsed += entry.get('pop_total_elapsed', 0)
+        claim_total_requests += entry.get('claim_total_requests', 0)
+        delete_total_requests += entry.get('delete_total_requests', 0)
+        pop_total_requests += entry.get('pop_total_requests', 0)
+        popped_messages += entry.get('popped_messages', 0)
 
     return (total_requests, claim_total_elapsed, delete_total_elapsed,
-            claim_total_requests, delete_total_requests)
+            pop_total_elapsed, claim_total_requests, delete_total_requests,
+            pop_total_requests, popped_messages)
 
 
 def run(upstream_queue):
@@ -138,16 +189,19 @@ def run(upstream_queue):
     successful_requests = 0
     claim_total_requests = 0
     delete_total_requests = 0
+    pop_total_requests = 0
+    popped_messages = 0
     throughput = 0
     claim_latency = 0
     delete_latency = 0
+    pop_latency = 0
 
     # Performance test
     if num_procs and num_workers:
         stats = mp.Queue()
         # TODO(TheSriram) : Make ttl and grace configurable
         args = (stats, num_workers, num_queues, CONF.time, CONF.server_url,
-                300, 200, CONF.messages_per_claim)
+                300, 200, CONF.messages_per_claim, CONF.messages_per_pop)
 
         procs = [mp.Process(target=load_generator, args=args)
                  for _ in range(num_procs)]
@@ -165,9 +219,11 @@ def run(upstream_queue):
             each_proc.join()
 
         (total_requests, claim_total_elapsed, delete_total_elapsed,
-         claim_total_requests, delete_total_requests) = crunch(stats)
+         pop_total_elapsed, claim_total_requests, delete_total_requests,
+         pop_total_requests, popped_messages) = crunch(stats)
 
-        successful_requests = claim_total_requests + delete_total_requests
+        successful_requests = (claim_total_requests + delete_total_requests +
+                               pop_total_requests)
         duration = time.time() - start
 
         # NOTE(kgriffs): Duration should never be zero
@@ -181,15 +237,20 @@ def run(upstream_queue):
             delete_latency = (1000 * delete_total_elapsed /
                               delete_total_requests)
 
+        if pop_total_requests:
+            pop_latency = 1000 * pop_total_elapsed / pop_total_requests
+
     upstream_queue.put({
         'consumer': {
             'duration_sec': duration,
             'total_reqs': total_requests,
             'claim_total_requests': claim_total_requests,
+            'pop_total_requests': pop_total_requests,
             'successful_reqs': successful_requests,
-            'messages_processed': delete_total_requests,
+            'messages_processed': delete_total_requests + popped_messages,
             'reqs_per_sec': throughput,
             'ms_per_claim': claim_latency,
             'ms_per_delete': delete_latency,
+            'ms_per_pop': pop_latency,
         }
     })
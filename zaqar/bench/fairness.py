@@ -0,0 +1,215 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import division
+from __future__ import print_function
+
+import json
+import sys
+import time
+import uuid
+
+from gevent import monkey as curious_george
+curious_george.patch_all(thread=False, select=False)
+import gevent
+from gevent import event
+from oslo_config import cfg
+import websocket
+
+from zaqar.bench import config
+
+CONF = config.conf
+_CLI_OPTIONS = (
+    cfg.StrOpt('websocket_url', short='w', default='ws://localhost:9000/',
+               help='URL of the Zaqar WebSocket server'),
+    cfg.IntOpt('connections', short='wc', default=1000,
+               help='Number of concurrent WebSocket connections'),
+    cfg.IntOpt('requests_per_connection', short='rno', default=10,
+               help=('Number of requests each connection sends, one at '
+                     'a time')),
+    cfg.IntOpt('slow_connections', short='sno', default=1,
+               help=('Number of connections claiming messages instead of '
+                     'listing them, to load the server with slower '
+                     'storage calls')),
+)
+CONF.register_cli_opts(_CLI_OPTIONS)
+
+CLAIM_LIMIT = 20
+
+
+def _percentile(values, percent):
+    """Returns the given percentile of a sorted list of values."""
+
+    index = int(round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def _request(action, queue_name, project_id, client_id, **body):
+    body['queue_name'] = queue_name
+
+    return json.dumps({
+        'action': action,
+        'body': body,
+        'headers': {'Client-ID': client_id, 'X-Project-ID': project_id},
+    })
+
+
+def seed(queue_name, project_id, num_claims):
+    """Posts enough messages for the given number of claims to find."""
+
+    ws = websocket.create_connection(CONF.websocket_url)
+    client_id = str(uuid.uuid4())
+
+    try:
+        for _ in range(num_claims):
+            messages = [{'ttl': 300, 'body': {'seq': i}}
+                        for i in range(CLAIM_LIMIT)]
+            ws.send(_request('message_post', queue_name, project_id,
+                             client_id, messages=messages))
+            ws.recv()
+    finally:
+        ws.close()
+
+
+def connection(opened, start, action, queue_name, project_id,
+               num_requests):
+    """Connection Worker
+
+    The connection opens a WebSocket and, once every other connection is
+    open, sends its requests one after another. It returns the latency of
+    each successful request, in seconds.
+    """
+
+    latencies = []
+
+    try:
+        ws = websocket.create_connection(CONF.websocket_url)
+    except Exception as ex:
+        sys.stderr.write("Could not connect: {0}\n".format(ex))
+        return latencies
+    finally:
+        opened.append(action)
+
+    body = {}
+    if action == 'claim_create':
+        body = {'ttl': 60, 'grace': 60, 'limit': CLAIM_LIMIT}
+
+    request = _request(action, queue_name, project_id, str(uuid.uuid4()),
+                       **body)
+
+    start.wait()
+
+    try:
+        for _ in range(num_requests):
+            begin = time.time()
+            ws.send(request)
+            response = json.loads(ws.recv())
+            elapsed = time.time() - begin
+
+            if response['headers']['status'] < 400:
+                latencies.append(elapsed)
+            else:
+                sys.stderr.write("Request failed: {0}\n".format(
+                                 response['body']))
+
+    except Exception as ex:
+        sys.stderr.write("Connection failed: {0}\n".format(ex))
+
+    finally:
+        ws.close()
+
+    return latencies
+
+
+def crunch(results):
+    """Computes the latency and fairness statistics of the connections.
+
+    Fairness is measured on the mean latency of each connection, with
+    Jain's index: 1.0 when every connection waits as long as the others,
+    down to 1/n when a single connection gets all the delay.
+    """
+
+    means = [sum(r) / len(r) for r in results if r]
+    latencies = sorted(latency for r in results for latency in r)
+
+    if not latencies:
+        return {'successful_reqs': 0}
+
+    total = sum(latencies)
+
+    return {
+        'connections': len(means),
+        'successful_reqs': len(latencies),
+        'ms_per_req': 1000 * total / len(latencies),
+        'ms_p50': 1000 * _percentile(latencies, 50),
+        'ms_p99': 1000 * _percentile(latencies, 99),
+        'ms_max': 1000 * latencies[-1],
+        'ms_slowest_connection': 1000 * max(means),
+        'ms_fastest_connection': 1000 * min(means),
+        'fairness_index': (sum(means) ** 2 /
+                           (len(means) * sum(m ** 2 for m in means))),
+    }
+
+
+def main():
+    CONF(project='zaqar', prog='zaqar-benchmark')
+
+    num_conns = CONF.connections
+    num_slow = min(CONF.slow_connections, num_conns)
+    queue_name = CONF.queue_prefix + '-websocket'
+    project_id = str(uuid.uuid4())
+
+    if num_slow:
+        seed(queue_name, project_id,
+             num_slow * CONF.requests_per_connection)
+
+    if CONF.debug:
+        print('Opening {0} connections to {1}...'.format(
+              num_conns, CONF.websocket_url))
+
+    opened = []
+    start = event.Event()
+    workers = [
+        gevent.spawn(connection, opened, start,
+                     'claim_create' if i < num_slow else 'message_list',
+                     queue_name, project_id, CONF.requests_per_connection)
+        for i in range(num_conns)
+    ]
+
+    # NOTE: Let every connection open its socket before any of them
+    # sends a request, so that all the requests compete for the server
+    # at the same time.
+    while len(opened) < num_conns:
+        gevent.sleep(0.1)
+
+    begin = time.time()
+    start.set()
+    gevent.joinall(workers)
+    duration = time.time() - begin
+
+    stats = crunch([w.value or [] for w in workers])
+    stats['duration_sec'] = duration
+
+    if CONF.debug:
+        print()
+        values = sorted(stats.items(), key=lambda v: v[0])
+        print('\n'.join('{0}: {1:.3f}'.format(*v) for v in values))
+
+    else:
+        stats['params'] = {
+            'connections': num_conns,
+            'slow_connections': num_slow,
+            'requests_per_connection': CONF.requests_per_connection,
+        }
+
+        print(json.dumps(stats))
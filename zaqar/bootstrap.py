@@ -126,4 +126,16 @@ class Bootstrap(object):
             raise errors.InvalidDriver(exc)
 
     def run(self):
-        self.transport.listen()
+        transport_name = self.driver_conf.transport
+
+        try:
+            mgr = driver.DriverManager('zaqar.transport', transport_name)
+        except RuntimeError as exc:
+            LOG.exception(exc)
+            raise errors.InvalidDriver(exc)
+
+        # NOTE: Worker processes are forked before the transport and the
+        # storage it relies on are loaded, so that they don't share any
+        # connection or thread with the master process.
+        if not mgr.driver.prefork(self.conf, lambda: self.transport):
+            self.transport.listen()
@@ -11,25 +11,135 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
+import time
+
+import futurist
 from oslo_config import cfg
 from oslo_log import log
 
 from zaqar import bootstrap
 from zaqar.common import cli
+from zaqar.common import configs
+from zaqar.storage import pooling
 
 LOG = log.getLogger(__name__)
 
+_CLI_OPTIONS = (
+    cfg.BoolOpt('daemon', default=False,
+                help=('Keep running and collect garbage periodically, as '
+                      'configured in the [gc] section, instead of running '
+                      'only once.')),
+)
+
+
+class Collector(object):
+    """Periodically collects the garbage of every storage pool.
+
+    :param conf: Configuration from which to read the [gc] options
+    :param server: Bootstrap instance providing the storage drivers
+    """
+
+    def __init__(self, conf, server):
+        self._conf = conf
+        self._gc_conf = conf[configs._GC_GROUP]
+        self._server = server
+        self._catalog = None
+
+        self._executor = futurist.ThreadPoolExecutor(
+            max_workers=self._gc_conf.max_workers)
+
+    def _get_drivers(self):
+        """Returns a list of (pool name, storage driver) tuples."""
+
+        if not self._conf.pooling:
+            return [(None, self._server.storage)]
+
+        # NOTE: Pools may be added or removed while the daemon runs,
+        # so they are listed again on every run. The catalog keeps the
+        # drivers loaded in between.
+        if self._catalog is None:
+            self._catalog = pooling.Catalog(self._conf, self._server.cache,
+                                            self._server.control)
+
+        cursor = self._catalog._pools_ctrl.list(limit=0)
+        return [(pool['name'], self._catalog.get_driver(pool['name']))
+                for pool in next(cursor)]
+
+    def _collect_pool(self, name, driver):
+        started = time.time()
+
+        try:
+            # NOTE: Drivers that don't report what they removed
+            # return None.
+            removed = driver.gc() or 0
+        except Exception:
+            LOG.exception(u'Garbage collection failed for pool %s', name)
+            return 0
+
+        LOG.info(u'Garbage collection of pool %(pool)s removed %(removed)d '
+                 u'messages in %(duration).3f seconds.',
+                 {'pool': name, 'removed': removed,
+                  'duration': time.time() - started})
+        return removed
+
+    def collect(self):
+        """Collect the garbage of every pool once.
+
+        :returns: Total number of messages removed
+        """
+
+        started = time.time()
+        drivers = self._get_drivers()
+
+        futures = [self._executor.submit(self._collect_pool, name, driver)
+                   for name, driver in drivers]
+        removed = sum(future.result() for future in futures)
+
+        LOG.info(u'Garbage collection run over %(pools)d pools removed '
+                 u'%(removed)d messages in %(duration).3f seconds.',
+                 {'pools': len(drivers), 'removed': removed,
+                  'duration': time.time() - started})
+        return removed
+
+    def next_delay(self):
+        """Returns the number of seconds to wait before the next run."""
+
+        return self._gc_conf.interval + random.uniform(0,
+                                                       self._gc_conf.jitter)
+
+    def run(self):
+        """Collect garbage until the process is stopped."""
+
+        try:
+            while True:
+                try:
+                    self.collect()
+                except Exception:
+                    # NOTE: E.g. the pools catalog could not be read;
+                    # try again on the next run.
+                    LOG.exception(u'Garbage collection run failed')
+
+                time.sleep(self.next_delay())
+        finally:
+            self._executor.shutdown()
+
 
-# In this first approach it's the responsibility of the operator
-# to call the garbage collector manually. Using crontab or a similar
-# tool is advised.
 @cli.runnable
 def run():
     # Use the global CONF instance
     conf = cfg.CONF
+    conf.register_cli_opts(_CLI_OPTIONS)
     conf(project='zaqar', prog='zaqar-gc')
 
     server = bootstrap.Bootstrap(conf)
 
-    LOG.debug(u'Calling the garbage collector')
-    server.storage.gc()
+    # NOTE: Without --daemon, it's the responsibility of the operator
+    # to call the garbage collector periodically. Using crontab or a
+    # similar tool is advised.
+    if conf.daemon:
+        LOG.info(u'Starting the garbage collector daemon')
+        Collector(conf, server).run()
+    else:
+        LOG.debug(u'Calling the garbage collector')
+        server.storage.gc()
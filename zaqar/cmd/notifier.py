@@ -0,0 +1,202 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import futurist
+from oslo_config import cfg
+from oslo_log import log
+from six.moves import urllib_parse
+
+from zaqar import bootstrap
+from zaqar.common import cli
+from zaqar.notification import tasks
+from zaqar.notification.tasks import webhook
+from zaqar.storage import pooling
+
+LOG = log.getLogger(__name__)
+
+
+class Notifier(object):
+    """Delivers the notifications recorded in the outbox.
+
+    Entries are leased from the outbox in batches, and the entries of a
+    batch are delivered in parallel, by at most `outbox_workers`
+    threads. A delivery that fails is deferred in the outbox as per the
+    retry policy of the subscription, so that neither the API servers
+    nor this process hold undelivered notifications in memory.
+
+    Since an entry is only removed once delivered, a notification may be
+    delivered more than once, e.g. when this process dies in between.
+
+    With pooling, notifications are recorded in the outbox of the pool
+    of their queue, and the outbox of every pool is drained.
+
+    :param conf: Configuration from which to read the [notification]
+        options
+    :param server: Bootstrap instance providing the storage drivers
+    """
+
+    def __init__(self, conf, server):
+        self._conf = conf
+        self._notification_conf = conf.notification
+        self._server = server
+        self._catalog = None
+        self._last_report = 0
+
+        self._executor = futurist.ThreadPoolExecutor(
+            max_workers=self._notification_conf.outbox_workers)
+
+    def _get_outboxes(self):
+        """Returns a list of (pool name, outbox controller) tuples."""
+
+        if not self._conf.pooling:
+            outbox = self._server.storage.outbox_controller
+            return [] if outbox is None else [(None, outbox)]
+
+        # NOTE: Pools may be added or removed while the daemon runs,
+        # so they are listed again on every batch. The catalog keeps
+        # the drivers loaded in between.
+        if self._catalog is None:
+            self._catalog = pooling.Catalog(self._conf, self._server.cache,
+                                            self._server.control)
+
+        outboxes = []
+        cursor = self._catalog._pools_ctrl.list(limit=0)
+        for pool in next(cursor):
+            # NOTE: Pools whose driver has no outbox, e.g. swift, keep
+            # delivering from the API servers.
+            outbox = self._catalog.get_driver(pool['name']).outbox_controller
+            if outbox is not None:
+                outboxes.append((pool['name'], outbox))
+        return outboxes
+
+    def _deliver(self, outbox, entry):
+        subscription = entry['subscription']
+        s_type = urllib_parse.urlparse(subscription['subscriber']).scheme
+
+        try:
+            task = tasks.get_task(s_type)
+            # NOTE: Tasks which can't report whether they succeeded,
+            # e.g. mailto, are given a single attempt.
+            if not hasattr(task, 'deliver'):
+                task.execute(subscription, entry['messages'],
+                             conf=self._conf,
+                             queue_retry_policy=entry['retry_policy'])
+                outbox.delete(entry['id'])
+                return
+
+            delivered = task.deliver(subscription, entry['messages'],
+                                     conf=self._conf)
+        except Exception:
+            LOG.exception(u'Delivery of notification %s failed', entry['id'])
+            delivered = False
+
+        if delivered:
+            outbox.delete(entry['id'])
+            return
+
+        retry_policy = webhook._get_retry_policy(
+            subscription['options'].get('_retry_policy', {}),
+            entry['retry_policy'])
+        delays = webhook._retry_delays(retry_policy)
+        for __ in range(entry['attempts']):
+            if next(delays, None) is None:
+                break
+        delay = next(delays, None)
+
+        if delay is None:
+            LOG.warning(u'Giving up on notifying %(subscriber)s after '
+                        u'%(attempts)d attempts',
+                        {'subscriber': subscription['subscriber'],
+                         'attempts': entry['attempts'] + 1})
+            outbox.delete(entry['id'])
+        else:
+            outbox.defer(entry['id'], delay)
+
+    def drain(self):
+        """Delivers one batch of due notifications from every outbox.
+
+        :returns: Number of entries leased
+        """
+
+        conf = self._notification_conf
+        futures = []
+        for name, outbox in self._get_outboxes():
+            try:
+                entries = outbox.lease(conf.outbox_batch_size,
+                                       conf.outbox_lease)
+            except Exception:
+                LOG.exception(u'Leasing notifications from pool %s failed',
+                              name)
+                continue
+
+            futures.extend(self._executor.submit(self._deliver, outbox,
+                                                 entry)
+                           for entry in entries)
+
+        for future in futures:
+            future.result()
+
+        return len(futures)
+
+    def report(self):
+        """Logs the backlog of the outboxes, at most once per interval."""
+
+        now = time.time()
+        interval = self._notification_conf.outbox_report_interval
+        if now - self._last_report < interval:
+            return
+
+        self._last_report = now
+        LOG.info(u'%d notifications are waiting to be delivered.',
+                 sum(outbox.depth() for name, outbox in self._get_outboxes()))
+
+    def run(self):
+        """Deliver notifications until the process is stopped."""
+
+        conf = self._notification_conf
+        try:
+            while True:
+                try:
+                    leased = self.drain()
+                    self.report()
+                except Exception:
+                    # NOTE: E.g. the storage is unavailable; try again
+                    # after a while.
+                    LOG.exception(u'Draining the notification outbox failed')
+                    leased = 0
+
+                # NOTE: A full batch from any outbox means there is
+                # likely more to deliver right away.
+                if leased < conf.outbox_batch_size:
+                    time.sleep(conf.outbox_poll_interval)
+        finally:
+            self._executor.shutdown()
+
+
+@cli.runnable
+def run():
+    # Use the global CONF instance
+    conf = cfg.CONF
+    conf(project='zaqar', prog='zaqar-notifier')
+
+    server = bootstrap.Bootstrap(conf)
+
+    if not conf.pooling and server.storage.outbox_controller is None:
+        LOG.error(u'The message store does not support the notification '
+                  u'outbox.')
+        return
+
+    LOG.info(u'Starting the notifier daemon')
+    Notifier(conf, server).run()
@@ -13,15 +13,115 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import numbers
+
 import jsonschema
 from jsonschema import validators
 from oslo_log import log
+import six
 
 from zaqar.common import errors
 from zaqar.i18n import _
 
 LOG = log.getLogger(__name__)
 
+_TYPES = {
+    'array': lambda value: isinstance(value, list),
+    'boolean': lambda value: isinstance(value, bool),
+    'integer': lambda value: (isinstance(value, six.integer_types) and
+                              not isinstance(value, bool)),
+    'null': lambda value: value is None,
+    'number': lambda value: (isinstance(value, numbers.Number) and
+                             not isinstance(value, bool)),
+    'object': lambda value: isinstance(value, dict),
+    'string': lambda value: isinstance(value, six.string_types),
+}
+
+
+def _compile_type(value):
+    if isinstance(value, six.string_types):
+        value = [value]
+    try:
+        types = tuple(_TYPES[name] for name in value)
+    except KeyError:
+        return None
+    if len(types) == 1:
+        return types[0]
+    return lambda instance: any(is_type(instance) for is_type in types)
+
+
+def _compile_properties(value):
+    properties = []
+    for name, subschema in value.items():
+        check = _compile(subschema)
+        if check is None:
+            return None
+        properties.append((name, check))
+
+    def check_properties(instance):
+        if not isinstance(instance, dict):
+            return True
+        for name, check in properties:
+            if name in instance and not check(instance[name]):
+                return False
+        return True
+    return check_properties
+
+
+def _compile_required(value):
+    return lambda instance: (not isinstance(instance, dict) or
+                             all(name in instance for name in value))
+
+
+def _compile_enum(value):
+    return lambda instance: instance in value
+
+
+def _compile_minimum(value):
+    return lambda instance: (not _TYPES['number'](instance) or
+                             instance >= value)
+
+
+_KEYWORDS = {
+    'type': _compile_type,
+    'properties': _compile_properties,
+    'required': _compile_required,
+    'enum': _compile_enum,
+    'minimum': _compile_minimum,
+}
+
+
+def _compile(schema):
+    """Compiles a schema into a plain function checking instances.
+
+    Only the keywords used by the request schemas are supported, the
+    function follows the Draft4 semantics of jsonschema for them. Keywords
+    that are not part of Draft4, like `admin`, are ignored as jsonschema
+    does.
+
+    :returns: a function returning True if an instance is valid and False
+        otherwise, or None if the schema uses an unsupported keyword.
+    """
+    if 'exclusiveMinimum' in schema:
+        return None
+
+    checks = []
+    for keyword, value in schema.items():
+        if keyword in _KEYWORDS:
+            check = _KEYWORDS[keyword](value)
+            if check is None:
+                return None
+            checks.append(check)
+        elif keyword in validators.Draft4Validator.VALIDATORS:
+            return None
+
+    def check_all(instance):
+        for check in checks:
+            if not check(instance):
+                return False
+        return True
+    return check_all
+
 
 class Api(object):
 
@@ -65,12 +165,21 @@ class Api(object):
         :raises InvalidAction: if the action does not exist
         """
 
-        if action not in self.validators:
+        try:
+            validator, check = self.validators[action]
+        except KeyError:
             schema = self.get_schema(action)
-            self.validators[action] = validators.Draft4Validator(schema)
+            validator = validators.Draft4Validator(schema)
+            check = _compile(schema)
+            self.validators[action] = validator, check
+
+        # NOTE: The compiled check is only a fast path, jsonschema still
+        # runs on invalid bodies so the failure gets logged.
+        if check is not None and check(body):
+            return True
 
         try:
-            self.validators[action].validate(body)
+            validator.validate(body)
         except jsonschema.ValidationError as ex:
             LOG.debug('Schema validation failed. %s.', str(ex))
             return False
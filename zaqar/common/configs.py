@@ -61,9 +61,67 @@ _SIGNED_URL_GROUP = 'signed_url'
 _NOTIFICATION_OPTIONS = (
     cfg.StrOpt('smtp_command', default='/usr/sbin/sendmail -t -oi',
                help=('The command of smtp to send email. The format is '
-                     '"command_name arg1 arg2".')),
+                     '"command_name arg1 arg2". It is only used when '
+                     'smtp_host is not set.')),
+    cfg.HostAddressOpt('smtp_host',
+                       help='The SMTP server to send emails to. When set, '
+                            'emails are sent over pooled SMTP connections '
+                            'instead of running smtp_command for each '
+                            'email.'),
+    cfg.PortOpt('smtp_port', default=25,
+                help='The port of the SMTP server.'),
+    cfg.BoolOpt('smtp_starttls', default=False,
+                help='Whether to upgrade the connections to the SMTP server '
+                     'with STARTTLS.'),
+    cfg.StrOpt('smtp_username',
+               help='The user name to log in to the SMTP server with. '
+                    'Connections are not authenticated when it is not '
+                    'set.'),
+    cfg.StrOpt('smtp_password', secret=True,
+               help='The password to log in to the SMTP server with.'),
+    cfg.FloatOpt('smtp_timeout', default=10, min=1,
+                 help='The number of seconds to wait for the SMTP server to '
+                      'respond.'),
+    cfg.IntOpt('smtp_pool_size', default=5, min=1,
+               help='The max amount of idle connections to the SMTP server '
+                    'kept open for later emails.'),
     cfg.IntOpt('max_notifier_workers', default=10,
                help='The max amount of the notification workers.'),
+    cfg.IntOpt('webhook_max_workers', default=10, min=1,
+               help='The max amount of threads sending webhook '
+                    'notifications. They are shared by all the queues, and '
+                    'are never blocked while waiting to retry a request.'),
+    cfg.IntOpt('webhook_max_subscriber_requests', default=2, min=1,
+               help='The max amount of concurrent webhook notification '
+                    'requests to the same subscriber. Further notifications '
+                    'to this subscriber are queued.'),
+    cfg.FloatOpt('webhook_timeout', default=10, min=1,
+                 help='The number of seconds to wait for a webhook '
+                      'subscriber to respond before the request is '
+                      'considered failed and retried.'),
+    cfg.BoolOpt('use_outbox', default=False,
+                help='Whether notifications are recorded in an outbox '
+                     'kept in the message store, and delivered by '
+                     'zaqar-notifier, instead of being delivered from the '
+                     'memory of the API servers. This requires a message '
+                     'store supporting it, i.e. mongodb or redis.'),
+    cfg.IntOpt('outbox_workers', default=10, min=1,
+               help='The max amount of notifications delivered in '
+                    'parallel by zaqar-notifier.'),
+    cfg.IntOpt('outbox_batch_size', default=100, min=1,
+               help='The max amount of notifications leased from the '
+                    'outbox at once by zaqar-notifier.'),
+    cfg.IntOpt('outbox_lease', default=60, min=1,
+               help='The number of seconds after which a notification '
+                    'leased by zaqar-notifier, but neither delivered nor '
+                    'deferred, is delivered again. It should be larger '
+                    'than the time needed to deliver a batch.'),
+    cfg.FloatOpt('outbox_poll_interval', default=1, min=0,
+                 help='The number of seconds zaqar-notifier waits before '
+                      'polling the outbox again once it is drained.'),
+    cfg.IntOpt('outbox_report_interval', default=60, min=1,
+               help='The number of seconds between two reports of the '
+                    'outbox backlog in the logs of zaqar-notifier.'),
     cfg.BoolOpt('require_confirmation', default=False,
                 help='Whether the http/https/email subscription need to be '
                      'confirmed before notification.'),
@@ -118,9 +176,27 @@ _PROFILER_OPTIONS = [
 _PROFILER_GROUP = "profiler"
 
 
+_GC_OPTIONS = (
+    cfg.IntOpt('interval', default=60, min=1,
+               help=('Number of seconds between two garbage collection '
+                     'runs when zaqar-gc is started with --daemon.')),
+    cfg.IntOpt('jitter', default=10, min=0,
+               help=('Maximum number of seconds randomly added to the '
+                     'interval between two garbage collection runs, so '
+                     'that several zaqar-gc daemons do not hit the '
+                     'storage backends at the same moment.')),
+    cfg.IntOpt('max_workers', default=4, min=1,
+               help=('Maximum number of pools whose garbage is collected '
+                     'in parallel when pooling is enabled.')),
+)
+
+_GC_GROUP = 'gc'
+
+
 def _config_options():
     return [(None, _GENERAL_OPTIONS),
             (_DRIVER_GROUP, _DRIVER_OPTIONS),
             (_SIGNED_URL_GROUP, _SIGNED_URL_OPTIONS),
             (_NOTIFICATION_GROUP, _NOTIFICATION_OPTIONS),
-            (_PROFILER_GROUP, _PROFILER_OPTIONS)]
+            (_PROFILER_GROUP, _PROFILER_OPTIONS),
+            (_GC_GROUP, _GC_OPTIONS)]
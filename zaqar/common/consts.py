@@ -64,6 +64,7 @@ QUEUE_OPS = (
     QUEUE_GET,
     QUEUE_DELETE,
     QUEUE_GET_STATS,
+    QUEUE_GET_STATS_MANY,
     QUEUE_PURGE
 ) = (
     'queue_create',
@@ -71,6 +72,7 @@ QUEUE_OPS = (
     'queue_get',
     'queue_delete',
     'queue_get_stats',
+    'queue_get_stats_many',
     'queue_purge'
 )
 
@@ -86,6 +88,16 @@ CLAIM_OPS = (
     'claim_delete',
 )
 
+CLAIM_PUSH_OPS = (
+    CLAIM_SUBSCRIBE,
+    CLAIM_CREDIT,
+    CLAIM_UNSUBSCRIBE,
+) = (
+    'claim_subscribe',
+    'claim_credit',
+    'claim_unsubscribe',
+)
+
 POOL_OPS = (
     POOL_CREATE,
     POOL_LIST,
@@ -131,3 +143,8 @@ RETRY_OPS = (
     3,
     5,
 )
+
+# NOTE: Option of the subscriptions created by a transport for its own
+# connections, holding the URL to which the notifications of several of
+# them can be sent at once.
+SUBSCRIPTION_BATCH_URL = '_batch_url'
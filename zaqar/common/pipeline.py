@@ -63,14 +63,26 @@ class Pipeline(object):
         :returns: A callable to consume the pipeline.
         """
 
+        # NOTE: Stages are resolved once, here, rather than on every
+        # call, so that consuming the pipeline only calls the stages
+        # that implement `method`.
+        targets = []
+        for stage in self._pipeline:
+            try:
+                targets.append(getattr(stage, method))
+            except AttributeError:
+                sstage = six.text_type(stage)
+                msgtmpl = _(u"Stage %(stage)s does not "
+                            "implement %(method)s")
+                LOG.debug(msgtmpl, {'stage': sstage, 'method': method})
+
         def consumer(*args, **kwargs):
             """Consumes the pipeline for `method`
 
-            This function walks through the pipeline and calls
-            `method` for each of the items in the pipeline. A
-            warning will be logged for each stage not implementing
-            `method` and an Attribute error will be raised if
-            none of the stages do.
+            This function walks through the stages implementing
+            `method` and calls it for each of them, until one
+            returns something. An AttributeError will be raised if
+            none of the stages implement `method`.
 
             :param args: Positional arguments to pass to the call.
             :param kwargs: Keyword arguments to pass to the call.
@@ -81,24 +93,14 @@ class Pipeline(object):
             # the requested method exists in at least
             # one of the stages, otherwise AttributeError
             # will be raised.
-            target = None
-            result = None
-
-            for stage in self._pipeline:
-                try:
-                    target = getattr(stage, method)
-                except AttributeError:
-                    sstage = six.text_type(stage)
-                    msgtmpl = _(u"Stage %(stage)s does not "
-                                "implement %(method)s")
-                    LOG.debug(msgtmpl, {'stage': sstage, 'method': method})
-                    continue
-
-                tmp = target(*args, **kwargs)
+            if not targets:
+                msg = _(u'Method %s not found in any of '
+                        'the registered stages') % method
+                LOG.error(msg)
+                raise AttributeError(msg)
 
-                # NOTE(flaper87): preserve the last, not None, result
-                if tmp is not None:
-                    result = tmp
+            for target in targets:
+                result = target(*args, **kwargs)
 
                 # NOTE(flaper87): Will keep going forward
                 # through the stageline unless the call returns
@@ -106,10 +108,4 @@ class Pipeline(object):
                 if result is not None:
                     return result
 
-            if target is None:
-                msg = _(u'Method %s not found in any of '
-                        'the registered stages') % method
-                LOG.error(msg)
-                raise AttributeError(msg)
-
         yield consumer
@@ -83,6 +83,17 @@ rules = [
             }
         ]
     ),
+    policy.DocumentedRuleDefault(
+        name=QUEUES % 'stats_all',
+        check_str=base.UNPROTECTED,
+        description='Get statistics about several message queues.',
+        operations=[
+            {
+                'path': '/v2/stats',
+                'method': 'GET'
+            }
+        ]
+    ),
     policy.DocumentedRuleDefault(
         name=QUEUES % 'share',
         check_str=base.UNPROTECTED,
@@ -0,0 +1,192 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Master process of the pre-forking transports.
+
+The master forks the worker processes before anything else is loaded, so
+that the connections and threads of the storage drivers are created in
+the workers and never shared across a fork. It restarts workers that die
+unexpectedly, giving them the same index. On SIGHUP, if enabled, it
+starts a new generation of workers and stops the old ones. On SIGTERM or
+SIGINT, all the workers are stopped, and those still running after the
+shutdown timeout are killed.
+"""
+
+import errno
+import os
+import signal
+import socket
+import time
+
+from oslo_log import log as logging
+from oslo_utils import netutils
+
+LOG = logging.getLogger(__name__)
+
+# NOTE: Interval, in seconds, at which the master process checks on
+# its workers.
+_POLL_INTERVAL = 0.5
+
+
+def listen(host, port, reuse_port=False):
+    """Create a listening socket.
+
+    :param reuse_port: Set SO_REUSEPORT on the socket, so that several
+        sockets can be bound to the same address.
+    """
+
+    family = socket.AF_INET6 if netutils.is_valid_ipv6(host) else (
+        socket.AF_INET)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    return sock
+
+
+class Master(object):
+    """Runs a number of worker processes and keeps them running.
+
+    :param serve: Function running a worker until it is stopped by
+        SIGTERM, called in the worker process with the index of the
+        worker, from 0 to `workers` - 1
+    :param workers: Number of worker processes
+    :param name: Name of the workers in log messages
+    :param shutdown_timeout: Number of seconds workers are given to exit
+        once asked to, before being killed
+    :param reload: Function called on SIGHUP, before a new generation of
+        workers replaces the running one. SIGHUP is not handled if None.
+    """
+
+    def __init__(self, serve, workers, name, shutdown_timeout=30,
+                 reload=None):
+        self.serve = serve
+        self.workers = workers
+        self.name = name
+        self.shutdown_timeout = shutdown_timeout
+        self.reload = reload
+
+        # NOTE: Maps the PID of each worker to its generation and index,
+        # so that workers replaced on reload are not restarted when they
+        # exit.
+        self._children = {}
+        self._generation = 0
+        self._stopping = False
+        self._reloading = False
+
+    def _spawn_worker(self, index):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (self._generation, index)
+            return
+
+        # NOTE: In the worker process; never return to the caller.
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            self.serve(index)
+        except Exception:
+            LOG.exception(u'%(name)s worker %(pid)d failed',
+                          {'name': self.name, 'pid': os.getpid()})
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _spawn_workers(self):
+        for index in range(self.workers):
+            self._spawn_worker(index)
+
+    def _reap(self):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno == errno.ECHILD:
+                    self._children.clear()
+                    break
+                raise
+
+            if not pid:
+                break
+
+            generation, index = self._children.pop(pid, (None, None))
+            if generation == self._generation and not self._stopping:
+                LOG.warning(u'%(name)s worker %(pid)d exited with status '
+                            u'%(status)d, starting a new one',
+                            {'name': self.name, 'pid': pid,
+                             'status': status})
+                self._spawn_worker(index)
+
+    def _signal_workers(self, signum, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except OSError as ex:
+                if ex.errno != errno.ESRCH:
+                    raise
+
+    def _replace_workers(self):
+        old_pids = list(self._children)
+        self.reload()
+
+        self._generation += 1
+        self._spawn_workers()
+        self._signal_workers(signal.SIGTERM, old_pids)
+        LOG.info(u'Reloaded %(count)d %(name)s workers',
+                 {'count': self.workers, 'name': self.name})
+
+    def run(self):
+        """Serve until stopped by a signal."""
+
+        def stop(signum, frame):
+            self._stopping = True
+
+        def reload(signum, frame):
+            self._reloading = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        if self.reload is not None:
+            signal.signal(signal.SIGHUP, reload)
+
+        self._spawn_workers()
+        LOG.info(u'Started %(count)d %(name)s workers',
+                 {'count': self.workers, 'name': self.name})
+
+        while not self._stopping:
+            self._reap()
+
+            if self._reloading:
+                self._reloading = False
+                self._replace_workers()
+
+            time.sleep(_POLL_INTERVAL)
+
+        self._signal_workers(signal.SIGTERM, list(self._children))
+
+        deadline = time.time() + self.shutdown_timeout
+        while self._children and time.time() < deadline:
+            self._reap()
+            time.sleep(_POLL_INTERVAL)
+
+        if self._children:
+            LOG.warning(u'Killing %(count)d %(name)s workers that did not '
+                        u'stop in time',
+                        {'count': len(self._children), 'name': self.name})
+            self._signal_workers(signal.SIGKILL, list(self._children))
@@ -13,15 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import enum
-from stevedore import driver
 
 import futurist
 from oslo_log import log as logging
 from six.moves import urllib_parse
 
 from zaqar.common import auth
+from zaqar.common import consts
+from zaqar.common import decorators
 from zaqar.common import urls
+from zaqar.notification import subscribers
+from zaqar.notification import tasks
 from zaqar.storage import pooling
 
 LOG = logging.getLogger(__name__)
@@ -46,39 +50,77 @@ class NotifierDriver(object):
         self.executor = futurist.ThreadPoolExecutor(max_workers=max_workers)
         self.require_confirmation = kwargs.get('require_confirmation', False)
         self.queue_controller = kwargs.get('queue_controller')
+        self._cache = kwargs.get('cache')
+        self.outbox_controller = kwargs.get('outbox_controller')
+
+    def _list_subscribers(self, queue_name, project=None):
+        results = []
+        marker = None
+        while True:
+            subscriptions = self.subscription_controller.list(
+                queue_name, project, marker=marker)
+            results.extend(next(subscriptions))
+            marker = next(subscriptions)
+            if not marker:
+                return results
+
+    @decorators.caches(subscribers.cache_key, subscribers.CACHE_TTL)
+    def _cached_subscribers(self, queue_name, project=None):
+        return self._list_subscribers(queue_name, project)
+
+    def _get_subscribers(self, queue_name, project=None):
+        """Returns all the subscriptions of a queue.
+
+        The result, including an empty one, is cached when the notifier
+        was given a cache, so that posting to a queue without any
+        subscriber does not hit the storage at all.
+        """
+        if self._cache is None:
+            return self._list_subscribers(queue_name, project)
+        return self._cached_subscribers(queue_name, project)
 
     def post(self, queue_name, messages, client_uuid, project=None):
         """Send messages to the subscribers."""
         if self.subscription_controller:
             if not isinstance(self.subscription_controller,
                               pooling.SubscriptionController):
-                marker = None
+                subscriptions = self._get_subscribers(queue_name, project)
+                if not subscriptions:
+                    return
+
                 queue_metadata = self.queue_controller.get(queue_name,
                                                            project)
                 retry_policy = queue_metadata.get('_retry_policy', {})
-                while True:
-                    subscribers = self.subscription_controller.list(
-                        queue_name, project, marker=marker)
-                    for sub in next(subscribers):
-                        LOG.debug("Notifying subscriber %r", (sub,))
-                        s_type = urllib_parse.urlparse(
-                            sub['subscriber']).scheme
-                        # If the subscriber doesn't contain 'confirmed', it
-                        # means that this kind of subscriber was created before
-                        # the confirm feature be introduced into Zaqar. We
-                        # should allow them be subscribed.
-                        if (self.require_confirmation and
-                                not sub.get('confirmed', True)):
-                            LOG.info('The subscriber %s is not '
-                                     'confirmed.', sub['subscriber'])
-                            continue
-                        for msg in messages:
-                            msg['Message_Type'] = MessageType.Notification.name
+                batches = collections.defaultdict(list)
+                for sub in subscriptions:
+                    LOG.debug("Notifying subscriber %r", (sub,))
+                    s_type = urllib_parse.urlparse(
+                        sub['subscriber']).scheme
+                    # If the subscriber doesn't contain 'confirmed', it
+                    # means that this kind of subscriber was created before
+                    # the confirm feature be introduced into Zaqar. We
+                    # should allow them be subscribed.
+                    if (self.require_confirmation and
+                            not sub.get('confirmed', True)):
+                        LOG.info('The subscriber %s is not '
+                                 'confirmed.', sub['subscriber'])
+                        continue
+                    for msg in messages:
+                        msg['Message_Type'] = MessageType.Notification.name
+                    batch_url = sub['options'].get(
+                        consts.SUBSCRIPTION_BATCH_URL)
+                    if self.outbox_controller is not None:
+                        self.outbox_controller.put(queue_name, sub, messages,
+                                                   project=project,
+                                                   retry_policy=retry_policy)
+                    elif batch_url:
+                        batches[batch_url].append(sub)
+                    else:
                         self._execute(s_type, sub, messages,
                                       retry_policy=retry_policy)
-                    marker = next(subscribers)
-                    if not marker:
-                        break
+                for batch_url, subs in batches.items():
+                    self._execute_batch(batch_url, subs, messages,
+                                        retry_policy=retry_policy)
         else:
             LOG.error('Failed to get subscription controller.')
 
@@ -149,8 +191,14 @@ class NotifierDriver(object):
             conf = data_driver.conf
         else:
             conf = conf
-        mgr = driver.DriverManager('zaqar.notification.tasks',
-                                   s_type,
-                                   invoke_on_load=True)
-        self.executor.submit(mgr.driver.execute, subscription, messages,
+        self.executor.submit(tasks.get_task(s_type).execute,
+                             subscription, messages,
+                             conf=conf, queue_retry_policy=retry_policy)
+
+    def _execute_batch(self, batch_url, subscriptions, messages,
+                       retry_policy=None):
+        conf = self.subscription_controller.driver.conf
+        s_type = urllib_parse.urlparse(batch_url).scheme
+        self.executor.submit(tasks.get_task(s_type).execute_batch,
+                             batch_url, subscriptions, messages,
                              conf=conf, queue_retry_policy=retry_policy)
@@ -0,0 +1,58 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Caching of the subscribers notified when messages are posted."""
+
+# NOTE: Subscribers are purged from the cache whenever one of the
+# subscriptions of the queue is created, updated, deleted or confirmed,
+# so the TTL only bounds how long an expired subscription may still be
+# notified, or how long a change made through another cache may go
+# unnoticed.
+CACHE_TTL = 30
+
+_CACHE_PREFIX = 'notification:subscribers:'
+
+
+def cache_key(queue, project=None):
+    # NOTE: Use string concatenation for performance, like the
+    # storage drivers do for their own cache keys.
+    return _CACHE_PREFIX + str(project) + '/' + queue
+
+
+class CachePurger(object):
+    """Subscription pipeline stage purging the cached subscribers.
+
+    Since the stage runs before the storage controller, a notifier that
+    lists the subscribers of the queue at the same time may cache them
+    again before the change is stored; CACHE_TTL bounds that window.
+
+    :param cache: cache in which the notifier stores the subscribers
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def _purge(self, queue, project):
+        self._cache.delete(cache_key(queue, project))
+
+    def create(self, queue, subscriber, ttl, options, project=None):
+        self._purge(queue, project)
+
+    def update(self, queue, subscription_id, project=None, **kwargs):
+        self._purge(queue, project)
+
+    def delete(self, queue, subscription_id, project=None):
+        self._purge(queue, project)
+
+    def confirm(self, queue, subscription_id, project=None, confirmed=True):
+        self._purge(queue, project)
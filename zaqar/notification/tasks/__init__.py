@@ -0,0 +1,42 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from stevedore import driver
+
+_tasks = {}
+_tasks_lock = threading.Lock()
+
+
+def get_task(s_type):
+    """Returns the notification task of a subscriber URL scheme.
+
+    Each task is loaded from the `zaqar.notification.tasks` entry points
+    and instantiated once, then shared by all the subscribers using the
+    same scheme, and by the threads delivering to them; tasks must
+    therefore be thread-safe.
+
+    :param s_type: URL scheme of the subscriber, e.g. `http`
+    :raises stevedore.exception.NoMatches: if no task handles the scheme
+    """
+    task = _tasks.get(s_type)
+    if task is None:
+        with _tasks_lock:
+            task = _tasks.get(s_type)
+            if task is None:
+                mgr = driver.DriverManager('zaqar.notification.tasks',
+                                           s_type,
+                                           invoke_on_load=True)
+                task = _tasks[s_type] = mgr.driver
+    return task
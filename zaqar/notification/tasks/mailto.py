@@ -15,10 +15,14 @@
 
 from email.mime import text
 import json
-from six.moves import urllib_parse
+import smtplib
+import socket
 import subprocess
+import threading
 
 from oslo_log import log as logging
+from oslo_utils import excutils
+from six.moves import urllib_parse
 
 from zaqar.i18n import _
 from zaqar.notification.notifier import MessageType
@@ -26,6 +30,124 @@ from zaqar.notification.notifier import MessageType
 LOG = logging.getLogger(__name__)
 
 
+class SMTPPool(object):
+    """Sends emails over a pool of reused SMTP connections.
+
+    Each batch of emails is sent over a single connection, which is
+    then kept open for the next batch, up to `size` idle connections.
+    Since the server may close an idle connection at any time, an email
+    failing because the connection was closed is sent once more over a
+    new connection.
+
+    :param host: host name of the SMTP server
+    :param port: port of the SMTP server
+    :param timeout: number of seconds to wait for the server to respond
+    :param size: max number of idle connections kept open
+    :param starttls: whether to upgrade connections with STARTTLS
+    :param username: user name to log in with, if any
+    :param password: password to log in with
+    """
+
+    def __init__(self, host, port, timeout, size, starttls=False,
+                 username=None, password=None):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._size = size
+        self._starttls = starttls
+        self._username = username
+        self._password = password
+
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _connect(self):
+        connection = smtplib.SMTP(self._host, self._port,
+                                  timeout=self._timeout)
+        try:
+            if self._starttls:
+                connection.starttls()
+            if self._username:
+                connection.login(self._username, self._password)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                connection.close()
+        return connection
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(connection)
+                return
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, socket.error):
+            connection.close()
+
+    def send(self, emails):
+        """Sends emails over a single connection.
+
+        :param emails: list of `email.message.Message`
+        """
+        connection = self._acquire()
+        try:
+            for msg in emails:
+                args = (msg['from'] or '', [msg['to']], msg.as_string())
+                try:
+                    connection.sendmail(*args)
+                except smtplib.SMTPServerDisconnected:
+                    connection.close()
+                    connection = self._connect()
+                    connection.sendmail(*args)
+                LOG.debug("Send mail successfully: %s", args[2])
+        except (smtplib.SMTPResponseException,
+                smtplib.SMTPRecipientsRefused):
+            # NOTE: The server refused the email, but the connection
+            # is still usable.
+            with excutils.save_and_reraise_exception():
+                try:
+                    connection.rset()
+                except (smtplib.SMTPException, socket.error):
+                    connection.close()
+                else:
+                    self._release(connection)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                connection.close()
+        self._release(connection)
+
+    def close(self):
+        """Closes the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(conf_n):
+    """Returns the SMTP connection pool shared by all the mailto tasks."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool(conf_n.smtp_host, conf_n.smtp_port,
+                             conf_n.smtp_timeout, conf_n.smtp_pool_size,
+                             starttls=conf_n.smtp_starttls,
+                             username=conf_n.smtp_username,
+                             password=conf_n.smtp_password)
+        return _pool
+
+
 class MailtoTask(object):
 
     def _make_confirm_string(self, conf_n, message, queue_name):
@@ -60,51 +182,74 @@ class MailtoTask(object):
                                      confirm_url)
         return text.MIMEText(email_body)
 
-    def execute(self, subscription, messages, **kwargs):
+    def _make_email(self, subscription, message, conf_n):
         subscriber = urllib_parse.urlparse(subscription['subscriber'])
-        params = urllib_parse.parse_qs(subscriber.query)
-        params = dict((k.lower(), v) for k, v in params.items())
+        # Send confirmation email to subscriber.
+        if (message.get('Message_Type') ==
+                MessageType.SubscriptionConfirmation.name):
+            content = conf_n.subscription_confirmation_email_template
+            msg = self._make_confirmation_email(content['body'],
+                                                subscription,
+                                                message, conf_n)
+            msg["to"] = subscriber.path
+            msg["from"] = content['sender']
+            msg["subject"] = content['topic']
+        elif (message.get('Message_Type') ==
+                MessageType.UnsubscribeConfirmation.name):
+            content = conf_n.unsubscribe_confirmation_email_template
+            msg = self._make_confirmation_email(content['body'],
+                                                subscription,
+                                                message, conf_n)
+            msg["to"] = subscriber.path
+            msg["from"] = content['sender']
+            msg["subject"] = content['topic']
+        else:
+            params = urllib_parse.parse_qs(subscriber.query)
+            params = dict((k.lower(), v) for k, v in params.items())
+            # NOTE(Eva-i): Unfortunately this will add 'queue_name' key
+            # to our original messages(dicts) which will be later
+            # consumed in the storage controller. It seems safe though.
+            message['queue_name'] = subscription['source']
+            msg = text.MIMEText(json.dumps(message))
+            msg["to"] = subscriber.path
+            msg["from"] = subscription['options'].get('from', '')
+            subject_opt = subscription['options'].get('subject', '')
+            msg["subject"] = params.get('subject', subject_opt)
+        return msg
+
+    def execute(self, subscription, messages, **kwargs):
         conf_n = kwargs.get('conf').notification
         try:
-            for message in messages:
-                p = subprocess.Popen(conf_n.smtp_command.split(' '),
-                                     stdin=subprocess.PIPE)
-                # Send confirmation email to subscriber.
-                if (message.get('Message_Type') ==
-                        MessageType.SubscriptionConfirmation.name):
-                    content = conf_n.subscription_confirmation_email_template
-                    msg = self._make_confirmation_email(content['body'],
-                                                        subscription,
-                                                        message, conf_n)
-                    msg["to"] = subscriber.path
-                    msg["from"] = content['sender']
-                    msg["subject"] = content['topic']
-                elif (message.get('Message_Type') ==
-                        MessageType.UnsubscribeConfirmation.name):
-                    content = conf_n.unsubscribe_confirmation_email_template
-                    msg = self._make_confirmation_email(content['body'],
-                                                        subscription,
-                                                        message, conf_n)
-                    msg["to"] = subscriber.path
-                    msg["from"] = content['sender']
-                    msg["subject"] = content['topic']
-                else:
-                    # NOTE(Eva-i): Unfortunately this will add 'queue_name' key
-                    # to our original messages(dicts) which will be later
-                    # consumed in the storage controller. It seems safe though.
-                    message['queue_name'] = subscription['source']
-                    msg = text.MIMEText(json.dumps(message))
-                    msg["to"] = subscriber.path
-                    msg["from"] = subscription['options'].get('from', '')
-                    subject_opt = subscription['options'].get('subject', '')
-                    msg["subject"] = params.get('subject', subject_opt)
-                p.communicate(msg.as_string())
-                LOG.debug("Send mail successfully: %s", msg.as_string())
-        except OSError as err:
-            LOG.exception('Failed to create process for sendmail, '
-                          'because %s.', str(err))
+            emails = [self._make_email(subscription, message, conf_n)
+                      for message in messages]
+            if conf_n.smtp_host:
+                self._send_smtp(emails, conf_n)
+            else:
+                self._send_sendmail(emails, conf_n)
         except Exception as exc:
             LOG.exception('Failed to send email because %s.', str(exc))
 
+    def _send_smtp(self, emails, conf_n):
+        try:
+            get_pool(conf_n).send(emails)
+        except (smtplib.SMTPException, socket.error) as err:
+            # NOTE: On Python 3, SMTP and socket errors are OSErrors as
+            # well, so they are told apart from sendmail failures here.
+            LOG.exception('Failed to send email to SMTP server %(host)s, '
+                          'because %(err)s.',
+                          {'host': conf_n.smtp_host, 'err': str(err)})
+
+    def _send_sendmail(self, emails, conf_n):
+        for msg in emails:
+            try:
+                p = subprocess.Popen(conf_n.smtp_command.split(' '),
+                                     stdin=subprocess.PIPE)
+            except OSError as err:
+                LOG.exception('Failed to create process for sendmail, '
+                              'because %s.', str(err))
+                return
+            p.communicate(msg.as_string())
+            LOG.debug("Send mail successfully: %s", msg.as_string())
+
     def register(self, subscriber, options, ttl, project_id, request_data):
         pass
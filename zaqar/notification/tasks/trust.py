@@ -28,7 +28,7 @@ class TrustTask(webhook.WebhookTask):
     token, which will then be passed to the notified service.
     """
 
-    def execute(self, subscription, messages, **kwargs):
+    def _authenticate(self, subscription):
         subscription = copy.deepcopy(subscription)
         subscriber = subscription['subscriber']
 
@@ -38,9 +38,18 @@ class TrustTask(webhook.WebhookTask):
         subscription['subscriber'] = subscriber[6:]
         headers = {'X-Auth-Token': token,
                    'Content-Type': 'application/json'}
+        return subscription, headers
+
+    def execute(self, subscription, messages, **kwargs):
+        subscription, headers = self._authenticate(subscription)
         super(TrustTask, self).execute(subscription, messages, headers,
                                        **kwargs)
 
+    def deliver(self, subscription, messages, **kwargs):
+        subscription, headers = self._authenticate(subscription)
+        return super(TrustTask, self).deliver(subscription, messages,
+                                              headers, **kwargs)
+
     def register(self, subscriber, options, ttl, project_id, request_data):
         if 'trust_id' not in options:
             # We have a trust subscriber without a trust ID,
@@ -13,14 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import heapq
+import itertools
+import json
 import math
+import threading
 import time
 
-import json
+import futurist
 from oslo_log import log as logging
 import requests
+from requests import adapters
+from six.moves import urllib_parse
 
 from zaqar.common import consts
+from zaqar.notification.notifier import MessageType
 
 LOG = logging.getLogger(__name__)
 
@@ -57,98 +65,372 @@ RETRY_BACKOFF_FUNCTION_MAP = {'linear': _Linear_function,
                               'exponential': _Exponential_function}
 
 
-class WebhookTask(object):
+def _get_retry_policy(sub_retry_policy, queue_retry_policy):
+    sub_retry_policy = sub_retry_policy or {}
+    queue_retry_policy = queue_retry_policy or {}
+    if sub_retry_policy.get('ignore_subscription_override') or \
+       queue_retry_policy.get('ignore_subscription_override'):
+        return queue_retry_policy
+    return sub_retry_policy or queue_retry_policy
+
+
+def _retry_delays(retry_policy):
+    """Yields the number of seconds to wait before each retry."""
+    # Immediate Retry Phase
+    for i in range(retry_policy.get('retries_with_no_delay',
+                                    consts.RETRIES_WITH_NO_DELAY)):
+        yield 0
+    # Pre-Backoff Phase
+    minimum_delay = retry_policy.get('minimum_delay', consts.MINIMUM_DELAY)
+    for i in range(retry_policy.get('minimum_delay_retries',
+                                    consts.MINIMUM_DELAY_RETRIES)):
+        yield minimum_delay
+    # Now we support linear,arithmetic,
+    # exponential and geometric retry backoff function.
+    retry_function = retry_policy.get('retry_backoff_function', 'linear')
+    backoff_function = RETRY_BACKOFF_FUNCTION_MAP[retry_function]
+    maximum_delay = retry_policy.get('maximum_delay', consts.MAXIMUM_DELAY)
+    for delay in backoff_function(minimum_delay, maximum_delay,
+                                  consts.LINEAR_INTERVAL):
+        yield delay
+    # Post-Backoff Phase
+    for i in range(retry_policy.get('maximum_delay_retries',
+                                    consts.MAXIMUM_DELAY_RETRIES)):
+        yield maximum_delay
+
+
+class _Delivery(object):
+    """A notification request, along with the delays of its retries."""
+
+    __slots__ = ('subscriber', 'data', 'headers', 'retry_delays', 'attempts')
+
+    def __init__(self, subscriber, data, headers, retry_delays):
+        self.subscriber = subscriber
+        self.data = data
+        self.headers = headers
+        self.retry_delays = retry_delays
+        self.attempts = 0
+
+
+class Dispatcher(object):
+    """Delivers webhook notifications without blocking on subscribers.
+
+    Requests are sent from a bounded pool of threads, reusing one
+    keep-alive session per subscriber host. A request that fails is
+    not retried from the thread that sent it; instead, a single
+    scheduler thread resubmits it once its retry delay has elapsed, so
+    that a subscriber that is down only ever holds a thread for the
+    duration of one request. In addition, each subscriber has at most
+    `max_per_subscriber` requests in flight at any time, and further
+    requests wait in a queue of their own, so a slow subscriber cannot
+    starve the others.
+
+    :param max_workers: number of threads sending requests
+    :param max_per_subscriber: maximum number of concurrent requests to
+        the same subscriber URL
+    :param timeout: number of seconds to wait for a subscriber to respond
+    :param max_sessions: number of per-host sessions kept open
+    """
+
+    def __init__(self, max_workers, max_per_subscriber, timeout,
+                 max_sessions=1000):
+        self._executor = futurist.ThreadPoolExecutor(max_workers=max_workers)
+        self._max_workers = max_workers
+        self._max_per_subscriber = max_per_subscriber
+        self._timeout = timeout
+        self._max_sessions = max_sessions
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._wakeup = threading.Condition(self._lock)
+
+        self._sessions = collections.OrderedDict()
+        self._in_flight = collections.defaultdict(int)
+        self._waiting = collections.defaultdict(collections.deque)
+        self._timers = []
+        self._sequence = itertools.count()
+        self._unfinished = 0
+        self._scheduler = None
+        self._stopped = False
+
+    def submit(self, subscriber, data, headers, retry_delays=()):
+        """Queues a POST request to a subscriber.
+
+        :param subscriber: URL of the subscriber
+        :param data: request body
+        :param headers: request headers
+        :param retry_delays: iterable of the number of seconds to wait
+            before each retry, should the request fail
+        """
+        delivery = _Delivery(subscriber, data, headers, iter(retry_delays))
+        with self._lock:
+            self._unfinished += 1
+            self._dispatch(delivery)
+
+    def post(self, subscriber, data, headers):
+        """Sends a POST request to a subscriber, without retrying it.
+
+        Unlike `submit`, the request is sent from the calling thread.
+
+        :returns: True if the subscriber accepted the request
+        """
+        return self._post(_Delivery(subscriber, data, headers, iter(())))
+
+    def wait(self, timeout=None):
+        """Waits until all the submitted requests are done.
+
+        A request is done when it succeeded, or failed and ran out of
+        retries.
+
+        :returns: False if the timeout expired, True otherwise
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while self._unfinished:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, wait=True):
+        """Stops the dispatcher, dropping the scheduled retries."""
+        with self._lock:
+            self._stopped = True
+            for __ in self._timers:
+                self._finish()
+            self._timers = []
+            self._wakeup.notify()
+        self._executor.shutdown(wait=wait)
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _dispatch(self, delivery):
+        # NOTE: Must be called with self._lock held.
+        if self._stopped:
+            self._finish()
+            return
+
+        subscriber = delivery.subscriber
+        if self._in_flight[subscriber] >= self._max_per_subscriber:
+            self._waiting[subscriber].append(delivery)
+            return
+
+        self._in_flight[subscriber] += 1
+        self._executor.submit(self._send, delivery)
+
+    def _finish(self):
+        # NOTE: Must be called with self._lock held.
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._idle.notify_all()
+
+    def _send(self, delivery):
+        succeeded = self._post(delivery)
+
+        with self._lock:
+            subscriber = delivery.subscriber
+            self._in_flight[subscriber] -= 1
+
+            if succeeded:
+                self._finish()
+            else:
+                self._schedule_retry(delivery)
+
+            waiting = self._waiting.get(subscriber)
+            if waiting:
+                self._dispatch(waiting.popleft())
+                if not waiting:
+                    del self._waiting[subscriber]
+
+            if not self._in_flight[subscriber]:
+                del self._in_flight[subscriber]
 
-    def _post_request_success(self, subscriber, data, headers):
+    def _post(self, delivery):
+        delivery.attempts += 1
         try:
-            response = requests.post(subscriber, data=data, headers=headers)
-            if response and (response.status_code in range(200, 500)):
+            response = self._get_session(delivery.subscriber).post(
+                delivery.subscriber, data=delivery.data,
+                headers=delivery.headers, timeout=self._timeout)
+            if response is not None and 200 <= response.status_code < 500:
                 return True
+            LOG.info('Response from %(subscriber)s is %(status)s.',
+                     {'subscriber': delivery.subscriber,
+                      'status': getattr(response, 'status_code', None)})
         except Exception as e:
-            LOG.exception('post request got exception in retry: %s.', str(e))
+            LOG.exception('post request got exception: %s.', str(e))
         return False
 
-    def _retry_post(self, sub_retry_policy, queue_retry_policy, subscriber,
-                    data, headers):
-        retry_policy = None
-        if sub_retry_policy.get('ignore_subscription_override') or \
-           queue_retry_policy.get('ignore_subscription_override'):
-            retry_policy = queue_retry_policy or {}
+    def _get_session(self, subscriber):
+        parts = urllib_parse.urlsplit(subscriber)
+        key = (parts.scheme, parts.netloc)
+
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is None:
+                session = requests.Session()
+                adapter = adapters.HTTPAdapter(pool_connections=1,
+                                               pool_maxsize=self._max_workers)
+                session.mount(parts.scheme + '://', adapter)
+                if len(self._sessions) >= self._max_sessions:
+                    __, evicted = self._sessions.popitem(last=False)
+                    evicted.close()
+            # NOTE: Keep the most recently used sessions at the end.
+            self._sessions[key] = session
+
+        return session
+
+    def _schedule_retry(self, delivery):
+        # NOTE: Must be called with self._lock held.
+        delay = next(delivery.retry_delays, None)
+        if delay is None or self._stopped:
+            LOG.debug('Send request retries are all failed, '
+                      'subscriber: %(subscriber)s, attempts: %(attempts)s',
+                      {'subscriber': delivery.subscriber,
+                       'attempts': delivery.attempts})
+            self._finish()
+            return
+
+        if not delay:
+            self._dispatch(delivery)
+            return
+
+        LOG.debug('Retry %(subscriber)s in %(delay)s seconds',
+                  {'subscriber': delivery.subscriber, 'delay': delay})
+        heapq.heappush(self._timers,
+                       (time.time() + delay, next(self._sequence), delivery))
+
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._run_scheduler)
+            self._scheduler.daemon = True
+            self._scheduler.start()
         else:
-            retry_policy = sub_retry_policy or queue_retry_policy or {}
-        # Immediate Retry Phase
-        for retry_with_no_delay in range(
-                0, retry_policy.get('retries_with_no_delay',
-                                    consts.RETRIES_WITH_NO_DELAY)):
-            LOG.debug('Retry with no delay, count: %s', retry_with_no_delay)
-            if self._post_request_success(subscriber, data, headers):
-                return
-        # Pre-Backoff Phase
-        for minimum_delay_retry in range(
-                0, retry_policy.get('minimum_delay_retries',
-                                    consts.MINIMUM_DELAY_RETRIES)):
-            LOG.debug('Retry with minimum delay, count: %s',
-                      minimum_delay_retry)
-            time.sleep(retry_policy.get('minimum_delay', consts.MINIMUM_DELAY))
-            if self._post_request_success(subscriber, data, headers):
-                return
-        # Now we support linear,arithmetic,
-        # exponential and geometric retry backoff function.
-        retry_function = retry_policy.get('retry_backoff_function', 'linear')
-        backoff_function = RETRY_BACKOFF_FUNCTION_MAP[retry_function]
-        for i in backoff_function(retry_policy.get('minimum_delay',
-                                                   consts.MINIMUM_DELAY),
-                                  retry_policy.get('maximum_delay',
-                                                   consts.MAXIMUM_DELAY),
-                                  consts.LINEAR_INTERVAL):
-            LOG.debug('Retry with function:%s, sleep: %s seconds',
-                      retry_function, i)
-            time.sleep(i)
-            if self._post_request_success(subscriber, data, headers):
-                return
-        # Post-Backoff Phase
-        for maximum_delay_retries in range(
-                0, retry_policy.get('maximum_delay_retries',
-                                    consts.MAXIMUM_DELAY_RETRIES)):
-            LOG.debug('Retry with maximum delay, count: %s',
-                      maximum_delay_retries)
-            time.sleep(retry_policy.get('maximum_delay', consts.MAXIMUM_DELAY))
-            if self._post_request_success(subscriber, data, headers):
-                return
-        LOG.debug('Send request retries are all failed.')
+            self._wakeup.notify()
 
-    def execute(self, subscription, messages, headers=None, **kwargs):
+    def _run_scheduler(self):
+        with self._lock:
+            while not self._stopped:
+                now = time.time()
+                while self._timers and self._timers[0][0] <= now:
+                    __, __, delivery = heapq.heappop(self._timers)
+                    self._dispatch(delivery)
+
+                timeout = self._timers[0][0] - now if self._timers else None
+                self._wakeup.wait(timeout)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher(conf):
+    """Returns the dispatcher shared by all the webhook tasks."""
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            conf_n = conf.notification
+            _dispatcher = Dispatcher(conf_n.webhook_max_workers,
+                                     conf_n.webhook_max_subscriber_requests,
+                                     conf_n.webhook_timeout)
+        return _dispatcher
+
+
+class WebhookTask(object):
+
+    def _make_data(self, options, document):
+        data = json.dumps(document)
+        if 'post_data' in options:
+            template = options['post_data']
+            if isinstance(document, list):
+                template = template.replace('"$zaqar_messages$"', data)
+            return template.replace('"$zaqar_message$"', data)
+        return data
+
+    def _make_batches(self, options, messages):
+        # NOTE: Confirmation requests are always sent on their
+        # own, so that subscribers can tell them apart from notifications.
+        if not options.get('post_batch') or any(
+                msg.get('Message_Type') != MessageType.Notification.name
+                for msg in messages):
+            return messages
+
+        size = options.get('post_batch_size') or len(messages)
+        return [messages[i:i + size] for i in range(0, len(messages), size)]
+
+    def _prepare(self, subscription, messages, headers):
+        """Returns the headers and the bodies of the requests to send."""
         if headers is None:
             headers = {'Content-Type': 'application/json'}
-        headers.update(subscription['options'].get('post_headers', {}))
+        options = subscription['options']
+        headers.update(options.get('post_headers', {}))
+        for msg in messages:
+            # NOTE(Eva-i): Unfortunately this will add 'queue_name' key to
+            # our original messages(dicts) which will be later consumed in
+            # the storage controller. It seems safe though.
+            msg['queue_name'] = subscription['source']
+        return headers, [self._make_data(options, document)
+                         for document in self._make_batches(options,
+                                                            messages)]
+
+    def execute(self, subscription, messages, headers=None, **kwargs):
+        retry_policy = _get_retry_policy(
+            subscription['options'].get('_retry_policy', {}),
+            kwargs.get('queue_retry_policy'))
+        dispatcher = get_dispatcher(kwargs.get('conf'))
+        try:
+            headers, bodies = self._prepare(subscription, messages, headers)
+            for data in bodies:
+                dispatcher.submit(subscription['subscriber'], data, headers,
+                                  _retry_delays(retry_policy))
+        except Exception as e:
+            LOG.exception('webhook task got exception: %s.', str(e))
+
+    def execute_batch(self, batch_url, subscriptions, messages, **kwargs):
+        """Sends the messages to several subscribers with one request.
+
+        The subscriptions must have been created by a transport which
+        forwards each message posted to `batch_url` to each subscriber,
+        like the WebSocket transport does for its connections.
+        """
+        retry_policy = _get_retry_policy({}, kwargs.get('queue_retry_policy'))
+        dispatcher = get_dispatcher(kwargs.get('conf'))
         try:
             for msg in messages:
-                # NOTE(Eva-i): Unfortunately this will add 'queue_name' key to
-                # our original messages(dicts) which will be later consumed in
-                # the storage controller. It seems safe though.
-                msg['queue_name'] = subscription['source']
-                if 'post_data' in subscription['options']:
-                    data = subscription['options']['post_data']
-                    data = data.replace('"$zaqar_message$"', json.dumps(msg))
-                else:
-                    data = json.dumps(msg)
-                response = requests.post(subscription['subscriber'],
-                                         data=data,
-                                         headers=headers)
-                if response and (response.status_code not in range(200, 500)):
-                    LOG.info("Response is %s, begin to retry",
-                             response.status_code)
-                    self._retry_post(
-                        subscription['options'].get('_retry_policy', {}),
-                        kwargs.get('queue_retry_policy'),
-                        subscription['subscriber'],
-                        data, headers)
+                msg['queue_name'] = subscriptions[0]['source']
+            data = json.dumps({'subscribers': [sub['subscriber']
+                                               for sub in subscriptions],
+                               'messages': messages})
+            dispatcher.submit(batch_url, data,
+                              {'Content-Type': 'application/json'},
+                              _retry_delays(retry_policy))
+        except Exception as e:
+            LOG.exception('webhook task got exception: %s.', str(e))
+
+    def deliver(self, subscription, messages, headers=None, **kwargs):
+        """Sends the messages once, from the calling thread.
+
+        Retrying is left to the caller, see
+        :class:`zaqar.cmd.notifier.Notifier`.
+
+        :returns: True if the subscriber accepted all the requests
+        """
+        dispatcher = get_dispatcher(kwargs.get('conf'))
+        try:
+            headers, bodies = self._prepare(subscription, messages, headers)
         except Exception as e:
             LOG.exception('webhook task got exception: %s.', str(e))
-            self._retry_post(subscription['options'].get('_retry_policy', {}),
-                             kwargs.get('queue_retry_policy'),
-                             subscription['subscriber'],
-                             data, headers)
+            return False
+        succeeded = True
+        for data in bodies:
+            if not dispatcher.post(subscription['subscriber'], data, headers):
+                succeeded = False
+        return succeeded
 
     def register(self, subscriber, options, ttl, project_id, request_data):
         pass
@@ -25,6 +25,7 @@ Claim = base.Claim
 Message = base.Message
 Queue = base.Queue
 Subscription = base.Subscription
+Outbox = base.Outbox
 PoolsBase = base.PoolsBase
 FlavorsBase = base.FlavorsBase
 
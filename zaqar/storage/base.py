@@ -121,6 +121,13 @@ class DataDriverBase(DriverBase):
         if backend_health:
             overall_health.update(backend_health)
 
+        # NOTE: Building the outbox controller may create its storage,
+        # so it is only looked at when notifications go through it.
+        if self.conf.notification.use_outbox:
+            outbox = self.outbox_controller
+            if outbox is not None:
+                overall_health['notification_backlog'] = outbox.depth()
+
         return overall_health
 
     @abc.abstractmethod
@@ -242,6 +249,15 @@ class DataDriverBase(DriverBase):
         """Returns the driver's subscription controller."""
         raise NotImplementedError
 
+    @property
+    def outbox_controller(self):
+        """Returns the driver's notification outbox controller.
+
+        Drivers that are not able to store notifications return None,
+        in which case notifications are delivered from memory.
+        """
+        return None
+
 
 @six.add_metaclass(abc.ABCMeta)
 class ControlDriverBase(DriverBase):
@@ -405,6 +421,18 @@ class Queue(ControllerBase):
 
     _stats = abc.abstractmethod(lambda x: None)
 
+    def bulk_stats(self, names, project=None):
+        """Base method for the stats of several queues at once.
+
+        :param names: The queue names
+        :param project: Project id
+        :returns: Dictionary mapping the name of each queue to
+            its stats. Queues that do not exist are left out.
+        """
+        return self._bulk_stats(names, project)
+
+    _bulk_stats = abc.abstractmethod(lambda x: None)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class Message(ControllerBase):
@@ -733,6 +761,85 @@ class Subscription(ControllerBase):
         raise NotImplementedError
 
 
+@six.add_metaclass(abc.ABCMeta)
+class Outbox(ControllerBase):
+    """This class is responsible for storing pending notifications.
+
+    Each entry of the outbox records the notification of a batch of
+    messages to one subscription. Entries are leased to the workers
+    delivering them, so that the entries of a worker that died are
+    eventually delivered by another one.
+
+    Entries are dicts with the following fields: `id`, `project`,
+    `queue`, `subscription`, `messages`, `retry_policy` and `attempts`,
+    the number of failed delivery attempts.
+    """
+
+    @abc.abstractmethod
+    def put(self, queue, subscription, messages, project=None,
+            retry_policy=None):
+        """Records a notification to deliver.
+
+        :param queue: Name of the queue the messages were posted to.
+        :type queue: six.text_type
+        :param subscription: The subscription to notify.
+        :type subscription: dict
+        :param messages: Messages to notify the subscriber of.
+        :type messages: list
+        :param project: Project id
+        :type project: six.text_type
+        :param retry_policy: Retry policy of the queue, if any.
+        :type retry_policy: dict
+        :returns: ID of the new entry
+        :rtype: six.text_type
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def lease(self, limit, ttl):
+        """Leases the entries due for delivery.
+
+        A leased entry is not returned again for `ttl` seconds, unless
+        it is deferred in the meantime.
+
+        :param limit: Max number of entries to lease.
+        :type limit: int
+        :param ttl: Duration of the lease, in seconds.
+        :type ttl: int
+        :returns: The leased entries, oldest first.
+        :rtype: [{}]
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def defer(self, entry_id, delay):
+        """Schedules a new delivery attempt of an entry.
+
+        :param entry_id: ID of the entry that failed to be delivered.
+        :type entry_id: six.text_type
+        :param delay: Number of seconds to wait before the next attempt.
+        :type delay: int
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, entry_id):
+        """Removes an entry once delivered, or given up on.
+
+        :param entry_id: ID of the entry to remove.
+        :type entry_id: six.text_type
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def depth(self):
+        """Returns the number of entries waiting to be delivered.
+
+        :rtype: int
+        """
+        raise NotImplementedError
+
+
 @six.add_metaclass(abc.ABCMeta)
 class PoolsBase(ControllerBase):
     """A controller for managing pools."""
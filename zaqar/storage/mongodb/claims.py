@@ -26,7 +26,8 @@ import datetime
 from bson import objectid
 from oslo_log import log as logging
 from oslo_utils import timeutils
-from pymongo.collection import ReturnDocument
+import pymongo
+import pymongo.errors
 
 from zaqar import storage
 from zaqar.storage import errors
@@ -34,6 +35,8 @@ from zaqar.storage.mongodb import utils
 
 LOG = logging.getLogger(__name__)
 
+DUPLICATE_KEY_ERROR = 11000
+
 
 def _messages_iter(msg_iter):
     """Used to iterate through messages."""
@@ -127,6 +130,12 @@ class ClaimController(storage.Claim):
 
         This 2 queries are required because there's no way, as for the
         time being, to execute an update on a limited number of records.
+
+        When the ``bulk_claims`` option is enabled (the default), the
+        second step is a single unordered bulk write that also bumps
+        the claim counters and extends the expiration time of the
+        messages, and the claimed messages are returned without
+        querying them again.
         """
         msg_ctrl = self.driver.message_controller
         queue_ctrl = self.driver.queue_controller
@@ -157,6 +166,28 @@ class ClaimController(storage.Claim):
         include_delayed = False if queue_meta.get('_default_message_delay',
                                                   0) else True
 
+        max_claim_count = None
+        if ('_max_claim_count' in queue_meta and
+                '_dead_letter_queue' in queue_meta):
+            max_claim_count = queue_meta['_max_claim_count']
+
+        if self.driver.mongodb_conf.bulk_claims:
+            claim_meta = {'id': oid, 't': ttl, 'e': claim_expires}
+            claimed, over_limit = msg_ctrl._claim(
+                queue, claim_meta, message_ttl, message_expiration,
+                project=project, limit=limit,
+                include_delayed=include_delayed,
+                max_claim_count=max_claim_count)
+
+            if over_limit and not self._move_to_dead_letter_queue(
+                    queue, queue_meta, oid, over_limit, project=project):
+                return None, iter([])
+
+            if not claimed:
+                return None, iter([])
+
+            return str(oid), iter(claimed)
+
         # Get a list of active, not claimed nor expired
         # messages that could be claimed.
         msgs = msg_ctrl._active(queue, projection={'_id': 1, 'c': 1},
@@ -165,9 +196,16 @@ class ClaimController(storage.Claim):
                                 include_delayed=include_delayed)
 
         messages = iter([])
+        msgs = list(msgs)
         be_claimed = [(msg['_id'], msg['c'].get('c', 0)) for msg in msgs]
         ids = [_id for _id, _ in be_claimed]
 
+        # NOTE: A message whose previous claim expired is still counted
+        # as claimed by the maintained stats, so only the others are
+        # added to them.
+        unclaimed_ids = [msg['_id'] for msg in msgs
+                         if msg['c'].get('id') is None]
+
         if len(ids) == 0:
             return None, messages
 
@@ -187,6 +225,14 @@ class ClaimController(storage.Claim):
                                           'c.e': {'$lte': now}},
                                          {'$set': {'c': meta}},
                                          upsert=False)
+        if msg_ctrl._maintain_stats:
+            newly_claimed = len(unclaimed_ids)
+            if updated.modified_count < len(ids) and unclaimed_ids:
+                # Some of the messages may have been claimed by a
+                # parallel request in the meantime.
+                newly_claimed = collection.count(
+                    filter={'_id': {'$in': unclaimed_ids}, 'c.id': oid})
+            msg_ctrl._update_stats(queue, project, claimed=newly_claimed)
 
         # NOTE(flaper87): Dirty hack!
         # This sets the expiration time to
@@ -200,68 +246,34 @@ class ClaimController(storage.Claim):
                                upsert=False)
 
         msg_count_moved_to_DLQ = 0
-        if ('_max_claim_count' in queue_meta and
-                '_dead_letter_queue' in queue_meta):
+        if max_claim_count is not None:
             LOG.debug(u"The list of messages being claimed: %(be_claimed)s",
                       {"be_claimed": be_claimed})
 
-            for _id, claimed_count in be_claimed:
-                # NOTE(flwang): We have claimed the message above, but we will
-                # update the claim count below. So that means, when the
-                # claimed_count equals queue_meta['_max_claim_count'], the
-                # message has met the threshold. And Zaqar will move it to the
-                # DLQ.
-                if claimed_count < queue_meta['_max_claim_count']:
-                    # 1. Save the new max claim count for message
-                    collection.update_one({'_id': _id,
-                                           'c.id': oid},
-                                          {'$set': {'c.c': claimed_count + 1}},
-                                          upsert=False)
-                    LOG.debug(u"Message %(id)s has been claimed %(count)d "
-                              u"times.", {"id": str(_id),
-                                          "count": claimed_count + 1})
-                else:
-                    # 2. Check if the message's claim count has exceeded the
-                    # max claim count defined in the queue, if so, move the
-                    # message to the dead letter queue.
-
-                    # NOTE(flwang): We're moving message directly. That means,
-                    # the queue and dead letter queue must be created on the
-                    # same storage pool. It's a technical tradeoff, because if
-                    # we re-send the message to the dead letter queue by
-                    # message controller, then we will lost all the claim
-                    # information.
-                    dlq_name = queue_meta['_dead_letter_queue']
-                    new_msg = {'c.c': claimed_count,
-                               'p_q': utils.scope_queue_name(dlq_name,
-                                                             project)}
-                    dlq_ttl = queue_meta.get("_dead_letter_queue_messages_ttl")
-                    if dlq_ttl:
-                        new_msg['t'] = dlq_ttl
-                    kwargs = {"return_document": ReturnDocument.AFTER}
-                    msg = collection.find_one_and_update({'_id': _id,
-                                                          'c.id': oid},
-                                                         {'$set': new_msg},
-                                                         **kwargs)
-                    dlq_collection = msg_ctrl._collection(dlq_name, project)
-                    if not dlq_collection:
-                        LOG.warning(u"Failed to find the message collection "
-                                    u"for queue %(dlq_name)s", {"dlq_name":
-                                                                dlq_name})
-                        return None, iter([])
-                    # NOTE(flwang): If dead letter queue and queue are in the
-                    # same partition, the message has been already
-                    # modified.
-                    if collection != dlq_collection:
-                        result = dlq_collection.insert_one(msg)
-                        if result.inserted_id:
-                            collection.delete_one({'_id': _id})
-                    LOG.debug(u"Message %(id)s has met the max claim count "
-                              u"%(count)d, now it has been moved to dead "
-                              u"letter queue %(dlq_name)s.",
-                              {"id": str(_id), "count": claimed_count,
-                               "dlq_name": dlq_name})
-                    msg_count_moved_to_DLQ += 1
+            # NOTE(flwang): We have claimed the message above, but we will
+            # update the claim count below. So that means, when the
+            # claimed_count equals queue_meta['_max_claim_count'], the
+            # message has met the threshold. And Zaqar will move it to the
+            # DLQ.
+            over_limit = [(_id, claimed_count)
+                          for _id, claimed_count in be_claimed
+                          if claimed_count >= max_claim_count]
+
+            # Save the new claim count for the other messages, all at once
+            requests = [
+                pymongo.UpdateOne({'_id': _id, 'c.id': oid},
+                                  {'$set': {'c.c': claimed_count + 1}})
+                for _id, claimed_count in be_claimed
+                if claimed_count < max_claim_count
+            ]
+            if requests:
+                collection.bulk_write(requests, ordered=False)
+
+            if over_limit and not self._move_to_dead_letter_queue(
+                    queue, queue_meta, oid, over_limit, project=project):
+                return None, iter([])
+
+            msg_count_moved_to_DLQ = len(over_limit)
 
         if updated.modified_count != 0:
             # NOTE(kgriffs): This extra step is necessary because
@@ -279,6 +291,104 @@ class ClaimController(storage.Claim):
 
         return str(oid), messages
 
+    def _move_to_dead_letter_queue(self, queue, queue_meta, claim_id,
+                                   over_limit, project=None):
+        """Moves claimed messages to the queue's dead letter queue.
+
+        Messages are moved as a batch, so the number of requests sent
+        to the database does not depend on how many of them met the
+        max claim count: a single bulk write when both queues live in
+        the same partition, or one find, one bulk insert and one bulk
+        delete otherwise.
+
+        :param queue: Name of the queue the messages were claimed from
+        :param queue_meta: The queue's metadata
+        :param claim_id: ObjectId of the claim the messages are tagged with
+        :param over_limit: List of (message ID, claim count) tuples for
+            the messages that have met the max claim count
+        :param project: Queue's project
+        :returns: False if the dead letter queue's message collection
+            could not be found, True otherwise
+        """
+        msg_ctrl = self.driver.message_controller
+        collection = msg_ctrl._collection(queue, project)
+        dlq_name = queue_meta['_dead_letter_queue']
+        dlq_ttl = queue_meta.get("_dead_letter_queue_messages_ttl")
+
+        # NOTE(flwang): We're moving message directly. That means,
+        # the queue and dead letter queue must be created on the
+        # same storage pool. It's a technical tradeoff, because if
+        # we re-send the message to the dead letter queue by
+        # message controller, then we will lost all the claim
+        # information.
+        dlq_collection = msg_ctrl._collection(dlq_name, project)
+        if dlq_collection is None:
+            LOG.warning(u"Failed to find the message collection "
+                        u"for queue %(dlq_name)s", {"dlq_name": dlq_name})
+            return False
+
+        new_values = {'p_q': utils.scope_queue_name(dlq_name, project)}
+        if dlq_ttl:
+            new_values['t'] = dlq_ttl
+
+        claim_counts = dict(over_limit)
+
+        if collection == dlq_collection:
+            # NOTE(flwang): If dead letter queue and queue are in the
+            # same partition, moving the message is just a matter of
+            # changing its scope.
+            requests = [
+                pymongo.UpdateOne({'_id': _id, 'c.id': claim_id},
+                                  {'$set': dict(new_values,
+                                                **{'c.c': claimed_count})})
+                for _id, claimed_count in over_limit
+            ]
+            collection.bulk_write(requests, ordered=False)
+        else:
+            msgs = list(collection.find({'_id': {'$in': list(claim_counts)},
+                                         'c.id': claim_id}))
+            for msg in msgs:
+                msg.update(new_values)
+                msg['c']['c'] = claim_counts[msg['_id']]
+
+            moved = self._insert_dead_letters(dlq_collection, msgs)
+            if moved:
+                collection.delete_many({'_id': {'$in': moved}})
+
+        LOG.debug(u"Messages %(ids)s have met the max claim count, now "
+                  u"they have been moved to dead letter queue "
+                  u"%(dlq_name)s.",
+                  {"ids": [str(_id) for _id, _ in over_limit],
+                   "dlq_name": dlq_name})
+
+        return True
+
+    def _insert_dead_letters(self, dlq_collection, msgs):
+        """Inserts messages into a dead letter queue collection.
+
+        :returns: IDs of the messages that are now stored in
+            `dlq_collection`, including the ones that were already
+            there because a previous attempt was interrupted.
+        """
+        if not msgs:
+            return []
+
+        ids = [msg['_id'] for msg in msgs]
+
+        try:
+            dlq_collection.insert_many(msgs, ordered=False)
+        except pymongo.errors.BulkWriteError as ex:
+            failed = set(ids[error['index']]
+                         for error in ex.details['writeErrors']
+                         if error['code'] != DUPLICATE_KEY_ERROR)
+            if failed:
+                LOG.warning(u"Failed to move messages %(ids)s to the dead "
+                            u"letter queue.",
+                            {"ids": [str(_id) for _id in failed]})
+            ids = [_id for _id in ids if _id not in failed]
+
+        return ids
+
     @utils.raises_conn_error
     @utils.retries_on_autoreconnect
     def update(self, queue, claim_id, metadata, project=None):
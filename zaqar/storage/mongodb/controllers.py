@@ -26,6 +26,7 @@ from zaqar.storage.mongodb import catalogue
 from zaqar.storage.mongodb import claims
 from zaqar.storage.mongodb import flavors
 from zaqar.storage.mongodb import messages
+from zaqar.storage.mongodb import outbox
 from zaqar.storage.mongodb import pools
 from zaqar.storage.mongodb import queues
 from zaqar.storage.mongodb import subscriptions
@@ -35,6 +36,7 @@ CatalogueController = catalogue.CatalogueController
 ClaimController = claims.ClaimController
 FlavorsController = flavors.FlavorsController
 MessageController = messages.MessageController
+OutboxController = outbox.OutboxController
 FIFOMessageController = messages.FIFOMessageController
 QueueController = queues.QueueController
 PoolsController = pools.PoolsController
@@ -211,6 +211,15 @@ class DataDriver(storage.DataDriverBase):
         else:
             return controller
 
+    @decorators.lazy_property(write=False)
+    def outbox_controller(self):
+        controller = controllers.OutboxController(self)
+        if (self.conf.profiler.enabled and
+                self.conf.profiler.trace_message_store):
+            return profiler.trace_cls("mongodb_outbox_controller")(controller)
+        else:
+            return controller
+
 
 class FIFODataDriver(DataDriver):
 
@@ -21,13 +21,16 @@ Field Mappings:
     letter of their long name.
 """
 
+import collections
 import datetime
 import time
 
 from bson import errors as bsonerror
 from bson import objectid
+from bson import son
 from oslo_log import log as logging
 from oslo_utils import timeutils
+import pymongo
 import pymongo.errors
 import pymongo.read_preferences
 
@@ -50,6 +53,11 @@ MAX_RETRY_POST_DURATION = 45
 # producers to succeed in turn.
 COUNTER_STALL_WINDOW = 5
 
+# Number of seconds popped messages stay claimed if the request is
+# interrupted after the messages were tagged, but before they were
+# deleted.
+POP_CLAIM_TTL = 60
+
 # For hinting
 ID_INDEX_FIELDS = [('_id', 1)]
 
@@ -117,6 +125,16 @@ TRANSACTION_INDEX_FIELDS = [
     ('tx', 1),
 ]
 
+# Fields needed to claim a message and to return it to the
+# client without having to query it again.
+CLAIM_PROJECTION = {
+    '_id': 1,
+    't': 1,
+    'e': 1,
+    'b': 1,
+    'c': 1,
+}
+
 
 class MessageController(storage.Message):
     """Implements message resource operations using MongoDB.
@@ -157,6 +175,13 @@ class MessageController(storage.Message):
         self._collections = [db.messages
                              for db in self.driver.message_databases]
 
+        # NOTE: The maintained stats of each queue live in the same
+        # partition as its messages.
+        self._stats_collections = [db.queue_stats
+                                   for db in self.driver.message_databases]
+        self._maintain_stats = (
+            self.driver.mongodb_conf.stats_mode == 'maintained')
+
         # Ensure indexes are initialized before any queries are performed
         for collection in self._collections:
             self._ensure_indexes(collection)
@@ -198,6 +223,58 @@ class MessageController(storage.Message):
         return self._collections[utils.get_partition(self._num_partitions,
                                                      queue_name, project)]
 
+    def _stats_collection(self, queue_name, project=None):
+        """Get the partitioned collection of the maintained stats."""
+        return self._stats_collections[utils.get_partition(
+            self._num_partitions, queue_name, project)]
+
+    def _partitioned(self, queue_names, project=None):
+        """Groups queue names by the partition of their messages."""
+        partitions = collections.defaultdict(list)
+        for queue_name in queue_names:
+            partition = utils.get_partition(self._num_partitions,
+                                            queue_name, project)
+            partitions[partition].append(queue_name)
+        return partitions.items()
+
+    def _update_stats(self, queue_name, project=None, total=0, claimed=0):
+        """Applies a change to the maintained stats of a queue.
+
+        The stats record of a queue is only created when its stats are
+        read, see `MessageQueueHandler.stats`, so nothing is done for
+        a queue whose stats were never requested. Only the counters are
+        maintained, the oldest and newest messages being read with
+        `first` when the stats are requested.
+
+        ::
+
+            Queue stats:
+                Name                Field
+                -------------------------
+                scope            ->   _id
+                total            ->     t
+                claimed          ->     c
+                reconciled ts    ->     r
+
+        Claim expiry is only accounted for when the record is
+        reconciled, so a message counts as claimed from its claim until
+        the claim is released or the message deleted.
+
+        :param total: Number of messages added to the queue
+        :param claimed: Number of messages claimed
+        """
+        if not self._maintain_stats:
+            return
+
+        scope = utils.scope_queue_name(queue_name, project)
+        try:
+            self._stats_collection(queue_name, project).update_one(
+                {'_id': scope}, {'$inc': {'t': total, 'c': claimed}})
+        except pymongo.errors.PyMongoError as ex:
+            # NOTE: The stats will be right again once reconciled.
+            LOG.warning(u'Failed to update the stats of queue %(queue)s: '
+                        u'%(error)s', {'queue': scope, 'error': ex})
+
     def _backoff_sleep(self, attempt):
         """Sleep between retries using a jitter algorithm.
 
@@ -229,6 +306,7 @@ class MessageController(storage.Message):
         scope = utils.scope_queue_name(queue_name, project)
         collection = self._collection(queue_name, project)
         collection.delete_many({PROJ_QUEUE: scope})
+        self._stats_collection(queue_name, project).delete_one({'_id': scope})
 
     def _list(self, queue_name, project=None, marker=None,
               echo=False, client_uuid=None, projection=None,
@@ -395,6 +473,115 @@ class MessageController(storage.Message):
 
         return utils.HookedCursor(msgs, denormalizer)
 
+    def _claim(self, queue_name, claim_meta, message_ttl, message_expires,
+               project=None, limit=None, include_delayed=False,
+               max_claim_count=None):
+        """Tags up to `limit` active messages with a claim.
+
+        The claim ID, the claim expiration, the claim counter and the
+        message expiration are all set with a single unordered bulk
+        write, one update per candidate message. Each update is
+        filtered on 'c.e' so that messages claimed by a parallel
+        request in the meantime are left alone.
+
+        The claimed messages are built from the documents returned by
+        the initial query, so no re-query is needed unless some of the
+        candidates were lost to a parallel claim.
+
+        :param queue_name: Name of the queue to claim messages from
+        :param claim_meta: Claim fields to set: id, ttl (t) and
+            expiration (e), as a UNIX timestamp
+        :param message_ttl: New TTL for messages that would otherwise
+            expire before the claim
+        :param message_expires: New expiration datetime for messages
+            that would otherwise expire before the claim
+        :param project: Queue's project
+        :param limit: Maximum number of messages to claim
+        :param include_delayed: Whether to claim delayed messages
+        :param max_claim_count: (Default None) If set, messages that
+            have already been claimed this many times are tagged with
+            the claim, but their claim counter is left untouched and
+            they are returned separately so the caller can move them
+            to a dead letter queue.
+
+        :returns: (claimed, over_limit) where `claimed` is a list of
+            denormalized messages and `over_limit` is a list of
+            (message ID, claim count) tuples.
+        """
+
+        now = timeutils.utcnow_ts()
+        claim_expires_dt = datetime.datetime.utcfromtimestamp(
+            claim_meta['e'])
+
+        candidates = list(self._active(queue_name,
+                                       projection=CLAIM_PROJECTION,
+                                       project=project,
+                                       limit=limit,
+                                       include_delayed=include_delayed))
+        if not candidates:
+            return [], []
+
+        requests = []
+        for msg in candidates:
+            claim_count = msg['c'].get('c', 0)
+            over_limit = (max_claim_count is not None and
+                          claim_count >= max_claim_count)
+
+            new_values = {
+                'c.id': claim_meta['id'],
+                'c.t': claim_meta['t'],
+                'c.e': claim_meta['e'],
+            }
+
+            # Extend the expiration time of messages that would
+            # otherwise expire before the claim does.
+            if msg['e'] < claim_expires_dt:
+                new_values['e'] = message_expires
+                new_values['t'] = message_ttl
+                msg['t'] = message_ttl
+
+            update = {'$set': new_values}
+            if not over_limit:
+                update['$inc'] = {'c.c': 1}
+                claim_count += 1
+
+            # NOTE: A message whose previous claim expired is still
+            # counted as claimed, see `_update_stats`.
+            msg['reclaimed'] = msg['c'].get('id') is not None
+            msg['c'] = dict(claim_meta, c=claim_count)
+            msg['over_limit'] = over_limit
+
+            requests.append(pymongo.UpdateOne({'_id': msg['_id'],
+                                               'c.e': {'$lte': now}},
+                                              update))
+
+        collection = self._collection(queue_name, project)
+        result = collection.bulk_write(requests, ordered=False)
+
+        if result.modified_count < len(candidates):
+            # In between having gotten a list of active messages and
+            # updating them, some of them may have been claimed by a
+            # parallel request. Find out which messages were actually
+            # tagged with the claim ID successfully.
+            tagged = collection.find({'_id': {'$in': [msg['_id'] for msg
+                                                      in candidates]},
+                                      'c.id': claim_meta['id']},
+                                     projection={'_id': 1})
+            tagged_ids = set(doc['_id'] for doc in tagged)
+            candidates = [msg for msg in candidates
+                          if msg['_id'] in tagged_ids]
+
+        self._update_stats(queue_name, project,
+                           claimed=sum(1 for msg in candidates
+                                       if not msg['reclaimed']))
+
+        claimed = [_basic_message(msg, now) for msg in candidates
+                   if not msg['over_limit']]
+        over_limit = [(msg['_id'], msg['c']['c']) for msg in candidates
+                      if msg['over_limit']]
+
+        return claimed, over_limit
+
     def _unclaim(self, queue_name, claim_id, project=None):
         cid = utils.to_oid(claim_id)
 
@@ -409,9 +596,12 @@ class MessageController(storage.Message):
         scope = utils.scope_queue_name(queue_name, project)
         collection = self._collection(queue_name, project)
 
-        collection.update_many({PROJ_QUEUE: scope, 'c.id': cid},
-                               {'$set': {'c': {'id': None, 'e': now}}},
-                               upsert=False)
+        result = collection.update_many(
+            {PROJ_QUEUE: scope, 'c.id': cid},
+            {'$set': {'c': {'id': None, 'e': now}}},
+            upsert=False)
+        self._update_stats(queue_name, project,
+                           claimed=-result.modified_count)
 
     def _inc_counter(self, queue_name, project=None, amount=1, window=None):
         """Increments the message counter and returns the new value.
@@ -664,6 +854,7 @@ class MessageController(storage.Message):
 
         res = collection.insert_many(prepared_messages,
                                      bypass_document_validation=True)
+        self._update_stats(queue_name, project, total=msgs_n)
 
         return [str(id_) for id_ in res.inserted_ids]
 
@@ -716,7 +907,10 @@ class MessageController(storage.Message):
 
                     raise errors.MessageNotClaimed(message_id)
 
-        collection.delete_one(query)
+        result = collection.delete_one(query)
+        if result.deleted_count:
+            self._update_stats(queue_name, project, total=-1,
+                               claimed=-1 if message['c']['id'] else 0)
 
     @utils.raises_conn_error
     @utils.retries_on_autoreconnect
@@ -728,32 +922,78 @@ class MessageController(storage.Message):
         }
 
         collection = self._collection(queue_name, project)
-        collection.delete_many(query)
+
+        claimed = 0
+        if self._maintain_stats:
+            # NOTE: Delete the claimed messages on their own first, to
+            # know how many of them to take off the claimed counter.
+            query['c.id'] = {'$ne': None}
+            claimed = collection.delete_many(query).deleted_count
+            del query['c.id']
+
+        result = collection.delete_many(query)
+        self._update_stats(queue_name, project,
+                           total=-(result.deleted_count + claimed),
+                           claimed=-claimed)
 
     @utils.raises_conn_error
     @utils.retries_on_autoreconnect
     def pop(self, queue_name, limit, project=None):
-        query = {
-            PROJ_QUEUE: utils.scope_queue_name(queue_name, project),
-        }
-
-        # Only include messages that are not part of
-        # any claim, or are part of an expired claim.
+        """Pops up to `limit` unclaimed messages from the queue.
+
+        Rather than issuing one find_one_and_delete per message, the
+        messages are popped in a constant number of requests: the
+        candidates are listed, tagged with a private claim so that
+        parallel claims and pops skip them, then deleted. If the
+        request is interrupted before the delete, the messages become
+        available again once that claim expires.
+        """
         now = timeutils.utcnow_ts()
-        query['c.e'] = {'$lte': now}
-
+        scope = utils.scope_queue_name(queue_name, project)
         collection = self._collection(queue_name, project)
-        projection = {'_id': 1, 't': 1, 'b': 1, 'c.id': 1}
-
-        messages = (collection.find_one_and_delete(query,
-                                                   projection=projection)
-                    for _ in range(limit))
 
-        final_messages = [_basic_message(message, now)
-                          for message in messages
-                          if message]
+        # Only include messages that are not part of
+        # any claim, or are part of an expired claim.
+        query = {
+            PROJ_QUEUE: scope,
+            'c.e': {'$lte': now},
+        }
 
-        return final_messages
+        projection = {'_id': 1, 't': 1, 'b': 1, 'c': 1}
+        candidates = list(collection.find(query, projection=projection,
+                                          sort=[('k', 1)],
+                                          limit=limit).hint(
+                                              ACTIVE_INDEX_FIELDS))
+        if not candidates:
+            return []
+
+        ids = [msg['_id'] for msg in candidates]
+        pop_id = objectid.ObjectId()
+        updated = collection.update_many(
+            {'_id': {'$in': ids}, 'c.e': {'$lte': now}},
+            {'$set': {'c.id': pop_id, 'c.e': now + POP_CLAIM_TTL}},
+            upsert=False)
+
+        if updated.modified_count < len(ids):
+            # Some of the messages may have been claimed by a
+            # parallel request in the meantime.
+            tagged = collection.find({'_id': {'$in': ids}, 'c.id': pop_id},
+                                     projection={'_id': 1})
+            tagged_ids = set(doc['_id'] for doc in tagged)
+            candidates = [msg for msg in candidates
+                          if msg['_id'] in tagged_ids]
+            ids = [msg['_id'] for msg in candidates]
+
+        if ids:
+            collection.delete_many({'_id': {'$in': ids}, 'c.id': pop_id})
+
+            # NOTE: Messages whose claim expired are still counted as
+            # claimed, see `_update_stats`.
+            claimed = sum(1 for msg in candidates if msg['c']['id'])
+            self._update_stats(queue_name, project, total=-len(ids),
+                               claimed=-claimed)
+
+        return [_basic_message(message, now) for message in candidates]
 
 
 class FIFOMessageController(MessageController):
@@ -891,6 +1131,9 @@ class FIFOMessageController(MessageController):
                                            {'$set': {'tx': None}},
                                            upsert=False)
 
+                self._update_stats(queue_name, project,
+                                   total=len(res.inserted_ids))
+
                 return [str(id_) for id_ in res.inserted_ids]
 
             except (pymongo.errors.DuplicateKeyError,
@@ -1030,31 +1273,157 @@ class MessageQueueHandler(object):
         if not self.queue_controller.exists(name, project=project):
             raise errors.QueueDoesNotExist(name, project)
 
-        controller = self.message_controller
+        if not self.message_controller._maintain_stats:
+            return {'messages': self._exact_stats(name, project)}
 
-        active = controller._count(name, project=project,
-                                   include_claimed=False)
+        return self._maintained_stats([name], project)[name]
 
-        total = controller._count(name, project=project,
-                                  include_claimed=True)
+    @utils.raises_conn_error
+    @utils.retries_on_autoreconnect
+    def bulk_stats(self, names, project=None):
+        names = self.queue_controller._existing(names, project=project)
+
+        if not self.message_controller._maintain_stats:
+            return self._aggregated_stats(names, project)
+
+        return self._maintained_stats(names, project)
+
+    def _maintained_stats(self, names, project=None):
+        """Reads the maintained stats of the given queues.
+
+        The stats of a queue whose record is missing or older than
+        `stats_reconcile_interval` are recomputed, and its record
+        replaced.
+        """
+        controller = self.message_controller
+        interval = self.driver.mongodb_conf.stats_reconcile_interval
+        now = timeutils.utcnow_ts()
+
+        stats = {}
+        for partition, queue_names in controller._partitioned(names, project):
+            scopes = dict((utils.scope_queue_name(name, project), name)
+                          for name in queue_names)
+            collection = controller._stats_collections[partition]
+            for record in collection.find({'_id': {'$in': list(scopes)}}):
+                if now - record['r'] < interval:
+                    name = scopes[record['_id']]
+                    stats[name] = {'messages': self._record_stats(
+                        name, project, record, now)}
+
+        stale = [name for name in names if name not in stats]
+        for name, queue_stats in self._aggregated_stats(stale,
+                                                        project).items():
+            record = _stats_record(queue_stats['messages'], now)
+            collection = controller._stats_collection(name, project)
+            collection.replace_one(
+                {'_id': utils.scope_queue_name(name, project)},
+                record, upsert=True)
+            stats[name] = queue_stats
+
+        return stats
+
+    def _aggregated_stats(self, names, project=None):
+        """Computes the stats of the given queues.
+
+        The messages of all the queues sharing a partition are
+        counted with a single aggregation, grouped by queue.
+        """
+        controller = self.message_controller
+        now = timeutils.utcnow_ts()
 
+        stats = dict((name, {'messages': {'claimed': 0,
+                                          'free': 0,
+                                          'total': 0}})
+                     for name in names)
+
+        for partition, queue_names in controller._partitioned(names, project):
+            scopes = dict((utils.scope_queue_name(name, project), name)
+                          for name in queue_names)
+            collection = controller._collections[partition]
+            results = collection.aggregate([
+                {'$match': {PROJ_QUEUE: {'$in': list(scopes)},
+                            'tx': None}},
+                {'$sort': son.SON([(PROJ_QUEUE, 1), ('k', 1)])},
+                {'$group': {
+                    '_id': '$' + PROJ_QUEUE,
+                    'total': {'$sum': 1},
+                    'claimed': {'$sum': {
+                        '$cond': [{'$gt': ['$c.e', now]}, 1, 0]}},
+                    'oldest': {'$first': '$_id'},
+                    'newest': {'$last': '$_id'},
+                }},
+            ])
+
+            for result in results:
+                total = result['total']
+                stats[scopes[result['_id']]]['messages'] = {
+                    'claimed': result['claimed'],
+                    'free': total - result['claimed'],
+                    'total': total,
+                    'oldest': utils.stat_message(
+                        {'id': str(result['oldest'])}, now),
+                    'newest': utils.stat_message(
+                        {'id': str(result['newest'])}, now),
+                }
+
+        return stats
+
+    def _record_stats(self, name, project, record, now):
+        """Creates the stats of a queue from its maintained record."""
+
+        # NOTE: The counters may drift, e.g. when messages expire,
+        # until the record is reconciled.
+        total = max(record['t'], 0)
+        claimed = min(max(record['c'], 0), total)
         message_stats = {
-            'claimed': total - active,
-            'free': active,
+            'claimed': claimed,
+            'free': total - claimed,
             'total': total,
         }
 
+        if total:
+            self._add_oldest_newest(message_stats, name, project, now)
+
+        return message_stats
+
+    def _add_oldest_newest(self, message_stats, name, project, now):
+        controller = self.message_controller
+
         try:
             oldest = controller.first(name, project=project, sort=1)
             newest = controller.first(name, project=project, sort=-1)
         except errors.QueueIsEmpty:
             pass
         else:
-            now = timeutils.utcnow_ts()
             message_stats['oldest'] = utils.stat_message(oldest, now)
             message_stats['newest'] = utils.stat_message(newest, now)
 
-        return {'messages': message_stats}
+    def _exact_stats(self, name, project=None):
+        controller = self.message_controller
+
+        active = controller._count(name, project=project,
+                                   include_claimed=False)
+
+        total = controller._count(name, project=project,
+                                  include_claimed=True)
+
+        message_stats = {
+            'claimed': total - active,
+            'free': active,
+            'total': total,
+        }
+
+        self._add_oldest_newest(message_stats, name, project,
+                                timeutils.utcnow_ts())
+
+        return message_stats
+
+
+def _stats_record(message_stats, now):
+    """Creates the maintained stats record of a queue from its stats."""
+    return {'t': message_stats['total'],
+            'c': message_stats['claimed'],
+            'r': now}
 
 
 def _get_scoped_query(name, project):
@@ -131,6 +131,34 @@ MESSAGE_MONGODB_OPTIONS = _COMMON_OPTIONS + (
                      'should not need a large number of partitions '
                      'to improve performance, esp. if deploying '
                      'MongoDB on SSD storage.')),
+
+    cfg.BoolOpt('bulk_claims', default=True,
+                help=('Create claims with a single bulk write that tags '
+                      'the messages, increments their claim counters and '
+                      'extends their expiration time, returning the '
+                      'claimed messages without querying them again. '
+                      'Set to False to use the legacy multi-query '
+                      'algorithm instead, e.g. to compare both with '
+                      'zaqar-bench.')),
+
+    cfg.StrOpt('stats_mode', default='exact',
+               choices=['exact', 'maintained'],
+               help=('How queue stats are computed. "exact" counts the '
+                     'messages of the queue each time its stats are '
+                     'requested. "maintained" keeps a stats record per '
+                     'queue, updated as messages are posted, claimed and '
+                     'deleted, so that reading the stats takes a single '
+                     'query. Since messages and claims expiring are not '
+                     'accounted for, nor are messages moved to a dead '
+                     'letter queue, maintained stats are recomputed '
+                     'exactly once they are older than '
+                     '"stats_reconcile_interval".')),
+
+    cfg.IntOpt('stats_reconcile_interval', default=60, min=1,
+               help=('Number of seconds after which the maintained stats '
+                     'of a queue are recomputed exactly, the next time they '
+                     'are requested. Only used when "stats_mode" is '
+                     '"maintained".')),
 )
 
 MANAGEMENT_MONGODB_GROUP = 'drivers:management_store:mongodb'
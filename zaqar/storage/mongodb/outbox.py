@@ -0,0 +1,111 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bson import objectid
+from oslo_utils import timeutils
+
+from zaqar import storage
+from zaqar.storage.mongodb import utils
+
+DUE_INDEX_FIELDS = [('d', 1)]
+
+
+class OutboxController(storage.Outbox):
+    """Implements the notification outbox using MongoDB.
+
+    Entries are stored in the subscriptions database, and leased by
+    pushing their due date into the future and tagging them with the
+    ID of the lease.
+
+    Schema:
+      'q': queue :: six.text_type
+      'p': project :: six.text_type
+      's': subscription :: dict
+      'm': messages :: list
+      'r': retry policy :: dict
+      'a': attempts :: int
+      'd': due :: int
+      'c': created :: int
+      'l': lease :: ObjectId
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(OutboxController, self).__init__(*args, **kwargs)
+        self._collection = self.driver.subscriptions_database.outbox
+        self._collection.ensure_index(DUE_INDEX_FIELDS, name='due',
+                                      background=True)
+
+    @utils.raises_conn_error
+    def put(self, queue, subscription, messages, project=None,
+            retry_policy=None):
+        now = timeutils.utcnow_ts()
+        res = self._collection.insert_one({'q': queue,
+                                           'p': project,
+                                           's': subscription,
+                                           'm': messages,
+                                           'r': retry_policy or {},
+                                           'a': 0,
+                                           'd': now,
+                                           'c': now})
+        return str(res.inserted_id)
+
+    @utils.raises_conn_error
+    def lease(self, limit, ttl):
+        now = timeutils.utcnow_ts()
+        lease_id = objectid.ObjectId()
+
+        due = self._collection.find({'d': {'$lte': now}},
+                                    projection={'_id': 1},
+                                    sort=DUE_INDEX_FIELDS,
+                                    limit=limit)
+        ids = [doc['_id'] for doc in due]
+        if not ids:
+            return []
+
+        # NOTE: Entries leased by another worker in the meantime are no
+        # longer due, so they are neither tagged nor returned; two
+        # workers never get the same entry.
+        self._collection.update_many({'_id': {'$in': ids},
+                                      'd': {'$lte': now}},
+                                     {'$set': {'d': now + ttl,
+                                               'l': lease_id}})
+
+        leased = self._collection.find({'_id': {'$in': ids},
+                                        'l': lease_id})
+        return [_basic_entry(doc) for doc in leased]
+
+    @utils.raises_conn_error
+    def defer(self, entry_id, delay):
+        due = timeutils.utcnow_ts() + delay
+        self._collection.update_one({'_id': utils.to_oid(entry_id)},
+                                    {'$set': {'d': due}, '$inc': {'a': 1}})
+
+    @utils.raises_conn_error
+    def delete(self, entry_id):
+        self._collection.delete_one({'_id': utils.to_oid(entry_id)})
+
+    @utils.raises_conn_error
+    def depth(self):
+        return self._collection.find().count()
+
+
+def _basic_entry(record):
+    return {
+        'id': str(record['_id']),
+        'project': record['p'],
+        'queue': record['q'],
+        'subscription': record['s'],
+        'messages': record['m'],
+        'retry_policy': record['r'],
+        'attempts': record['a'],
+    }
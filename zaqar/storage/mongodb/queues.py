@@ -266,6 +266,21 @@ class QueueController(storage.Queue):
         query = _get_scoped_query(name, project)
         return self._collection.find_one(query) is not None
 
+    @utils.raises_conn_error
+    @utils.retries_on_autoreconnect
+    def _existing(self, names, project=None):
+        """Returns the names of the given queues that exist.
+
+        Unlike `exists`, all the queues are looked up with a single
+        query, and the cache is not used.
+        """
+        scopes = dict((utils.scope_queue_name(name, project), name)
+                      for name in names)
+        cursor = self._collection.find({'p_q': {'$in': list(scopes)}},
+                                       projection={'p_q': 1, '_id': 0})
+        found = set(scopes[queue['p_q']] for queue in cursor)
+        return [name for name in names if name in found]
+
     @utils.raises_conn_error
     @utils.retries_on_autoreconnect
     def set_metadata(self, name, metadata, project=None):
@@ -286,6 +301,11 @@ class QueueController(storage.Queue):
     def _stats(self, name, project=None):
         pass
 
+    @utils.raises_conn_error
+    @utils.retries_on_autoreconnect
+    def _bulk_stats(self, names, project=None):
+        pass
+
 
 def _get_scoped_query(name, project):
     return {'p_q': utils.scope_queue_name(name, project)}
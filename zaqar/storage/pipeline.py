@@ -21,6 +21,7 @@ from stevedore import extension
 from zaqar import common
 from zaqar.common import decorators
 from zaqar.i18n import _
+from zaqar.notification import subscribers
 from zaqar.storage import base
 
 LOG = logging.getLogger(__name__)
@@ -138,6 +139,13 @@ class DataDriver(base.DataDriverBase):
     def _health(self):
         return self._storage._health()
 
+    def gc(self):
+        return self._storage.gc()
+
+    @property
+    def outbox_controller(self):
+        return self._storage.outbox_controller
+
     @decorators.lazy_property(write=False)
     def queue_controller(self):
         stages = _get_builtin_entry_points('queue', self._storage,
@@ -157,7 +165,10 @@ class DataDriver(base.DataDriverBase):
                   'require_confirmation':
                   self.conf.notification.require_confirmation,
                   'queue_controller':
-                  self._storage.queue_controller}
+                  self._storage.queue_controller,
+                  'cache': self._storage.cache}
+        if self.conf.notification.use_outbox:
+            kwargs['outbox_controller'] = self._storage.outbox_controller
         stages.extend(_get_storage_pipeline('message', self.conf, **kwargs))
         stages.append(self._storage.message_controller)
         return common.Pipeline(stages)
@@ -175,5 +186,6 @@ class DataDriver(base.DataDriverBase):
         stages = _get_builtin_entry_points('subscription', self._storage,
                                            self.control_driver, self.conf)
         stages.extend(_get_storage_pipeline('subscription', self.conf))
+        stages.append(subscribers.CachePurger(self._storage.cache))
         stages.append(self._storage.subscription_controller)
         return common.Pipeline(stages)
@@ -13,6 +13,7 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import collections
 import heapq
 import itertools
 
@@ -255,6 +256,21 @@ class QueueController(storage.Queue):
             return mqHandler.stats(name, project=project)
         raise errors.QueueDoesNotExist(name, project)
 
+    def _bulk_stats(self, names, project=None):
+        # NOTE: Queues are grouped by pool, so that the stats of the
+        # queues of a pool are read together.
+        pools = collections.OrderedDict()
+        for name in names:
+            target = self._pool_catalog.lookup(name, project)
+            if target:
+                pools.setdefault(target, []).append(name)
+
+        stats = {}
+        for target, pool_names in pools.items():
+            stats.update(target.queue_controller.bulk_stats(
+                pool_names, project=project))
+        return stats
+
 
 class MessageController(storage.Message):
     """Routes operations to a message controller in the appropriate pool.
@@ -14,6 +14,7 @@
 
 from zaqar.storage.redis import claims
 from zaqar.storage.redis import messages
+from zaqar.storage.redis import outbox
 from zaqar.storage.redis import queues
 from zaqar.storage.redis import subscriptions
 
@@ -21,4 +22,5 @@ from zaqar.storage.redis import subscriptions
 QueueController = queues.QueueController
 MessageController = messages.MessageController
 ClaimController = claims.ClaimController
+OutboxController = outbox.OutboxController
 SubscriptionController = subscriptions.SubscriptionController
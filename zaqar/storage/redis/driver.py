@@ -192,7 +192,7 @@ class DataDriver(storage.DataDriverBase):
         # running the GC script on multiple boxes for HA,
         # without having them all attempting to GC at the
         # same moment.
-        self.message_controller.gc()
+        return self.message_controller.gc()
 
     @decorators.lazy_property(write=False)
     def connection(self):
@@ -227,6 +227,15 @@ class DataDriver(storage.DataDriverBase):
         else:
             return controller
 
+    @decorators.lazy_property(write=False)
+    def outbox_controller(self):
+        controller = controllers.OutboxController(self)
+        if (self.conf.profiler.enabled and
+                self.conf.profiler.trace_message_store):
+            return profiler.trace_cls("redis_outbox_controller")(controller)
+        else:
+            return controller
+
 
 class ControlDriver(storage.ControlDriverBase):
 
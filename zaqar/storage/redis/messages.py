@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import functools
+import time
 import uuid
 
+from oslo_log import log as logging
 from oslo_utils import encodeutils
 from oslo_utils import timeutils
 import redis
@@ -26,12 +28,37 @@ from zaqar.storage.redis import models
 from zaqar.storage.redis import scripting
 from zaqar.storage.redis import utils
 
+LOG = logging.getLogger(__name__)
+
 Message = models.Message
 MessageEnvelope = models.MessageEnvelope
 
 
 MSGSET_INDEX_KEY = 'msgset_index'
 
+# NOTE: The score of each message set in the index records the layout
+# of the queue's message ID sets. Message sets created before the
+# unclaimed and claimed sets were introduced have a score of 1, and are
+# migrated the first time they are used, or during garbage collection.
+MSGSET_INDEX_VERSION = 2
+
+# NOTE: Message sets scored by the earliest known expiration time of
+# their messages, used by the GC to visit queues with expired messages
+# first. The score is a lower bound, since claims may extend the
+# lifetime of messages.
+MSGSET_EXPIRY_INDEX_KEY = 'msgset_expiry_index'
+
+# NOTE: Maximum number of message sets each controller remembers as
+# migrated. The set is emptied once full, which only costs a ZSCORE per
+# queue on the next claim or listing.
+MAX_INDEXED_MSGSETS = 10000
+
+# NOTE: Position of the incremental GC, so that each run resumes where
+# the previous one stopped. Fields: q (message set being collected),
+# r (last rank collected in q), e (earliest expiration time seen in q)
+# and i (offset of the next message set to visit in msgset_index).
+GC_CURSOR_KEY = 'gc_cursor'
+
 # The rank counter is an atomic index to rank messages
 # in a FIFO manner.
 MESSAGE_RANK_COUNTER_SUFFIX = 'rank_counter'
@@ -45,6 +72,11 @@ RETRY_POST_TIMEOUT = 10
 # 1-2 milliseconds.
 GC_BATCH_SIZE = 100
 
+# NOTE: Maximum number of messages whose claims have expired to return
+# to the unclaimed set per call. Anything left over is picked up by the
+# next claim or listing request.
+RELEASE_BATCH_SIZE = 1000
+
 
 class MessageController(storage.Message, scripting.Mixin):
     """Implements message resource operations using Redis.
@@ -102,25 +134,146 @@ class MessageController(storage.Message, scripting.Mixin):
     4. Messages rank counter (Redis Hash):
 
         Key: <project_id>.<queue_name>.rank_counter
+
+    5. Unclaimed message id's list (Redis sorted set)
+
+        Subset of the message id's list containing only the messages
+        that are not claimed, sorted by the same ranking. Claiming and
+        listing unclaimed messages page through this set, so they never
+        have to skip over claimed messages.
+
+        Key: <project_id>.<queue_name>.unclaimed
+
+    6. Claimed message id's list (Redis sorted set)
+
+        Contains the id's of claimed messages, sorted by the expiration
+        time of their claim. Messages are moved back to the unclaimed
+        set once their claim expires or is deleted.
+
+        Key: <project_id>.<queue_name>.claimed
     """
 
-    script_names = ['index_messages']
+    script_names = ['index_messages', 'release_messages']
 
     def __init__(self, *args, **kwargs):
         super(MessageController, self).__init__(*args, **kwargs)
         self._client = self.driver.connection
 
+        # NOTE: Message sets known to have unclaimed and claimed sets,
+        # so that the index is only checked once per queue.
+        self._indexed_msgsets = set()
+
+        # NOTE: Time at which the GC may check the next batch of message
+        # IDs, when gc_max_batches_per_second is set.
+        self._gc_next_batch = 0
+
     @decorators.lazy_property(write=False)
     def _queue_ctrl(self):
         return self.driver.queue_controller
 
-    def _index_messages(self, msgset_key, counter_key, message_ids):
+    def _index_messages(self, msgset_key, counter_key, message_ids,
+                        unclaimed_key=None, expires=None):
         # NOTE(kgriffs): A watch on a pipe could also be used to ensure
         # messages are inserted in order, but that would be less efficient.
         func = self._scripts['index_messages']
 
+        keys = [msgset_key, counter_key]
         arguments = [len(message_ids)] + message_ids
-        func(keys=[msgset_key, counter_key], args=arguments)
+
+        if unclaimed_key:
+            keys.append(unclaimed_key)
+
+            if expires is not None:
+                keys.append(MSGSET_EXPIRY_INDEX_KEY)
+                arguments.append(expires)
+
+        func(keys=keys, args=arguments)
+
+    def _release_messages(self, queue, project, now, client=None):
+        """Move messages whose claim has expired to the unclaimed set.
+
+        :param client: Redis client or pipeline to run the script with,
+            defaults to the controller's client.
+        :returns: Number of message IDs removed from the claimed set
+        """
+
+        func = self._scripts['release_messages']
+
+        keys = [utils.msgset_key(queue, project),
+                utils.unclaimed_set_key(queue, project),
+                utils.claimed_set_key(queue, project)]
+
+        return func(keys=keys, args=[now, RELEASE_BATCH_SIZE],
+                    client=client or self._client)
+
+    def _ensure_claim_index(self, queue, project):
+        """Migrate a queue's message set to the current layout if needed."""
+
+        msgset_key = utils.msgset_key(queue, project)
+        if msgset_key in self._indexed_msgsets:
+            return
+
+        # NOTE: If the message set is not in the index, the queue was
+        # deleted; don't add it back.
+        version = self._client.zscore(MSGSET_INDEX_KEY, msgset_key)
+        if version is None:
+            return
+
+        if version < MSGSET_INDEX_VERSION:
+            self._migrate_msgset(queue, project)
+
+        if len(self._indexed_msgsets) >= MAX_INDEXED_MSGSETS:
+            self._indexed_msgsets.clear()
+        self._indexed_msgsets.add(msgset_key)
+
+    def _migrate_msgset(self, queue, project):
+        """Build the unclaimed and claimed sets of a legacy message set.
+
+        Messages are added to one of the two sets according to their
+        current claim. Claims and posts that happen concurrently are
+        reconciled by the claim script, which moves any claimed message
+        it finds in the unclaimed set to the claimed set.
+        """
+
+        client = self._client
+        msgset_key = utils.msgset_key(queue, project)
+        unclaimed_key = utils.unclaimed_set_key(queue, project)
+        claimed_key = utils.claimed_set_key(queue, project)
+
+        now = timeutils.utcnow_ts()
+        offset = 0
+
+        while True:
+            entries = client.zrange(msgset_key, offset,
+                                    offset + GC_BATCH_SIZE - 1,
+                                    withscores=True)
+            if not entries:
+                break
+
+            offset += len(entries)
+
+            with client.pipeline() as pipe:
+                for mid, rank in entries:
+                    pipe.hmget(mid, 'c', 'c.e')
+
+                claims = pipe.execute()
+
+            with client.pipeline() as pipe:
+                for (mid, rank), (claim_id, claim_expires) in zip(entries,
+                                                                  claims):
+                    # NOTE: Expired messages are left to the GC.
+                    if claim_expires is None:
+                        continue
+
+                    claim_expires = int(claim_expires)
+                    if claim_id and claim_expires > now:
+                        pipe.zadd(claimed_key, claim_expires, mid)
+                    else:
+                        pipe.zadd(unclaimed_key, rank, mid)
+
+                pipe.execute()
+
+        client.zadd(MSGSET_INDEX_KEY, MSGSET_INDEX_VERSION, msgset_key)
 
     def _count(self, queue, project):
         """Return total number of messages in a queue.
@@ -132,10 +285,13 @@ class MessageController(storage.Message, scripting.Mixin):
         return self._client.zcard(utils.msgset_key(queue, project))
 
     def _create_msgset(self, queue, project, pipe):
-        pipe.zadd(MSGSET_INDEX_KEY, 1, utils.msgset_key(queue, project))
+        pipe.zadd(MSGSET_INDEX_KEY, MSGSET_INDEX_VERSION,
+                  utils.msgset_key(queue, project))
 
     def _delete_msgset(self, queue, project, pipe):
-        pipe.zrem(MSGSET_INDEX_KEY, utils.msgset_key(queue, project))
+        msgset_key = utils.msgset_key(queue, project)
+        pipe.zrem(MSGSET_INDEX_KEY, msgset_key)
+        pipe.zrem(MSGSET_EXPIRY_INDEX_KEY, msgset_key)
 
     @utils.raises_conn_error
     @utils.retries_on_connection_error
@@ -151,34 +307,11 @@ class MessageController(storage.Message, scripting.Mixin):
         message_ids = client.zrange(msgset_key, 0, -1)
 
         pipe.delete(msgset_key)
+        pipe.delete(utils.unclaimed_set_key(queue, project))
+        pipe.delete(utils.claimed_set_key(queue, project))
         for msg_id in message_ids:
             pipe.delete(msg_id)
 
-    # TODO(prashanthr_): Look for better ways to solve the issue.
-    def _find_first_unclaimed(self, queue, project, limit):
-        """Find the first unclaimed message in the queue."""
-
-        msgset_key = utils.msgset_key(queue, project)
-        now = timeutils.utcnow_ts()
-
-        # TODO(kgriffs): Generalize this paging pattern (DRY)
-        offset = 0
-
-        while True:
-            msg_keys = self._client.zrange(msgset_key, offset,
-                                           offset + limit - 1)
-            if not msg_keys:
-                return None
-
-            offset += len(msg_keys)
-
-            messages = [MessageEnvelope.from_redis(msg_key, self._client)
-                        for msg_key in msg_keys]
-
-            for msg in messages:
-                if msg and not utils.msg_claimed_filter(msg, now):
-                    return msg.id
-
     def _exists(self, message_id):
         """Check if message exists in the Queue."""
         return self._client.exists(message_id)
@@ -235,18 +368,25 @@ class MessageController(storage.Message, scripting.Mixin):
         msgset_key = utils.msgset_key(queue, project)
         client = self._client
 
-        if not marker and not include_claimed:
-            # NOTE(kgriffs): Skip claimed messages at the head
-            # of the queue; otherwise we would just filter them all
-            # out and likely end up with an empty list to return.
-            marker = self._find_first_unclaimed(queue, project, limit)
-            start = client.zrank(msgset_key, marker) or 0
+        if not include_claimed:
+            # NOTE: Page through the unclaimed set, which shares its
+            # ranking with the message set, so that claimed messages
+            # never have to be skipped.
+            self._ensure_claim_index(queue, project)
+            self._release_messages(queue, project, timeutils.utcnow_ts())
+
+            rank = client.zscore(msgset_key, marker) if marker else None
+            start = '-inf' if rank is None else '(%d' % rank
+
+            message_ids = client.zrangebyscore(
+                utils.unclaimed_set_key(queue, project), start, '+inf',
+                start=0, num=limit)
         else:
             rank = client.zrank(msgset_key, marker)
             start = rank + 1 if rank else 0
 
-        message_ids = client.zrange(msgset_key, start,
-                                    start + (limit - 1))
+            message_ids = client.zrange(msgset_key, start,
+                                        start + (limit - 1))
 
         messages = Message.from_redis_bulk(message_ids, client)
 
@@ -285,12 +425,31 @@ class MessageController(storage.Message, scripting.Mixin):
         Not all message data can be automatically expired. This method
         cleans up the remainder.
 
+        When the ``gc_time_budget`` option is set, only as much work as
+        fits in that budget is done, and the next call resumes where
+        this one stopped.
+
         :returns: Number of messages removed
         """
-        claim_ctrl = self.driver.claim_controller
-        client = self._client
+        time_budget = self.driver.redis_conf.gc_time_budget
+        stats = {'removed': 0, 'scanned': 0, 'queues': 0}
+        started = time.time()
 
-        num_removed = 0
+        if time_budget:
+            self._gc_incremental(started + time_budget, stats)
+        else:
+            self._gc_full(stats)
+
+        LOG.info(u'Redis GC removed %(removed)d of %(scanned)d message '
+                 u'IDs scanned in %(queues)d queues in %(duration).3f '
+                 u'seconds.', dict(stats, duration=time.time() - started))
+
+        return stats['removed']
+
+    def _gc_full(self, stats):
+        """Collect every message set in a single pass."""
+
+        client = self._client
         offset_msgsets = 0
 
         while True:
@@ -306,44 +465,164 @@ class MessageController(storage.Message, scripting.Mixin):
 
             for msgset_key in msgset_keys:
                 msgset_key = encodeutils.safe_decode(msgset_key)
+                self._gc_msgset(msgset_key, None, None, stats)
+
+    def _gc_incremental(self, deadline, stats):
+        """Collect message sets until the deadline is reached.
+
+        Message sets whose earliest expiration time has passed are
+        collected first. The remaining time is spent visiting all the
+        message sets in turn, until every one of them has been visited
+        once since the position of the GC last wrapped around.
+        """
+
+        client = self._client
+        cursor = client.hgetall(GC_CURSOR_KEY)
+
+        msgset_key = encodeutils.safe_decode(cursor.get(b'q', b'')) or None
+        rank = _float_or_none(cursor.get(b'r'))
+        min_expires = _float_or_none(cursor.get(b'e'))
+        offset = int(cursor.get(b'i') or 0)
+
+        visited = set()
 
-                # NOTE(kgriffs): Drive the claim controller GC from
-                # here, because we already know the queue and project
-                # scope.
-                queue, project = utils.descope_message_ids_set(msgset_key)
-                claim_ctrl._gc(queue, project)
+        while time.time() < deadline:
+            if msgset_key is None:
+                msgset_key, offset = self._gc_next_msgset(offset, visited)
+                if msgset_key is None:
+                    break
 
-                offset_mids = 0
+                rank = min_expires = None
 
-                while True:
-                    # NOTE(kgriffs): Look up each message in the message set,
-                    # see if it has expired, and if so, remove it from msgset.
-                    mids = client.zrange(msgset_key, offset_mids,
-                                         offset_mids + GC_BATCH_SIZE - 1)
+            rank, min_expires, done = self._gc_msgset(
+                msgset_key, rank, min_expires, stats, deadline)
 
-                    if not mids:
-                        break
+            if done:
+                visited.add(msgset_key)
+                msgset_key = None
 
-                    offset_mids += len(mids)
+        client.hmset(GC_CURSOR_KEY, {
+            'q': msgset_key or '',
+            'r': '' if rank is None else rank,
+            'e': '' if min_expires is None else min_expires,
+            'i': offset,
+        })
 
-                    # NOTE(kgriffs): If redis expired the message, it will
-                    # not exist, so all we have to do is remove mid from
-                    # the msgset collection.
-                    with client.pipeline() as pipe:
-                        for mid in mids:
-                            pipe.exists(mid)
+    def _gc_next_msgset(self, offset, visited):
+        """Pick the next message set for the incremental GC.
 
-                        mid_exists_flags = pipe.execute()
+        :returns: (msgset_key, offset), where msgset_key is None if
+            there is nothing left to collect during this run.
+        """
+
+        client = self._client
+        now = timeutils.utcnow_ts()
+
+        due_keys = client.zrangebyscore(MSGSET_EXPIRY_INDEX_KEY,
+                                        '-inf', now, start=0,
+                                        num=len(visited) + 1)
+        for msgset_key in due_keys:
+            msgset_key = encodeutils.safe_decode(msgset_key)
+            if msgset_key not in visited:
+                return msgset_key, offset
+
+        msgset_keys = client.zrange(MSGSET_INDEX_KEY, offset, offset)
+        if not msgset_keys:
+            # NOTE: Wrapped around; start over with the next run.
+            return None, 0
+
+        return encodeutils.safe_decode(msgset_keys[0]), offset + 1
+
+    def _gc_msgset(self, msgset_key, rank, min_expires, stats,
+                   deadline=None):
+        """Remove the IDs of expired messages from a message set.
+
+        :param rank: Rank of the last message collected so far, or
+            None to start from the head of the set.
+        :param min_expires: Earliest expiration time seen so far.
+        :param deadline: If given, stop when this time is reached.
+        :returns: (rank, min_expires, done), where done is True once
+            the end of the set has been reached.
+        """
+
+        client = self._client
+        queue, project = utils.descope_message_ids_set(msgset_key)
+        unclaimed_key = utils.unclaimed_set_key(queue, project)
+        claimed_key = utils.claimed_set_key(queue, project)
+
+        if rank is None:
+            # NOTE(kgriffs): Drive the claim controller GC from
+            # here, because we already know the queue and project
+            # scope.
+            self.driver.claim_controller._gc(queue, project)
+            self._ensure_claim_index(queue, project)
+
+        while deadline is None or time.time() < deadline:
+            self._gc_throttle()
+
+            # NOTE: Page by rank rather than by offset, so that removing
+            # IDs does not cause others to be skipped.
+            start = '-inf' if rank is None else '(%d' % rank
+            entries = client.zrangebyscore(msgset_key, start, '+inf',
+                                           start=0, num=GC_BATCH_SIZE,
+                                           withscores=True)
+            if not entries:
+                self._update_expiry_index(msgset_key, min_expires)
+                return None, None, True
+
+            # NOTE(kgriffs): If redis expired the message, it will
+            # not exist, so all we have to do is remove mid from
+            # the msgset collection.
+            with client.pipeline() as pipe:
+                for mid, __ in entries:
+                    pipe.hget(mid, 'e')
+
+                expires_values = pipe.execute()
+
+            with client.pipeline() as pipe:
+                for (mid, __), expires in zip(entries, expires_values):
+                    if expires is None:
+                        pipe.zrem(msgset_key, mid)
+                        pipe.zrem(unclaimed_key, mid)
+                        pipe.zrem(claimed_key, mid)
+                        stats['removed'] += 1
+                    elif min_expires is None or float(expires) < min_expires:
+                        min_expires = float(expires)
+
+                pipe.execute()
+
+            stats['scanned'] += len(entries)
+            rank = entries[-1][1]
+
+        return rank, min_expires, False
+
+    def _gc_throttle(self):
+        """Sleep as needed to honor gc_max_batches_per_second."""
 
-                    with client.pipeline() as pipe:
-                        for mid, exists in zip(mids, mid_exists_flags):
-                            if not exists:
-                                pipe.zrem(msgset_key, mid)
-                                num_removed += 1
+        max_rate = self.driver.redis_conf.gc_max_batches_per_second
+        if not max_rate:
+            return
+
+        now = time.time()
+        if now < self._gc_next_batch:
+            time.sleep(self._gc_next_batch - now)
+            now = self._gc_next_batch
 
-                        pipe.execute()
+        self._gc_next_batch = now + 1.0 / max_rate
 
-        return num_removed
+    def _update_expiry_index(self, msgset_key, min_expires):
+        # NOTE: A message posted while the set was being collected may
+        # expire before min_expires, in which case the queue is visited
+        # later than it could have been, but it is still visited when
+        # the incremental GC goes through all the message sets.
+        if min_expires is None:
+            self._client.zrem(MSGSET_EXPIRY_INDEX_KEY, msgset_key)
+        else:
+            # NOTE: Make sure the queue is not due again right away,
+            # in case a message outlives the time recorded in it.
+            now = timeutils.utcnow_ts()
+            self._client.zadd(MSGSET_EXPIRY_INDEX_KEY,
+                              max(min_expires, now + 1), msgset_key)
 
     @utils.raises_conn_error
     @utils.retries_on_connection_error
@@ -411,10 +690,12 @@ class MessageController(storage.Message, scripting.Mixin):
     @utils.retries_on_connection_error
     def post(self, queue, messages, client_uuid, project=None):
         msgset_key = utils.msgset_key(queue, project)
+        unclaimed_key = utils.unclaimed_set_key(queue, project)
         counter_key = utils.scope_queue_index(queue, project,
                                               MESSAGE_RANK_COUNTER_SUFFIX)
 
         message_ids = []
+        expires = None
         now = timeutils.utcnow_ts()
 
         with self._client.pipeline() as pipe:
@@ -433,6 +714,9 @@ class MessageController(storage.Message, scripting.Mixin):
                 prepared_msg.to_redis(pipe)
                 message_ids.append(prepared_msg.id)
 
+                if expires is None or prepared_msg.expires < expires:
+                    expires = prepared_msg.expires
+
             pipe.execute()
 
         # NOTE(kgriffs): If this call fails, we will return
@@ -440,7 +724,8 @@ class MessageController(storage.Message, scripting.Mixin):
         # orphaned, but Redis will remove them when they
         # expire, so we will just pretend they don't exist
         # in that case.
-        self._index_messages(msgset_key, counter_key, message_ids)
+        self._index_messages(msgset_key, counter_key, message_ids,
+                             unclaimed_key, expires)
 
         return message_ids
 
@@ -487,6 +772,8 @@ class MessageController(storage.Message, scripting.Mixin):
         with self._client.pipeline() as pipe:
             pipe.delete(message_id)
             pipe.zrem(msgset_key, message_id)
+            pipe.zrem(utils.unclaimed_set_key(queue, project), message_id)
+            pipe.zrem(utils.claimed_set_key(queue, project), message_id)
 
             if is_claimed:
                 claim_ctrl._del_message(queue, project, msg_claim['id'],
@@ -502,6 +789,8 @@ class MessageController(storage.Message, scripting.Mixin):
             return
 
         msgset_key = utils.msgset_key(queue, project)
+        unclaimed_key = utils.unclaimed_set_key(queue, project)
+        claimed_key = utils.claimed_set_key(queue, project)
 
         with self._client.pipeline() as pipe:
             for mid in message_ids:
@@ -510,6 +799,8 @@ class MessageController(storage.Message, scripting.Mixin):
 
                 pipe.delete(mid)
                 pipe.zrem(msgset_key, mid)
+                pipe.zrem(unclaimed_key, mid)
+                pipe.zrem(claimed_key, mid)
 
                 msg_claim = self._get_claim(mid)
                 if msg_claim is not None:
@@ -537,6 +828,10 @@ class MessageController(storage.Message, scripting.Mixin):
         return messages
 
 
+def _float_or_none(value):
+    return float(value) if value else None
+
+
 def _filter_messages(messages, filters, to_basic, marker):
     """Create a filtering iterator over a list of messages.
 
@@ -602,7 +897,13 @@ class MessageQueueHandler(object):
         total = self._message_ctrl._count(name, project)
 
         if total:
-            claimed = self._claim_ctrl._count_messages(name, project)
+            # NOTE: The claimed set is scored by claim expiration, so
+            # counting the messages whose claim is still active doesn't
+            # depend on the number of claims.
+            self._message_ctrl._ensure_claim_index(name, project)
+            now = timeutils.utcnow_ts()
+            claimed = min(total, self._client.zcount(
+                utils.claimed_set_key(name, project), '(%s' % now, '+inf'))
         else:
             claimed = 0
 
@@ -623,3 +924,56 @@ class MessageQueueHandler(object):
                 message_stats['oldest'] = oldest
 
         return {'messages': message_stats}
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def bulk_stats(self, names, project=None):
+        names = self._queue_ctrl._existing(names, project=project)
+
+        for name in names:
+            self._message_ctrl._ensure_claim_index(name, project)
+
+        # NOTE: The counts and the IDs of the oldest and newest
+        # messages of every queue are read in a single round trip,
+        # then the oldest and newest messages in a second one.
+        now = timeutils.utcnow_ts()
+        with self._client.pipeline() as pipe:
+            for name in names:
+                msgset_key = utils.msgset_key(name, project)
+                pipe.zcard(msgset_key)
+                pipe.zcount(utils.claimed_set_key(name, project),
+                            '(%s' % now, '+inf')
+                pipe.zrange(msgset_key, 0, 0)
+                pipe.zrevrange(msgset_key, 0, 0)
+
+            results = pipe.execute()
+
+        counts = [results[i:i + 4] for i in range(0, len(results), 4)]
+        message_ids = set()
+        for total, claimed, oldest, newest in counts:
+            message_ids.update(oldest + newest)
+
+        message_ids = list(message_ids)
+        messages = dict(zip(message_ids, Message.from_redis_bulk(
+            message_ids, self._client)))
+
+        stats = {}
+        for name, (total, claimed, oldest, newest) in zip(names, counts):
+            claimed = min(total, claimed)
+            message_stats = {
+                'claimed': claimed,
+                'free': total - claimed,
+                'total': total,
+            }
+
+            oldest = oldest and messages[oldest[0]]
+            newest = newest and messages[newest[0]]
+            if total and oldest and newest:
+                message_stats['newest'] = newest.to_basic(
+                    now, include_created=True)
+                message_stats['oldest'] = oldest.to_basic(
+                    now, include_created=True)
+
+            stats[name] = {'messages': message_stats}
+
+        return stats
@@ -67,7 +67,22 @@ _COMMON_REDIS_OPTIONS = (
 )
 
 MANAGEMENT_REDIS_OPTIONS = _COMMON_REDIS_OPTIONS
-MESSAGE_REDIS_OPTIONS = _COMMON_REDIS_OPTIONS
+MESSAGE_REDIS_OPTIONS = _COMMON_REDIS_OPTIONS + (
+    cfg.FloatOpt('gc_time_budget', default=0, min=0,
+                 help=('Maximum number of seconds spent by a single run '
+                       'of the garbage collector. When set, each run '
+                       'resumes where the previous one stopped, starting '
+                       'with queues known to contain expired messages, so '
+                       'that the GC can be run frequently with a small, '
+                       'predictable impact on Redis. The default, 0, '
+                       'collects every queue in a single run.')),
+
+    cfg.FloatOpt('gc_max_batches_per_second', default=0, min=0,
+                 help=('Maximum number of batches of message IDs checked '
+                       'per second by the garbage collector, to limit the '
+                       'load it puts on Redis. Each batch checks up to 100 '
+                       'message IDs. The default, 0, means no limit.')),
+)
 
 MANAGEMENT_REDIS_GROUP = 'drivers:management_store:redis'
 MESSAGE_REDIS_GROUP = 'drivers:message_store:redis'
@@ -0,0 +1,141 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+
+import msgpack
+from oslo_utils import encodeutils
+from oslo_utils import timeutils
+from oslo_utils import uuidutils
+
+from zaqar import storage
+from zaqar.storage.redis import scripting
+from zaqar.storage.redis import utils
+
+OUTBOX_DUE_KEY = 'outbox'
+OUTBOX_ENTRIES_KEY = 'outbox.entries'
+OUTBOX_ATTEMPTS_KEY = 'outbox.attempts'
+
+
+class OutboxController(storage.Outbox, scripting.Mixin):
+    """Implements the notification outbox using Redis.
+
+    Outbox entries are stored as follows:
+
+    1. Due dates (Redis sorted set)
+
+        Set of the IDs of all entries, scored by the time at which they
+        are due for delivery. Leasing an entry pushes its due date into
+        the future.
+
+        Key: outbox
+
+    2. Entries (Redis hash)
+
+        Maps the ID of each entry to the packed entry.
+
+        Key: outbox.entries
+
+    3. Attempts (Redis hash)
+
+        Maps the ID of each entry to its number of failed attempts, for
+        the entries that were deferred at least once.
+
+        Key: outbox.attempts
+    """
+
+    script_names = ['lease_outbox']
+
+    def __init__(self, *args, **kwargs):
+        super(OutboxController, self).__init__(*args, **kwargs)
+        self._client = self.driver.connection
+        self._packer = msgpack.Packer(encoding='utf-8',
+                                      use_bin_type=True).pack
+        self._unpacker = functools.partial(msgpack.unpackb, encoding='utf-8')
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def put(self, queue, subscription, messages, project=None,
+            retry_policy=None):
+        entry_id = uuidutils.generate_uuid()
+        entry = {
+            'project': project,
+            'queue': queue,
+            'subscription': subscription,
+            'messages': messages,
+            'retry_policy': retry_policy or {},
+        }
+
+        with self._client.pipeline() as pipe:
+            pipe.hset(OUTBOX_ENTRIES_KEY, entry_id, self._packer(entry))
+            pipe.zadd(OUTBOX_DUE_KEY, timeutils.utcnow_ts(), entry_id)
+            pipe.execute()
+
+        return entry_id
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def lease(self, limit, ttl):
+        now = timeutils.utcnow_ts()
+        entry_ids = self._scripts['lease_outbox'](keys=[OUTBOX_DUE_KEY],
+                                                  args=[now, limit, ttl])
+        if not entry_ids:
+            return []
+
+        with self._client.pipeline() as pipe:
+            pipe.hmget(OUTBOX_ENTRIES_KEY, entry_ids)
+            pipe.hmget(OUTBOX_ATTEMPTS_KEY, entry_ids)
+            packed_entries, attempts = pipe.execute()
+
+        entries = []
+        orphans = []
+        for entry_id, packed, count in zip(entry_ids, packed_entries,
+                                           attempts):
+            # NOTE: The entry was deleted by another worker after its
+            # lease expired, but before it was deferred again.
+            if packed is None:
+                orphans.append(entry_id)
+                continue
+
+            entry = self._unpacker(packed)
+            entry['id'] = encodeutils.safe_decode(entry_id)
+            entry['attempts'] = int(count or 0)
+            entries.append(entry)
+
+        if orphans:
+            self._client.zrem(OUTBOX_DUE_KEY, *orphans)
+
+        return entries
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def defer(self, entry_id, delay):
+        with self._client.pipeline() as pipe:
+            pipe.hincrby(OUTBOX_ATTEMPTS_KEY, entry_id, 1)
+            pipe.zadd(OUTBOX_DUE_KEY, timeutils.utcnow_ts() + delay,
+                      entry_id)
+            pipe.execute()
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def delete(self, entry_id):
+        with self._client.pipeline() as pipe:
+            pipe.zrem(OUTBOX_DUE_KEY, entry_id)
+            pipe.hdel(OUTBOX_ENTRIES_KEY, entry_id)
+            pipe.hdel(OUTBOX_ATTEMPTS_KEY, entry_id)
+            pipe.execute()
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def depth(self):
+        return self._client.zcard(OUTBOX_DUE_KEY)
@@ -150,6 +150,22 @@ class QueueController(storage.Queue):
 
         return self._client.zrank(qset_key, queue_key) is not None
 
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def _existing(self, names, project=None):
+        """Returns the names of the given queues that exist.
+
+        All the queues are looked up in a single round trip.
+        """
+        qset_key = utils.scope_queue_name(QUEUES_SET_STORE_NAME, project)
+
+        with self._client.pipeline() as pipe:
+            for name in names:
+                pipe.zrank(qset_key, utils.scope_queue_name(name, project))
+            ranks = pipe.execute()
+
+        return [name for name, rank in zip(names, ranks) if rank is not None]
+
     @utils.raises_conn_error
     @utils.retries_on_connection_error
     def set_metadata(self, name, metadata, project=None):
@@ -188,3 +204,8 @@ class QueueController(storage.Queue):
     @utils.retries_on_connection_error
     def _stats(self, name, project=None):
         pass
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def _bulk_stats(self, names, project=None):
+        pass
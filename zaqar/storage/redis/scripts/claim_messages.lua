@@ -17,8 +17,11 @@ limitations under the License.
 
 --]]
 
+
 -- Read params
 local msgset_key = KEYS[1]
+local unclaimed_key = KEYS[2]
+local claimed_key = KEYS[3]
 
 local now = tonumber(ARGV[1])
 local limit = tonumber(ARGV[2])
@@ -30,15 +33,25 @@ local msg_expires = tonumber(ARGV[6])
 -- Scan for up to 'limit' unclaimed messages
 local BATCH_SIZE = 100
 
+-- NOTE: Keep the number of arguments passed to ZADD/ZREM well
+-- below the Lua stack limit.
+local MAX_ARGS = 1000
+
+local function zrem_all(key, members)
+    for i = 1, #members, MAX_ARGS do
+        redis.call('ZREM', key,
+                   unpack(members, i, math.min(i + MAX_ARGS - 1, #members)))
+    end
+end
+
 local start = 0
 local claimed_msgs = {}
 local msg_ids_to_cleanup = {}
-
-local found_unclaimed = false
+local msg_ids_to_move = {}
 
 while (#claimed_msgs < limit) do
     local stop = (start + BATCH_SIZE - 1)
-    local msg_ids = redis.call('ZRANGE', msgset_key, start, stop)
+    local msg_ids = redis.call('ZRANGE', unclaimed_key, start, stop)
 
     if (#msg_ids == 0) then
         break
@@ -46,51 +59,42 @@ while (#claimed_msgs < limit) do
 
     start = start + BATCH_SIZE
 
-    -- TODO(kgriffs): Try moving claimed IDs to a different set
-    -- to avoid scanning through already-claimed messages.
+    -- NOTE: Claimed messages are kept in a separate set, so the
+    -- only IDs that have to be skipped here are those of delayed
+    -- messages and of messages that already expired.
     for i, mid in ipairs(msg_ids) do
-        -- NOTE(kgriffs): Since execution of this script can not
-        -- happen in parallel, once we find the first unclaimed
-        -- message, the remaining messages will always be
-        -- unclaimed as well.
-
-        if not found_unclaimed then
-            local msg = redis.call('HMGET', mid, 'c', 'c.e', 'd')
-            if msg[1] == false and msg[2] == false then
-                -- NOTE(Eva-i): It means the message expired and does not
-                -- actually exist anymore, we must later garbage collect it's
-                -- ID from the set and move on.
-                msg_ids_to_cleanup[#msg_ids_to_cleanup + 1] = mid
-            elseif (msg[1] == '' or tonumber(msg[2]) <= now)
-                and tonumber(msg[3]) <= now then
-                -- NOTE(cdyangzhenyu): If the message's delay time has not
-                -- expired, the message can not be claimed.
-                found_unclaimed = true
-            end
-        end
-
-        if found_unclaimed then
-            -- Found an unclaimed message, so claim it.
-            local msg_expires_prev = redis.call('HGET', mid, 'e')
-            if msg_expires_prev ~= false then
-                -- NOTE(Eva-i): Condition above means the message is not
-                -- expired and we really can claim it.
+        local msg = redis.call('HMGET', mid, 'c', 'c.e', 'd', 'e')
+
+        if msg[4] == false then
+            -- NOTE(Eva-i): It means the message expired and does not
+            -- actually exist anymore, we must later garbage collect it's
+            -- ID from the set and move on.
+            msg_ids_to_cleanup[#msg_ids_to_cleanup + 1] = mid
+        elseif msg[1] ~= '' and tonumber(msg[2]) > now then
+            -- NOTE: The message is claimed but was not indexed as
+            -- such, e.g. because it was moved here from another queue
+            -- or written before the claimed set existed. Index it now.
+            redis.call('ZADD', claimed_key, msg[2], mid)
+            msg_ids_to_move[#msg_ids_to_move + 1] = mid
+        elseif msg[3] == false or tonumber(msg[3]) <= now then
+            -- NOTE(cdyangzhenyu): If the message's delay time has not
+            -- expired, the message can not be claimed.
+            redis.call('HMSET', mid,
+                       'c', claim_id,
+                       'c.e', claim_expires)
+
+            -- Will the message expire early?
+            if tonumber(msg[4]) < claim_expires then
                 redis.call('HMSET', mid,
-                           'c', claim_id,
-                           'c.e', claim_expires)
-
-                -- Will the message expire early?
-                if tonumber(msg_expires_prev) < claim_expires then
-                    redis.call('HMSET', mid,
-                               't', msg_ttl,
-                               'e', msg_expires)
-                end
+                           't', msg_ttl,
+                           'e', msg_expires)
+            end
 
-                claimed_msgs[#claimed_msgs + 1] = mid
+            redis.call('ZADD', claimed_key, claim_expires, mid)
+            claimed_msgs[#claimed_msgs + 1] = mid
 
-                if (#claimed_msgs == limit) then
-                    break
-                end
+            if (#claimed_msgs == limit) then
+                break
             end
         end
     end
@@ -98,7 +102,19 @@ end
 
 if (#msg_ids_to_cleanup ~= 0) then
     -- Garbage collect expired message IDs stored in msgset_key.
-    redis.call('ZREM', msgset_key, unpack(msg_ids_to_cleanup))
+    zrem_all(msgset_key, msg_ids_to_cleanup)
+    zrem_all(unclaimed_key, msg_ids_to_cleanup)
+end
+
+-- NOTE: The unclaimed set is only modified once scanning is done,
+-- since removing members while paging through it would shift the
+-- offsets used above.
+if (#claimed_msgs ~= 0) then
+    zrem_all(unclaimed_key, claimed_msgs)
+end
+
+if (#msg_ids_to_move ~= 0) then
+    zrem_all(unclaimed_key, msg_ids_to_move)
 end
 
 return claimed_msgs
@@ -20,6 +20,8 @@ limitations under the License.
 -- Read params
 local msgset_key = KEYS[1]
 local counter_key = KEYS[2]
+local unclaimed_key = KEYS[3]
+local expiry_index_key = KEYS[4]
 
 local num_message_ids = tonumber(ARGV[1])
 
@@ -35,5 +37,23 @@ end
 
 redis.call(unpack(zadd_args))
 
+-- New messages are unclaimed, so index them there as well, using
+-- the same ranks so that FIFO order is preserved.
+if unclaimed_key then
+    zadd_args[2] = unclaimed_key
+    redis.call(unpack(zadd_args))
+end
+
+-- Keep track of the earliest expiration time of the messages in the
+-- queue, so that the GC can visit queues with expired messages first.
+if expiry_index_key then
+    local expires = tonumber(ARGV[num_message_ids + 2])
+    local current = redis.call('ZSCORE', expiry_index_key, msgset_key)
+
+    if (not current) or (tonumber(current) > expires) then
+        redis.call('ZADD', expiry_index_key, expires, msgset_key)
+    end
+end
+
 -- Set next rank value
 return redis.call('SET', counter_key, rank_counter + num_message_ids)
@@ -0,0 +1,34 @@
+--[[
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+--]]
+
+-- Read params
+local due_key = KEYS[1]
+
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+
+-- Push the due date of the oldest due entries into the future, so
+-- that no other worker leases them until the lease expires.
+local entry_ids = redis.call('ZRANGEBYSCORE', due_key, '-inf', now,
+                             'LIMIT', 0, limit)
+
+for i, entry_id in ipairs(entry_ids) do
+    redis.call('ZADD', due_key, now + ttl, entry_id)
+end
+
+return entry_ids
@@ -0,0 +1,51 @@
+--[[
+
+Copyright (c) 2014 Rackspace Hosting, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+--]]
+
+
+-- Read params
+local msgset_key = KEYS[1]
+local unclaimed_key = KEYS[2]
+local claimed_key = KEYS[3]
+
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+
+-- NOTE: The claimed set is scored by claim expiration time, so
+-- the messages whose claims have expired (or were released by
+-- deleting the claim) are always at its head.
+local msg_ids = redis.call('ZRANGEBYSCORE', claimed_key, '-inf', now,
+                           'LIMIT', 0, limit)
+
+if (#msg_ids == 0) then
+    return 0
+end
+
+for i, mid in ipairs(msg_ids) do
+    -- NOTE: Put the message back into the unclaimed set with its
+    -- original rank, unless it was deleted or has expired in the
+    -- meantime.
+    local rank = redis.call('ZSCORE', msgset_key, mid)
+    if rank and redis.call('EXISTS', mid) == 1 then
+        redis.call('ZADD', unclaimed_key, rank, mid)
+    end
+end
+
+redis.call('ZREM', claimed_key, unpack(msg_ids))
+
+return #msg_ids
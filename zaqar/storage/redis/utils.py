@@ -27,6 +27,8 @@ from zaqar.storage import errors
 
 LOG = logging.getLogger(__name__)
 MESSAGE_IDS_SUFFIX = 'messages'
+UNCLAIMED_IDS_SUFFIX = 'unclaimed'
+CLAIMED_IDS_SUFFIX = 'claimed'
 SUBSCRIPTION_IDS_SUFFIX = 'subscriptions'
 
 
@@ -131,6 +133,14 @@ def msgset_key(queue, project=None):
     return scope_message_ids_set(queue, project, MESSAGE_IDS_SUFFIX)
 
 
+def unclaimed_set_key(queue, project=None):
+    return scope_message_ids_set(queue, project, UNCLAIMED_IDS_SUFFIX)
+
+
+def claimed_set_key(queue, project=None):
+    return scope_message_ids_set(queue, project, CLAIMED_IDS_SUFFIX)
+
+
 def subset_key(queue, project=None):
     return scope_subscription_ids_set(queue, project, SUBSCRIPTION_IDS_SUFFIX)
 
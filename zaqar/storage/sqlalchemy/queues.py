@@ -133,3 +133,6 @@ class QueueController(storage.Queue):
 
     def _stats(self, name, project):
         pass
+
+    def _bulk_stats(self, names, project):
+        pass
@@ -33,6 +33,7 @@ class ClaimController(storage.Claim):
     def __init__(self, *args, **kwargs):
         super(ClaimController, self).__init__(*args, **kwargs)
         self._client = self.driver.connection
+        self._executor = self.driver.executor
 
     @decorators.lazy_property(write=False)
     def _queue_ctrl(self):
@@ -63,6 +64,23 @@ class ClaimController(storage.Claim):
             'ttl': int(headers['x-delete-at']) - math.floor(now),
         }
 
+    def _active_claims(self, queue, project=None):
+        """Returns a function telling whether a claim is still active.
+
+        Each claim is looked up at most once by the returned function,
+        which is meant to be used while serving a single request.
+        """
+        claims = {}
+
+        def is_active(claim_id):
+            if claim_id not in claims:
+                claim_obj = self._get(queue, claim_id, project)
+                claims[claim_id] = (claim_obj is not None and
+                                    claim_obj['ttl'] > 0)
+            return claims[claim_id]
+
+        return is_active
+
     def get(self, queue, claim_id, project=None):
         message_ctrl = self.driver.message_controller
         now = timeutils.utcnow_ts(True)
@@ -108,10 +126,13 @@ class ClaimController(storage.Claim):
 
         messages, marker = message_ctrl._list(queue, project, limit=limit,
                                               include_claimed=False,
-                                              include_delayed=include_delayed)
+                                              include_delayed=include_delayed,
+                                              with_container=True)
+
+        now = timeutils.utcnow_ts()
 
-        claimed = []
-        for msg in messages:
+        def claim(msg):
+            container = msg.pop('container')
             claim_count = msg.get('claim_count', 0)
             md5 = hashlib.md5()
             md5.update(
@@ -140,6 +161,7 @@ class ClaimController(storage.Claim):
                     if dlq_ttl:
                         msg_ttl = dlq_ttl
 
+            expires = now + msg_ttl
             content = jsonutils.dumps(
                 {'body': msg['body'], 'claim_id': claim_id,
                  'ttl': msg_ttl,
@@ -149,37 +171,44 @@ class ClaimController(storage.Claim):
                 dead_letter_queue = queue_meta.get("_dead_letter_queue")
                 utils._put_or_create_container(
                     self._client,
-                    utils._message_container(dead_letter_queue, project),
+                    message_ctrl._message_bucket(dead_letter_queue, project,
+                                                 msg['id']),
                     msg['id'],
                     content,
-                    content_type='application/json',
+                    content_type=utils._message_content_type(
+                        claim_id, expires),
                     headers={'x-object-meta-clientid': msg['client_uuid'],
                              'if-match': md5,
                              'x-object-meta-claimid': claim_id,
-                             'x-delete-after': msg_ttl})
+                             'x-delete-at': expires})
 
                 message_ctrl._delete(queue, msg['id'], project)
+                return None
 
             else:
                 try:
                     self._client.put_object(
-                        utils._message_container(queue, project),
+                        container,
                         msg['id'],
                         content,
-                        content_type='application/json',
+                        content_type=utils._message_content_type(
+                            claim_id, expires),
                         headers={'x-object-meta-clientid': msg['client_uuid'],
                                  'if-match': md5,
                                  'x-object-meta-claimid': claim_id,
-                                 'x-delete-after': msg_ttl})
+                                 'x-delete-at': expires})
                 except swiftclient.ClientException as exc:
                     if exc.http_status == 412:
-                        continue
+                        return None
                     raise
                 else:
                     msg['claim_id'] = claim_id
                     msg['ttl'] = msg_ttl
                     msg['claim_count'] = claim_count
-                    claimed.append(msg)
+                    return msg
+
+        claimed = [msg for msg in utils._map(self._executor, claim, messages)
+                   if msg is not None]
 
         utils._put_or_create_container(
             self._client,
@@ -214,12 +243,13 @@ class ClaimController(storage.Claim):
             header, obj = self._client.get_object(
                 utils._claim_container(queue, project),
                 claim_id)
-            for msg_id in jsonutils.loads(obj):
+
+            def release(msg_id):
                 try:
-                    headers, msg = message_ctrl._find_message(queue, msg_id,
-                                                              project)
+                    container, headers, msg = message_ctrl._locate_message(
+                        queue, msg_id, project)
                 except errors.MessageDoesNotExist:
-                    continue
+                    return
                 md5 = hashlib.md5()
                 md5.update(msg)
                 md5 = md5.hexdigest()
@@ -228,14 +258,16 @@ class ClaimController(storage.Claim):
                     {'body': msg['body'], 'claim_id': None, 'ttl': msg['ttl']})
                 client_id = headers['x-object-meta-clientid']
                 self._client.put_object(
-                    utils._message_container(queue, project),
+                    container,
                     msg_id,
                     content,
-                    content_type='application/json',
+                    content_type=utils._message_content_type(
+                        None, int(headers['x-delete-at'])),
                     headers={'x-object-meta-clientid': client_id,
                              'if-match': md5,
                              'x-delete-at': headers['x-delete-at']})
 
+            utils._map(self._executor, release, jsonutils.loads(obj))
             self._client.delete_object(
                 utils._claim_container(queue, project),
                 claim_id)
@@ -12,7 +12,10 @@
 # limitations under the License.
 
 import logging
+
+import futurist
 from osprofiler import profiler
+from six.moves import queue
 from six.moves import urllib
 
 from keystoneauth1.identity import generic
@@ -35,6 +38,14 @@ class DataDriver(storage.DataDriverBase):
     def __init__(self, conf, cache, control_driver):
         super(DataDriver, self).__init__(conf, cache, control_driver)
         self.swift_conf = self.conf[options.MESSAGE_SWIFT_GROUP]
+        # NOTE: The pool is shared by all the operations of the driver,
+        # so max_concurrency bounds the object requests of the whole
+        # process, not those of each operation.
+        if self.swift_conf.max_concurrency > 1:
+            self.executor = futurist.ThreadPoolExecutor(
+                max_workers=self.swift_conf.max_concurrency)
+        else:
+            self.executor = futurist.SynchronousExecutor()
         if not self.conf.debug:
             # Reduce swiftclient logging, in particular to remove 404s
             logging.getLogger("swiftclient").setLevel(logging.WARNING)
@@ -89,23 +100,28 @@ class DataDriver(storage.DataDriverBase):
     def _health(self):
         raise NotImplementedError("No health checks")
 
+    def gc(self):
+        return self.message_controller.gc()
+
     def close(self):
-        pass
+        self.executor.shutdown()
 
 
 class _ClientWrapper(object):
     """Wrapper around swiftclient.Connection.
 
     This wraps swiftclient.Connection to give the same API, but provide a
-    thread-safe alternative with a different object for every method call. It
-    maintains performance by managing authentication itself, and passing the
-    token afterwards.
+    thread-safe alternative where every method call gets a connection of its
+    own. It maintains performance by managing authentication itself, and
+    passing the token afterwards, and by keeping idle connections in a pool
+    so that they are reused rather than opened for every call.
     """
 
     def __init__(self, conf):
         self.conf = conf
         self.parsed_url = urllib.parse.urlparse(conf.uri)
         self.session = None
+        self._pool = queue.LifoQueue(maxsize=conf.connection_pool_size)
 
     def _init_auth(self):
         auth = generic.Password(
@@ -119,9 +135,29 @@ class _ClientWrapper(object):
             auth_url=self.conf.auth_url)
         self.session = keystone_session.Session(auth=auth)
 
+    def _get_client(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return swiftclient.Connection(session=self.session,
+                                          insecure=self.conf.insecure)
+
+    def _put_client(self, client):
+        try:
+            self._pool.put_nowait(client)
+        except queue.Full:
+            client.close()
+
     def __getattr__(self, attr):
+        method = getattr(swiftclient.Connection, attr)
         if self.session is None:
             self._init_auth()
-        client = swiftclient.Connection(session=self.session,
-                                        insecure=self.conf.insecure)
-        return getattr(client, attr)
+
+        def call(*args, **kwargs):
+            client = self._get_client()
+            try:
+                return method(client, *args, **kwargs)
+            finally:
+                self._put_client(client)
+
+        return call
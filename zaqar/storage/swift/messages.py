@@ -11,11 +11,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
 import datetime
 import functools
 import uuid
 
+from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 import swiftclient
@@ -25,6 +25,26 @@ from zaqar import storage
 from zaqar.storage import errors
 from zaqar.storage.swift import utils
 
+LOG = logging.getLogger(__name__)
+
+_CONTAINERS_CACHE_PREFIX = 'swift.messagecontroller:'
+
+# NOTE: The containers of a queue are cached for a short while only,
+# since buckets created in the meantime are found by their start time.
+# The time account listings take to show new buckets is assumed to
+# stay below the same duration.
+_CONTAINERS_CACHE_TTL = 30
+
+# NOTE: Number of objects listed per request after the first listing
+# of a container didn't yield enough messages, which happens when it
+# lists mostly claimed or expired messages.
+_LISTING_PAGE_SIZE = 1000
+
+
+def _containers_key(queue, project=None):
+    return (_CONTAINERS_CACHE_PREFIX + 'containers:' + str(project) + '/' +
+            queue)
+
 
 class MessageController(storage.Message):
     """Implements message resource operations with swift backend
@@ -41,28 +61,150 @@ class MessageController(storage.Message):
        +--------------+-----------------------------------------+
        | Project name | Container name prefix                   |
        +--------------+-----------------------------------------+
-       | Created time | Object Creation Time                    |
+       | Created time | Object Creation Time, Msg UUID (version |
+       |              | 1) timestamp                            |
        +--------------+-----------------------------------------+
        | Msg Body     | Object content 'body'                   |
        +--------------+-----------------------------------------+
        | Client ID    | Object header 'ClientID'                |
        +--------------+-----------------------------------------+
-       | Claim ID     | Object content 'claim_id'               |
+       | Claim ID     | Object content 'claim_id', content type |
+       |              | parameter 'claim_id'                    |
        +--------------+-----------------------------------------+
        | Delay Expires| Object content 'delay_expires'          |
        +--------------+-----------------------------------------+
-       | Expires      | Object Delete-After header              |
+       | Expires      | Object Delete-After header, content     |
+       |              | type parameter 'expires'                |
        +--------------------------------------------------------+
+
+    When the `message_bucket_width` option is set, the messages of a
+    queue are stored in one container per time bucket, chosen by the
+    creation time of each message, instead of a single container.
+    Messages stored before buckets were enabled are still read from the
+    single container of their queue.
     """
 
     def __init__(self, *args, **kwargs):
         super(MessageController, self).__init__(*args, **kwargs)
         self._client = self.driver.connection
+        self._executor = self.driver.executor
+        self._cache = self.driver.cache
+        self._bucket_width = self.driver.swift_conf.message_bucket_width
 
     @decorators.lazy_property(write=False)
     def _queue_ctrl(self):
         return self.driver.queue_controller
 
+    def _message_bucket(self, queue, project, message_id):
+        """Get the container a message is created in."""
+        if not self._bucket_width:
+            return utils._message_container(queue, project)
+        start = utils._bucket_start(utils._message_created(message_id),
+                                    self._bucket_width)
+        return utils._bucket_container(queue, project, start)
+
+    def _containers(self, queue, project, message_id):
+        """Lists the containers that may hold a message."""
+        container = utils._message_container(queue, project)
+        if not self._bucket_width:
+            return [container]
+
+        containers = []
+        try:
+            containers.append(self._message_bucket(queue, project,
+                                                   message_id))
+        except ValueError:
+            # NOTE: Not a message ID, yet it may still be the name of
+            # a message stored before buckets were enabled.
+            pass
+        if container in self._listed_containers(queue, project):
+            containers.append(container)
+        return containers
+
+    def _list_buckets(self, queue, project=None):
+        prefix = utils._bucket_prefix(queue, project)
+        _, containers = self._client.get_account(prefix=prefix,
+                                                 full_listing=True)
+        return [container['name'] for container in containers
+                if utils._bucket_container_start(container['name'],
+                                                 prefix) is not None]
+
+    def _recent_buckets(self, queue, project=None):
+        now = timeutils.utcnow_ts()
+        start = utils._bucket_start(now - 2 * _CONTAINERS_CACHE_TTL,
+                                    self._bucket_width)
+        buckets = []
+        while start <= now:
+            buckets.append(utils._bucket_container(queue, project, start))
+            start += self._bucket_width
+        return buckets
+
+    @decorators.caches(_containers_key, _CONTAINERS_CACHE_TTL)
+    def _listed_containers(self, queue, project=None):
+        containers = []
+        container = utils._message_container(queue, project)
+        try:
+            headers = self._client.head_container(container)
+        except swiftclient.ClientException as exc:
+            if exc.http_status != 404:
+                raise
+        else:
+            if int(headers.get('x-container-object-count', 0)):
+                containers.append(container)
+        return containers + self._list_buckets(queue, project)
+
+    def _message_containers(self, queue, project=None):
+        """Lists the containers holding the messages of a queue.
+
+        The container of the queue comes first, if it still holds
+        messages stored before buckets were enabled, followed by the
+        buckets from the oldest to the newest.
+        """
+        container = utils._message_container(queue, project)
+        if not self._bucket_width:
+            return [container]
+
+        listed = self._listed_containers(queue, project)
+        buckets = set(listed)
+        buckets.discard(container)
+        buckets.update(self._recent_buckets(queue, project))
+        return [c for c in listed if c == container] + sorted(buckets)
+
+    def _delete_container(self, container):
+        """Deletes a container along with all its objects."""
+        try:
+            headers, objects = self._client.get_container(container,
+                                                          full_listing=True)
+        except swiftclient.ClientException as exc:
+            if exc.http_status != 404:
+                raise
+            return
+
+        def delete_object(obj):
+            try:
+                self._client.delete_object(container, obj['name'])
+            except swiftclient.ClientException as exc:
+                if exc.http_status != 404:
+                    raise
+
+        utils._map(self._executor, delete_object, objects)
+        try:
+            self._client.delete_container(container)
+        except swiftclient.ClientException as exc:
+            if exc.http_status not in (404, 409):
+                raise
+
+    @_listed_containers.purges
+    def _delete_queue_containers(self, queue, project=None):
+        """Deletes the containers holding the messages of a queue."""
+        containers = [utils._message_container(queue, project)]
+        if self._bucket_width:
+            buckets = set(self._list_buckets(queue, project))
+            buckets.update(self._recent_buckets(queue, project))
+            containers.extend(sorted(buckets))
+        for container in containers:
+            self._delete_container(container)
+
     def _delete_queue_messages(self, queue, project, pipe):
         """Method to remove all the messages belonging to a queue.
 
@@ -70,66 +212,74 @@ class MessageController(storage.Message):
         The pipe to execute deletion will be passed from the QueueController
         executing the operation.
         """
-        container = utils._message_container(queue, project)
-        remaining = True
-        key = ''
-        while remaining:
-            headers, objects = self._client.get_container(container,
-                                                          limit=1000,
-                                                          marker=key)
-            if not objects:
-                return
-            remaining = len(objects) == 1000
-            key = objects[-1]['name']
-            for o in objects:
+        for container in self._message_containers(queue, project):
+            remaining = True
+            key = ''
+            while remaining:
                 try:
-                    self._client.delete_object(container, o['name'])
+                    headers, objects = self._client.get_container(
+                        container, limit=1000, marker=key)
                 except swiftclient.ClientException as exc:
-                    if exc.http_status == 404:
-                        continue
+                    if exc.http_status == 404 and self._bucket_width:
+                        break
                     raise
+                if not objects:
+                    break
+                remaining = len(objects) == 1000
+                key = objects[-1]['name']
+                for o in objects:
+                    try:
+                        self._client.delete_object(container, o['name'])
+                    except swiftclient.ClientException as exc:
+                        if exc.http_status == 404:
+                            continue
+                        raise
 
     def _list(self, queue, project=None, marker=None,
               limit=storage.DEFAULT_MESSAGES_PER_PAGE,
               echo=False, client_uuid=None,
               include_claimed=False, include_delayed=False,
-              sort=1):
+              sort=1, with_container=False):
         """List messages in the queue, oldest first(ish)
 
         Time ordering and message inclusion in lists are soft, there is no
         global order and times are based on the UTC time of the zaqar-api
         server that the message was created from.
 
+        When `with_container` is set, each message is given the name of
+        the container it was found in, under the 'container' key.
+
         Here be consistency dragons.
         """
         if not self._queue_ctrl.exists(queue, project):
             raise errors.QueueDoesNotExist(queue, project)
 
-        client = self._client
-        container = utils._message_container(queue, project)
+        containers = self._message_containers(queue, project)
         query_string = None
         if sort == -1:
             query_string = 'reverse=on'
+            containers.reverse()
+        containers = self._containers_after(queue, project, marker,
+                                            containers, sort)
 
-        try:
-            _, objects = client.get_container(
-                container,
-                marker=marker,
-                # list 2x the objects because some listing items may have
-                # expired
-                limit=limit * 2,
-                query_string=query_string)
-        except swiftclient.ClientException as exc:
-            if exc.http_status == 404:
-                raise errors.QueueDoesNotExist(queue, project)
-            raise
+        is_active = self.driver.claim_controller._active_claims(queue,
+                                                                project)
+        now = timeutils.utcnow_ts()
+
+        def is_listed_claimed(obj):
+            if include_claimed:
+                return False
+            claim_id = utils._listing_params(obj).get('claim_id')
+            return bool(claim_id) and is_active(claim_id)
+
+        def is_listed_expired(obj):
+            expires = utils._listing_params(obj).get('expires')
+            return expires is not None and int(expires) <= now
 
         def is_claimed(msg, headers):
             if include_claimed or msg['claim_id'] is None:
                 return False
-            claim_obj = self.driver.claim_controller._get(
-                queue, msg['claim_id'], project)
-            return claim_obj is not None and claim_obj['ttl'] > 0
+            return is_active(msg['claim_id'])
 
         def is_delayed(msg, headers):
             if include_delayed:
@@ -147,15 +297,83 @@ class MessageController(storage.Message):
             is_claimed,
             is_delayed,
         ]
+        listing_filters = [
+            is_listed_expired,
+            is_listed_claimed,
+        ]
         marker = {}
-        get_object = functools.partial(client.get_object, container)
-        list_objects = functools.partial(client.get_container, container,
-                                         limit=limit * 2,
-                                         query_string=query_string)
-        yield utils._filter_messages(objects, filters, marker, get_object,
-                                     list_objects, limit=limit)
+        yield self._filter_containers(queue, project, containers, filters,
+                                      listing_filters, marker, limit,
+                                      query_string, with_container)
         yield marker and marker['next']
 
+    def _filter_containers(self, queue, project, containers, filters,
+                           listing_filters, marker, limit, query_string,
+                           with_container):
+        """Lists the messages of several containers in turn."""
+        client = self._client
+        for container, container_marker in containers:
+            try:
+                _, objects = client.get_container(
+                    container,
+                    marker=container_marker,
+                    # list 2x the objects because some listing items may
+                    # have expired
+                    limit=limit * 2,
+                    query_string=query_string)
+            except swiftclient.ClientException as exc:
+                if exc.http_status != 404:
+                    raise
+                if not self._bucket_width:
+                    raise errors.QueueDoesNotExist(queue, project)
+                continue
+
+            get_object = functools.partial(client.get_object, container)
+            list_objects = functools.partial(
+                client.get_container, container,
+                limit=max(limit * 2, _LISTING_PAGE_SIZE),
+                query_string=query_string)
+            for msg in utils._filter_messages(
+                    objects, filters, marker, get_object, list_objects,
+                    limit=limit, listing_filters=listing_filters):
+                if with_container:
+                    msg['container'] = container
+                limit -= 1
+                yield msg
+            if limit <= 0:
+                return
+
+    def _containers_after(self, queue, project, marker, containers, sort):
+        """Lists the containers left to list after a marker.
+
+        Each container is paired with the marker its listing starts
+        from, which is only set for the container the marker is in.
+        """
+        if marker is None or not self._bucket_width:
+            return [(c, marker) for c in containers]
+
+        container = utils._message_container(queue, project)
+        if container in containers:
+            try:
+                self._client.head_object(container, marker)
+            except swiftclient.ClientException as exc:
+                if exc.http_status != 404:
+                    raise
+            else:
+                index = containers.index(container)
+                return ([(container, marker)] +
+                        [(c, None) for c in containers[index + 1:]])
+
+        try:
+            bucket = self._message_bucket(queue, project, marker)
+        except ValueError:
+            return [(c, marker) for c in containers]
+        if sort == -1:
+            after = [c for c in containers if c == container or c <= bucket]
+        else:
+            after = [c for c in containers if c != container and c >= bucket]
+        return [(c, marker if c == bucket else None) for c in after]
+
     def list(self, queue, project=None, marker=None,
              limit=storage.DEFAULT_MESSAGES_PER_PAGE,
              echo=False, client_uuid=None,
@@ -187,55 +405,74 @@ class MessageController(storage.Message):
         return utils._message_to_json(message_id, msg, headers, now)
 
     def _find_message(self, queue, message_id, project):
-        try:
-            return self._client.get_object(
-                utils._message_container(queue, project), message_id)
+        container, headers, msg = self._locate_message(queue, message_id,
+                                                       project)
+        return headers, msg
 
-        except swiftclient.ClientException as exc:
-            if exc.http_status == 404:
-                raise errors.MessageDoesNotExist(message_id, queue, project)
+    def _locate_message(self, queue, message_id, project):
+        """Get a message along with the container it is stored in."""
+        for container in self._containers(queue, project, message_id):
+            try:
+                headers, msg = self._client.get_object(container, message_id)
+            except swiftclient.ClientException as exc:
+                if exc.http_status != 404:
+                    raise
             else:
-                raise
+                return container, headers, msg
+
+        raise errors.MessageDoesNotExist(message_id, queue, project)
 
     def bulk_delete(self, queue, message_ids, project=None):
-        for id in message_ids:
-            try:
-                self._delete(queue, id, project)
-            except errors.MessageDoesNotExist:
-                pass
+        utils._map(self._executor,
+                   lambda message_id: self._delete(queue, message_id, project),
+                   message_ids)
 
     def bulk_get(self, queue, message_ids, project=None):
         if not self._queue_ctrl.exists(queue, project):
-            raise StopIteration()
+            return
 
-        for id in message_ids:
+        def get(message_id):
             try:
-                yield self._get(queue, id, project, check_queue=False)
+                return self._get(queue, message_id, project,
+                                 check_queue=False)
             except errors.MessageDoesNotExist:
-                pass
+                return None
+
+        for msg in utils._map(self._executor, get, message_ids):
+            if msg is not None:
+                yield msg
 
     def post(self, queue, messages, client_uuid, project=None):
         # TODO(flwang): It would be nice if we can create a middleware in Swift
         # to accept a json list so that Zaqar can create objects in bulk.
-        return [self._create_msg(queue, m, client_uuid, project)
-                for m in messages]
-
-    def _create_msg(self, queue, msg, client_uuid, project):
-        slug = str(uuid.uuid1())
+        # NOTE: Message IDs are generated upfront so that they follow the
+        # order of the messages even though the objects are created in
+        # parallel.
+        messages = [(str(uuid.uuid1()), msg) for msg in messages]
+        return utils._map(
+            self._executor,
+            lambda args: self._create_msg(queue, args[1], client_uuid,
+                                          project, args[0]),
+            messages)
+
+    def _create_msg(self, queue, msg, client_uuid, project, slug):
         now = timeutils.utcnow_ts()
+        expires = now + msg['ttl']
         contents = jsonutils.dumps(
             {'body': msg.get('body', {}), 'claim_id': None,
              'ttl': msg['ttl'], 'claim_count': 0,
              'delay_expires': now + msg.get('delay', 0)})
+        # NOTE: The expiration time is set rather than the TTL, so that
+        # it matches the one listed in the content type exactly.
         utils._put_or_create_container(
             self._client,
-            utils._message_container(queue, project),
+            self._message_bucket(queue, project, slug),
             slug,
             contents=contents,
-            content_type='application/json',
+            content_type=utils._message_content_type(None, expires),
             headers={
                 'x-object-meta-clientid': str(client_uuid),
-                'x-delete-after': msg['ttl']})
+                'x-delete-at': expires})
         return slug
 
     def delete(self, queue, message_id, project=None, claim=None):
@@ -260,12 +497,14 @@ class MessageController(storage.Message):
         self._delete(queue, message_id, project)
 
     def _delete(self, queue, message_id, project=None):
-        try:
-            self._client.delete_object(
-                utils._message_container(queue, project), message_id)
-        except swiftclient.ClientException as exc:
-            if exc.http_status != 404:
-                raise
+        for container in self._containers(queue, project, message_id):
+            try:
+                self._client.delete_object(container, message_id)
+            except swiftclient.ClientException as exc:
+                if exc.http_status != 404:
+                    raise
+            else:
+                return
 
     def pop(self, queue, limit, project=None):
         # Pop is implemented as a chain of the following operations:
@@ -280,6 +519,79 @@ class MessageController(storage.Message):
         self.bulk_delete(queue, message_ids, project)
         return messages
 
+    def gc(self):
+        """Drop the buckets whose messages have all expired.
+
+        Swift expires the objects of a bucket on its own, but the
+        container stays behind and its listing keeps going through
+        expired objects until the object expirer catches up.
+
+        :returns: Number of messages removed
+        """
+        if not self._bucket_width:
+            return 0
+
+        now = timeutils.utcnow_ts()
+        prefix = utils._bucket_prefix()
+        _, containers = self._client.get_account(prefix=prefix,
+                                                 full_listing=True)
+        stats = {'removed': 0, 'buckets': 0}
+        for container in containers:
+            start = container['name'].rpartition(':')[2]
+            if not start.isdigit() or int(start) + self._bucket_width > now:
+                continue
+            removed = self._drop_bucket(container['name'], now)
+            if removed is not None:
+                stats['removed'] += removed
+                stats['buckets'] += 1
+
+        LOG.info(u'Swift GC removed %(removed)d messages in %(buckets)d '
+                 u'buckets.', stats)
+        return stats['removed']
+
+    def _drop_bucket(self, container, now):
+        """Delete a bucket, unless some of its messages are still live.
+
+        :returns: Number of messages removed, or None if the bucket was
+            kept.
+        """
+        try:
+            _, objects = self._client.get_container(container,
+                                                    full_listing=True)
+        except swiftclient.ClientException as exc:
+            if exc.http_status != 404:
+                raise
+            return None
+
+        for obj in objects:
+            expires = utils._listing_params(obj).get('expires')
+            if expires is None or int(expires) > now:
+                return None
+
+        def delete_object(obj):
+            # NOTE: A message whose claim was released or renewed in
+            # the meantime got a later expiration time, and is kept.
+            expires = utils._listing_params(obj)['expires']
+            try:
+                self._client.delete_object(
+                    container, obj['name'],
+                    headers={'X-If-Delete-At': expires})
+            except swiftclient.ClientException as exc:
+                if exc.http_status == 404:
+                    return 1
+                if exc.http_status == 412:
+                    return 0
+                raise
+            return 1
+
+        removed = sum(utils._map(self._executor, delete_object, objects))
+        try:
+            self._client.delete_container(container)
+        except swiftclient.ClientException as exc:
+            if exc.http_status not in (404, 409):
+                raise
+        return removed
+
 
 class MessageQueueHandler(object):
     def __init__(self, driver, control_driver):
@@ -293,25 +605,9 @@ class MessageQueueHandler(object):
         self._client.put_container(utils._message_container(name, project))
 
     def delete(self, name, project=None):
-        for container in [utils._message_container(name, project),
-                          utils._claim_container(name, project)]:
-            try:
-                headers, objects = self._client.get_container(container)
-            except swiftclient.ClientException as exc:
-                if exc.http_status != 404:
-                    raise
-            else:
-                for obj in objects:
-                    try:
-                        self._client.delete_object(container, obj['name'])
-                    except swiftclient.ClientException as exc:
-                        if exc.http_status != 404:
-                            raise
-                try:
-                    self._client.delete_container(container)
-                except swiftclient.ClientException as exc:
-                    if exc.http_status not in (404, 409):
-                        raise
+        self._message_ctrl._delete_queue_containers(name, project)
+        self._message_ctrl._delete_container(
+            utils._claim_container(name, project))
 
     def stats(self, name, project=None):
         if not self._queue_ctrl.exists(name, project=project):
@@ -319,36 +615,38 @@ class MessageQueueHandler(object):
 
         total = 0
         claimed = 0
-        container = utils._message_container(name, project)
-
-        try:
-            _, objects = self._client.get_container(container)
-        except swiftclient.ClientException as exc:
-            if exc.http_status == 404:
-                raise errors.QueueIsEmpty(name, project)
-
         newest = None
         oldest = None
+        is_active = self._claim_ctrl._active_claims(name, project)
         now = timeutils.utcnow_ts(True)
-        for obj in objects:
-            try:
-                headers = self._client.head_object(container, obj['name'])
-            except swiftclient.ClientException as exc:
-                if exc.http_status != 404:
-                    raise
-            else:
-                created = float(headers['x-timestamp'])
-                created_iso = datetime.datetime.utcfromtimestamp(
-                    created).strftime('%Y-%m-%dT%H:%M:%SZ')
-                newest = {
-                    'id': obj['name'],
-                    'age': now - created,
-                    'created': created_iso}
-                if oldest is None:
-                    oldest = copy.deepcopy(newest)
-                total += 1
-                if headers.get('x-object-meta-claimid'):
-                    claimed += 1
+        for container, obj in self._objects(name, project):
+            params = utils._listing_params(obj)
+            if 'expires' not in params:
+                # NOTE: Messages posted before the claim ID and the
+                # expiration time were kept in the content type are
+                # read the legacy way.
+                try:
+                    headers = self._client.head_object(container,
+                                                       obj['name'])
+                except swiftclient.ClientException as exc:
+                    if exc.http_status != 404:
+                        raise
+                    continue
+                params = {'claim_id': headers.get('x-object-meta-claimid'),
+                          'expires': headers['x-delete-at']}
+
+            if int(params['expires']) <= now:
+                continue
+
+            total += 1
+            if params['claim_id'] and is_active(params['claim_id']):
+                claimed += 1
+
+            created = utils._message_created(obj['name'])
+            if newest is None or created > newest[0]:
+                newest = (created, obj['name'])
+            if oldest is None or created < oldest[0]:
+                oldest = (created, obj['name'])
 
         msg_stats = {
             'claimed': claimed,
@@ -356,11 +654,43 @@ class MessageQueueHandler(object):
             'total': total,
         }
         if newest is not None:
-            msg_stats['newest'] = newest
-            msg_stats['oldest'] = oldest
+            msg_stats['newest'] = _stat_message(newest, now)
+            msg_stats['oldest'] = _stat_message(oldest, now)
 
         return {'messages': msg_stats}
 
+    def _objects(self, name, project):
+        """Iterate over the (container, object) listings of a queue."""
+        for container in self._message_ctrl._message_containers(name,
+                                                                project):
+            try:
+                _, objects = self._client.get_container(container,
+                                                        full_listing=True)
+            except swiftclient.ClientException as exc:
+                if exc.http_status != 404:
+                    raise
+                if not self._message_ctrl._bucket_width:
+                    raise errors.QueueIsEmpty(name, project)
+                continue
+
+            for obj in objects:
+                yield container, obj
+
+    def bulk_stats(self, names, project=None):
+        # NOTE: Swift has no way to read several containers at once, so
+        # the stats of each queue are read in turn.
+        stats = {}
+        for name in names:
+            try:
+                stats[name] = self.stats(name, project=project)
+            except errors.QueueDoesNotExist:
+                continue
+            except errors.QueueIsEmpty:
+                stats[name] = {'messages': {'claimed': 0,
+                                            'free': 0,
+                                            'total': 0}}
+        return stats
+
     def exists(self, queue, project=None):
         try:
             self._client.head_container(utils._message_container(queue,
@@ -372,3 +702,15 @@ class MessageQueueHandler(object):
             raise
         else:
             return True
+
+
+def _stat_message(message, now):
+    """Creates a stat document from a (created, message ID) pair."""
+    created, message_id = message
+    created_iso = datetime.datetime.utcfromtimestamp(created).strftime(
+        '%Y-%m-%dT%H:%M:%SZ')
+    return {
+        'id': message_id,
+        'age': now - created,
+        'created': created_iso,
+    }
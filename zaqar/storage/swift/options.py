@@ -26,6 +26,27 @@ MESSAGE_SWIFT_OPTIONS = (
     cfg.StrOpt("project_domain_name", help="Domain name containing project"),
     cfg.StrOpt("user_domain_id", default="default", help="User's domain id"),
     cfg.StrOpt("user_domain_name", help="User's domain name"),
+    cfg.IntOpt("max_concurrency", default=8, min=1,
+               help="Maximum number of object requests, such as those of "
+                    "posting or claiming several messages, sent to Swift "
+                    "in parallel. The limit is shared by all the "
+                    "operations of a process, which run their object "
+                    "requests in a common pool of this many threads. 1 "
+                    "sends them one at a time."),
+    cfg.IntOpt("connection_pool_size", default=16, min=1,
+               help="Maximum number of idle connections to Swift kept open "
+                    "for reuse."),
+    cfg.IntOpt("message_bucket_width", default=0, min=0,
+               help="Width, in seconds, of the time buckets the messages "
+                    "of a queue are split into by creation time. Each "
+                    "bucket is stored in a container of its own, which "
+                    "the garbage collector drops once all its messages "
+                    "have expired, so that listings no longer go through "
+                    "them. 0 keeps all the messages of a queue in a single "
+                    "container. Buckets can be enabled on an existing "
+                    "deployment, but DO NOT change this setting once it "
+                    "is not 0. Values below a few minutes create many "
+                    "containers; 3600 is a reasonable value."),
 )
 
 
@@ -11,15 +11,56 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import uuid
+
+from futurist import waiters
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 import swiftclient
 
+# NOTE: Number of 100ns intervals between the start of the Gregorian
+# calendar, used by UUID version 1 timestamps, and the Unix epoch.
+_UUID_EPOCH_OFFSET = 0x01b21dd213814000
+
 
 def _message_container(queue, project=None):
     return "zaqar_message:%s:%s" % (queue, project)
 
 
+def _bucket_prefix(queue=None, project=None):
+    if queue is None:
+        return "zaqar_message_bucket:"
+    return "zaqar_message_bucket:%s:%s:" % (queue, project)
+
+
+def _bucket_container(queue, project, start):
+    """Name of the container of the messages created in a time bucket.
+
+    The start time is zero-padded so that the buckets of a queue are
+    listed in chronological order.
+    """
+    return "%s%010d" % (_bucket_prefix(queue, project), start)
+
+
+def _bucket_container_start(container, prefix):
+    """Get the start time of a bucket container, if it is one.
+
+    Returns None for the containers that are not buckets, e.g. those of
+    a project whose ID starts like the one the prefix was made for.
+    """
+    if not container.startswith(prefix):
+        return None
+    start = container[len(prefix):]
+    if not start.isdigit():
+        return None
+    return int(start)
+
+
+def _bucket_start(timestamp, width):
+    timestamp = int(timestamp)
+    return timestamp - timestamp % width
+
+
 def _claim_container(queue=None, project=None):
     return "zaqar_claim:%s:%s" % (queue, project)
 
@@ -32,6 +73,36 @@ def _subscriber_container(queue, project=None):
     return "zaqar_subscriber:%s:%s" % (queue, project)
 
 
+def _message_content_type(claim_id, expires):
+    """Content type of a message object.
+
+    The claim ID and the expiration time of a message are kept as
+    parameters of its content type, since container listings include
+    the content type of each object. Whether a message is claimed or
+    expired is then known without reading the message.
+    """
+    return 'application/json; claim_id=%s; expires=%d' % (claim_id or '',
+                                                          expires)
+
+
+def _listing_params(obj):
+    """Get the content type parameters of an object listing entry.
+
+    Messages posted before the claim ID and the expiration time were
+    kept in the content type have neither `claim_id` nor `expires`.
+    """
+    params = {}
+    for param in obj.get('content_type', '').split(';')[1:]:
+        key, _sep, value = param.strip().partition('=')
+        params[key] = value
+    return params
+
+
+def _message_created(message_id):
+    """Get the creation time of a message from its version 1 UUID."""
+    return (uuid.UUID(message_id).time - _UUID_EPOCH_OFFSET) / 1e7
+
+
 def _put_or_create_container(client, *args, **kwargs):
     """PUT a swift object to a container that may not exist
 
@@ -62,6 +133,18 @@ def _put_or_create_container(client, *args, **kwargs):
             raise
 
 
+def _map(executor, func, items):
+    """Call a function on each item using the given executor.
+
+    Results are returned in the order of the items once every call is
+    done. The first exception raised by a call, if any, is raised
+    again after that.
+    """
+    futures = [executor.submit(func, item) for item in items]
+    waiters.wait_for_all(futures)
+    return [future.result() for future in futures]
+
+
 def _message_to_json(message_id, msg, headers, now):
     msg = jsonutils.loads(msg)
 
@@ -88,11 +171,13 @@ def _subscription_to_json(sub, headers):
 
 
 def _filter_messages(messages, filters, marker, get_object, list_objects,
-                     limit):
+                     limit, listing_filters=()):
     """Create a filtering iterator over a list of messages.
 
     The function accepts a list of filters to be filtered
     before the the message can be included as a part of the reply.
+    Listing filters are given the container listing entry of each
+    message, and are applied before the message is read.
     """
     now = timeutils.utcnow_ts(True)
 
@@ -101,6 +186,8 @@ def _filter_messages(messages, filters, marker, get_object, list_objects,
             continue
 
         marker['next'] = msg['name']
+        if any(should_skip(msg) for should_skip in listing_filters):
+            continue
         try:
             headers, obj = get_object(msg['name'])
         except swiftclient.ClientException as exc:
@@ -130,7 +217,7 @@ def _filter_messages(messages, filters, marker, get_object, list_objects,
         if not objects:
             return
         for msg in _filter_messages(objects, filters, marker, get_object,
-                                    list_objects, limit):
+                                    list_objects, limit, listing_filters):
             yield msg
 
 
@@ -115,6 +115,9 @@ class QueueController(storage.Queue):
     def _stats(self, name, project=None):
         raise NotImplementedError()
 
+    def _bulk_stats(self, names, project=None):
+        raise NotImplementedError()
+
 
 class MessageController(storage.Message):
     def __init__(self, driver):
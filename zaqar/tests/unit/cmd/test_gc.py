@@ -0,0 +1,60 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from zaqar.cmd import gc
+from zaqar.common import configs
+from zaqar.tests import base
+
+
+class TestCollector(base.TestBase):
+
+    def setUp(self):
+        super(TestCollector, self).setUp()
+        self.conf.register_opts(configs._GC_OPTIONS,
+                                group=configs._GC_GROUP)
+
+        self.server = mock.Mock()
+        self.collector = gc.Collector(self.conf, self.server)
+        self.addCleanup(self.collector._executor.shutdown)
+
+    def test_collect_without_pooling(self):
+        self.server.storage.gc.return_value = 3
+
+        self.assertEqual(3, self.collector.collect())
+        self.server.storage.gc.assert_called_once_with()
+
+    def test_collect_all_pools(self):
+        self.config(pooling=True)
+
+        drivers = [mock.Mock(), mock.Mock(), mock.Mock()]
+        drivers[0].gc.return_value = 5
+        drivers[1].gc.return_value = None
+        drivers[2].gc.side_effect = RuntimeError('pool is down')
+
+        pools = [('pool%d' % i, driver) for i, driver in enumerate(drivers)]
+        with mock.patch.object(self.collector, '_get_drivers',
+                               return_value=pools):
+            self.assertEqual(5, self.collector.collect())
+
+        for driver in drivers:
+            driver.gc.assert_called_once_with()
+
+    def test_next_delay(self):
+        self.config(group=configs._GC_GROUP, interval=30, jitter=5)
+
+        with mock.patch('random.uniform', return_value=2.5) as uniform:
+            self.assertEqual(32.5, self.collector.next_delay())
+
+        uniform.assert_called_once_with(0, 5)
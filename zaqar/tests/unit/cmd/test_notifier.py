@@ -0,0 +1,145 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from zaqar.cmd import notifier
+from zaqar.tests import base
+
+
+class TestNotifier(base.TestBase):
+
+    def setUp(self):
+        super(TestNotifier, self).setUp()
+        self.config(group='notification', outbox_workers=2,
+                    outbox_batch_size=10, outbox_lease=30)
+
+        self.server = mock.Mock()
+        self.outbox = self.server.storage.outbox_controller
+        self.notifier = notifier.Notifier(self.conf, self.server)
+        self.addCleanup(self.notifier._executor.shutdown)
+
+        self.task = mock.Mock(spec=['execute', 'deliver'])
+        get_task = mock.patch('zaqar.notification.tasks.get_task',
+                              return_value=self.task)
+        self.get_task = get_task.start()
+        self.addCleanup(get_task.stop)
+
+    def _entry(self, entry_id, attempts=0, retry_policy=None):
+        return {'id': entry_id,
+                'project': 'project',
+                'queue': 'fake_queue',
+                'subscription': {'subscriber': 'http://trigger_me',
+                                 'source': 'fake_queue',
+                                 'options': {}},
+                'messages': [{'body': {'event': 'BackupStarted'}}],
+                'retry_policy': retry_policy or {},
+                'attempts': attempts}
+
+    def test_drain_delivers_and_deletes(self):
+        entries = [self._entry('a'), self._entry('b')]
+        self.outbox.lease.return_value = entries
+        self.task.deliver.return_value = True
+
+        self.assertEqual(2, self.notifier.drain())
+
+        self.outbox.lease.assert_called_once_with(10, 30)
+        self.assertEqual(2, self.task.deliver.call_count)
+        self.assertEqual(sorted([mock.call('a'), mock.call('b')]),
+                         sorted(self.outbox.delete.call_args_list))
+        self.assertFalse(self.outbox.defer.called)
+
+    def test_failed_delivery_is_deferred(self):
+        policy = {'retries_with_no_delay': 1, 'minimum_delay_retries': 1,
+                  'minimum_delay': 5}
+        self.outbox.lease.return_value = [self._entry('a', 1, policy)]
+        self.task.deliver.return_value = False
+
+        self.notifier.drain()
+
+        self.outbox.defer.assert_called_once_with('a', 5)
+        self.assertFalse(self.outbox.delete.called)
+
+    def test_delivery_error_is_deferred(self):
+        self.outbox.lease.return_value = [self._entry('a')]
+        self.task.deliver.side_effect = RuntimeError('subscriber is down')
+
+        self.notifier.drain()
+
+        self.outbox.defer.assert_called_once_with('a', 0)
+
+    def test_exhausted_retries(self):
+        policy = {'retries_with_no_delay': 1, 'minimum_delay_retries': 0,
+                  'maximum_delay_retries': 0, 'minimum_delay': 5,
+                  'maximum_delay': 5}
+        self.outbox.lease.return_value = [self._entry('a', 1, policy)]
+        self.task.deliver.return_value = False
+
+        self.notifier.drain()
+
+        self.outbox.delete.assert_called_once_with('a')
+        self.assertFalse(self.outbox.defer.called)
+
+    def test_task_without_deliver(self):
+        self.task = mock.Mock(spec=['execute'])
+        self.get_task.return_value = self.task
+        self.outbox.lease.return_value = [self._entry('a')]
+
+        self.notifier.drain()
+
+        self.assertEqual(1, self.task.execute.call_count)
+        self.outbox.delete.assert_called_once_with('a')
+
+    @mock.patch.object(notifier.pooling, 'Catalog')
+    def test_drain_all_pools(self, catalog):
+        self.config(pooling=True)
+
+        drivers = {'pool0': mock.Mock(), 'pool1': mock.Mock(),
+                   'swift': mock.Mock(outbox_controller=None)}
+        drivers['pool0'].outbox_controller.lease.return_value = [
+            self._entry('a')]
+        drivers['pool1'].outbox_controller.lease.return_value = [
+            self._entry('b'), self._entry('c')]
+        catalog.return_value._pools_ctrl.list.side_effect = (
+            lambda limit: iter([[{'name': name} for name in drivers]]))
+        catalog.return_value.get_driver.side_effect = drivers.get
+        self.task.deliver.return_value = True
+
+        self.assertEqual(3, self.notifier.drain())
+
+        pool0 = drivers['pool0'].outbox_controller
+        pool1 = drivers['pool1'].outbox_controller
+        pool0.delete.assert_called_once_with('a')
+        self.assertEqual(sorted([mock.call('b'), mock.call('c')]),
+                         sorted(pool1.delete.call_args_list))
+        self.assertFalse(self.outbox.lease.called)
+
+        pool0.depth.return_value = 1
+        pool1.depth.return_value = 2
+        with mock.patch.object(notifier.LOG, 'info') as info:
+            self.notifier.report()
+        info.assert_called_once_with(mock.ANY, 3)
+
+    def test_drain_skips_failed_pool(self):
+        self.outbox.lease.side_effect = RuntimeError('pool is down')
+
+        self.assertEqual(0, self.notifier.drain())
+
+    def test_report(self):
+        self.outbox.depth.return_value = 42
+
+        with mock.patch.object(notifier.LOG, 'info') as info:
+            self.notifier.report()
+            self.notifier.report()
+
+        info.assert_called_once_with(mock.ANY, 42)
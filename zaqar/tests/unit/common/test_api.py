@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from jsonschema import validators
+
+from zaqar.api.v2 import request
 from zaqar.common.api import api
 from zaqar.common import errors
 from zaqar.tests import base
@@ -55,3 +58,48 @@ class TestApi(base.TestBase):
     def test_invalid_operation(self):
         self.assertRaises(errors.InvalidAction, self.api.validate,
                           'super_secret_op', {})
+
+    def test_unsupported_schema_is_not_compiled(self):
+        schema = FakeApi.schema['test_operation']
+        self.assertIsNone(api._compile(schema))
+
+    def test_compiled_schema_matches_jsonschema(self):
+        schema = request.RequestSchema.schema
+        headers = {'Client-ID': 'c', 'X-Project-ID': 'p'}
+        payloads = [
+            {'action': 'message_post', 'headers': headers,
+             'body': {'queue_name': 'q', 'messages': [{'body': 1}]}},
+            {'action': 'message_post', 'headers': headers,
+             'body': {'queue_name': 'q', 'messages': {'body': 1}}},
+            {'action': 'message_post', 'headers': headers,
+             'body': {'queue_name': 'q'}},
+            {'action': 'message_post', 'headers': {'Client-ID': 'c'},
+             'body': {'queue_name': 'q', 'messages': []}},
+            {'action': 'claim_create', 'headers': headers,
+             'body': {'queue_name': 'q', 'ttl': 60, 'grace': 30}},
+            {'action': 'claim_create', 'headers': headers,
+             'body': {'queue_name': 'q', 'limit': True}},
+            {'action': 'claim_create', 'headers': headers,
+             'body': {'queue_name': 1}},
+            {'action': 'message_delete', 'headers': headers,
+             'body': {'queue_name': 'q', 'message_id': 'm'}},
+            {'action': 'message_delete', 'headers': headers,
+             'body': {'queue_name': 'q', 'message_id': 'm',
+                      'claim_id': None}},
+            {'action': 'message_delete', 'headers': headers,
+             'body': {'queue_name': 'q'}},
+            {'action': 'message_delete', 'headers': headers, 'body': []},
+            {'action': 'claim_credit', 'headers': headers,
+             'body': {'queue_name': 'q', 'credit': 0}},
+            {'action': 'claim_credit', 'headers': headers,
+             'body': {'queue_name': 'q', 'credit': 1}},
+            {'action': 'queue_list', 'headers': headers},
+        ]
+
+        for payload in payloads:
+            action = payload['action']
+            check = api._compile(schema[action])
+            self.assertIsNotNone(check)
+            validator = validators.Draft4Validator(schema[action])
+            self.assertEqual(validator.is_valid(payload), check(payload),
+                             payload)
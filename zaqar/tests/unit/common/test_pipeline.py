@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import mock
+
 from zaqar.common import pipeline
 from zaqar.tests import base
 
@@ -93,3 +95,17 @@ class TestPipeLine(base.TestBase):
 
         with ctxt as consumer:
             self.assertIsNone(consumer())
+
+    def test_stages_are_resolved_once(self):
+        stage = mock.Mock(spec=['with_args'])
+        stage.with_args.return_value = None
+        pipe = pipeline.Pipeline([stage, FirstClass()])
+
+        with mock.patch.object(pipeline.LOG, 'debug') as debug:
+            for name in ('James', 'Bond'):
+                self.assertEqual(name, pipe.with_args(name))
+                self.assertTrue(pipe.no_args())
+
+        self.assertEqual(2, stage.with_args.call_count)
+        # NOTE: The stage lacking `no_args` was only reported once.
+        self.assertEqual(1, debug.call_count)
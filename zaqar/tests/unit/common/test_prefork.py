@@ -0,0 +1,70 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import signal
+
+import mock
+import testtools
+
+from zaqar.common import prefork
+
+
+class TestMaster(testtools.TestCase):
+
+    def setUp(self):
+        super(TestMaster, self).setUp()
+        self.serve = mock.Mock()
+        self.reload = mock.Mock()
+        self.master = prefork.Master(self.serve, 3, u'Test',
+                                     reload=self.reload)
+
+        patcher = mock.patch('os.fork', side_effect=[11, 12, 13, 14, 15, 16])
+        self.fork = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.master._spawn_workers()
+
+    @mock.patch('os.waitpid', side_effect=[(12, 256), (0, 0)])
+    def test_worker_restarted_with_its_index(self, waitpid):
+        self.master._reap()
+
+        self.assertEqual({11: (0, 0), 13: (0, 2), 14: (0, 1)},
+                         self.master._children)
+        self.assertEqual(4, self.fork.call_count)
+        self.assertFalse(self.serve.called)
+
+    @mock.patch('os.waitpid', side_effect=[(12, 0), (0, 0)])
+    def test_worker_not_restarted_when_stopping(self, waitpid):
+        self.master._stopping = True
+        self.master._reap()
+
+        self.assertEqual({11: (0, 0), 13: (0, 2)}, self.master._children)
+        self.assertEqual(3, self.fork.call_count)
+
+    @mock.patch('os.kill')
+    def test_workers_replaced_on_reload(self, kill):
+        self.master._replace_workers()
+
+        self.reload.assert_called_once_with()
+        self.assertEqual({11: (0, 0), 12: (0, 1), 13: (0, 2),
+                          14: (1, 0), 15: (1, 1), 16: (1, 2)},
+                         self.master._children)
+        self.assertEqual([mock.call(pid, signal.SIGTERM)
+                          for pid in (11, 12, 13)],
+                         sorted(kill.call_args_list))
+
+        # NOTE: Workers of the previous generation are not restarted.
+        with mock.patch('os.waitpid', side_effect=[(12, 0), (0, 0)]):
+            self.master._reap()
+        self.assertNotIn(12, self.master._children)
+        self.assertEqual(6, self.fork.call_count)
@@ -14,13 +14,21 @@
 # limitations under the License.
 
 import json
+import socket
+import threading
+import time
 import uuid
 
 import ddt
 import mock
+from six.moves import socketserver
 
+from zaqar.common import cache as oslo_cache
 from zaqar.common import urls
 from zaqar.notification import notifier
+from zaqar.notification import subscribers
+from zaqar.notification import tasks
+from zaqar.notification.tasks import mailto
 from zaqar.notification.tasks import webhook
 from zaqar import tests as testing
 
@@ -59,6 +67,13 @@ class NotifierTest(testing.TestBase):
                               ]
         self.api_version = 'v2'
 
+        dispatcher_patch = mock.patch.object(webhook, '_dispatcher', None)
+        dispatcher_patch.start()
+        self.addCleanup(dispatcher_patch.stop)
+        self.dispatcher = webhook.get_dispatcher(self.conf)
+        self.addCleanup(self.dispatcher.shutdown)
+        self.timeout = self.conf.notification.webhook_timeout
+
     def test_webhook(self):
         subscription = [{'subscriber': 'http://trigger_me',
                          'source': 'fake_queue',
@@ -76,11 +91,12 @@ class NotifierTest(testing.TestBase):
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
         headers = {'Content-Type': 'application/json'}
-        with mock.patch('requests.post') as mock_post:
-            mock_post.return_value = None
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
             driver.post('fake_queue', self.messages, self.client_id,
                         self.project)
             driver.executor.shutdown()
+            self.dispatcher.wait()
             # Let's deserialize "data" from JSON string to dict in each mock
             # call, so we can do dict comparisons. JSON string comparisons
             # often fail, because dict keys can be serialized in different
@@ -93,22 +109,22 @@ class NotifierTest(testing.TestBase):
             mock_post.assert_has_calls([
                 mock.call(subscription[0]['subscriber'],
                           data=self.notifications[0],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription[1]['subscriber'],
                           data=self.notifications[0],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription[2]['subscriber'],
                           data=self.notifications[0],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription[0]['subscriber'],
                           data=self.notifications[1],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription[1]['subscriber'],
                           data=self.notifications[1],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription[2]['subscriber'],
                           data=self.notifications[1],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 ], any_order=True)
             self.assertEqual(6, len(mock_post.mock_calls))
 
@@ -124,11 +140,12 @@ class NotifierTest(testing.TestBase):
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
         headers = {'Content-Type': 'application/json'}
-        with mock.patch('requests.post') as mock_post:
-            mock_post.return_value = None
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
             driver.post('fake_queue', self.messages, self.client_id,
                         self.project)
             driver.executor.shutdown()
+            self.dispatcher.wait()
             # Let's deserialize "data" from JSON string to dict in each mock
             # call, so we can do dict comparisons. JSON string comparisons
             # often fail, because dict keys can be serialized in different
@@ -141,10 +158,10 @@ class NotifierTest(testing.TestBase):
             mock_post.assert_has_calls([
                 mock.call(subscription[0]['subscriber'],
                           data={'foo': 'bar', 'egg': self.notifications[0]},
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription[0]['subscriber'],
                           data={'foo': 'bar', 'egg': self.notifications[1]},
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 ], any_order=True)
             self.assertEqual(2, len(mock_post.mock_calls))
 
@@ -169,11 +186,12 @@ class NotifierTest(testing.TestBase):
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
         headers = {'Content-Type': 'application/json'}
-        with mock.patch('requests.post') as mock_post:
-            mock_post.return_value = None
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
             driver.post('fake_queue', self.messages, self.client_id,
                         self.project)
             driver.executor.shutdown()
+            self.dispatcher.wait()
             # Let's deserialize "data" from JSON string to dict in each mock
             # call, so we can do dict comparisons. JSON string comparisons
             # often fail, because dict keys can be serialized in different
@@ -186,13 +204,112 @@ class NotifierTest(testing.TestBase):
             mock_post.assert_has_calls([
                 mock.call(subscription1[0]['subscriber'],
                           data=self.notifications[0],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 mock.call(subscription2[0]['subscriber'],
                           data=self.notifications[0],
-                          headers=headers),
+                          headers=headers, timeout=self.timeout),
                 ], any_order=True)
             self.assertEqual(4, len(mock_post.mock_calls))
 
+    def _post_batch(self, options):
+        subscription = [{'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': options}]
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(return_value=iter([subscription, {}]))
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(return_value={})
+        driver = notifier.NotifierDriver(subscription_controller=ctlr,
+                                         queue_controller=queue_ctlr)
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+            driver.executor.shutdown()
+            self.dispatcher.wait()
+        return [json.loads(call[1]['data'])
+                for call in mock_post.call_args_list]
+
+    def test_webhook_post_batch(self):
+        bodies = self._post_batch({'post_batch': True})
+        self.assertEqual([self.notifications], bodies)
+
+    def test_webhook_post_batch_size(self):
+        bodies = self._post_batch({'post_batch': True, 'post_batch_size': 1})
+        self.assertEqual(2, len(bodies))
+        self.assertIn([self.notifications[0]], bodies)
+        self.assertIn([self.notifications[1]], bodies)
+
+    def test_webhook_post_batch_post_data(self):
+        post_data = {'foo': 'bar', 'egg': '$zaqar_messages$'}
+        bodies = self._post_batch({'post_batch': True,
+                                   'post_data': json.dumps(post_data)})
+        self.assertEqual([{'foo': 'bar', 'egg': self.notifications}], bodies)
+
+    def _cached_driver(self, subscription):
+        oslo_cache.register_config(self.conf)
+        self.config(group='cache', backend='dogpile.cache.memory',
+                    enabled=True)
+        cache = oslo_cache.get_cache(self.conf)
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(side_effect=lambda *a, **kw: iter(
+            [list(subscription), {}]))
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(return_value={})
+        driver = notifier.NotifierDriver(subscription_controller=ctlr,
+                                         queue_controller=queue_ctlr,
+                                         cache=cache)
+        return driver, ctlr, queue_ctlr, cache
+
+    def test_no_subscriber_is_cached(self):
+        driver, ctlr, queue_ctlr, cache = self._cached_driver([])
+
+        for i in range(3):
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+
+        self.assertEqual(1, ctlr.list.call_count)
+        self.assertFalse(queue_ctlr.get.called)
+
+    def test_subscribers_cache_is_purged(self):
+        subscription = [{'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': {}}]
+        driver, ctlr, queue_ctlr, cache = self._cached_driver(subscription)
+        purger = subscribers.CachePurger(cache)
+
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+            self.assertEqual(1, ctlr.list.call_count)
+
+            purger.create('other_queue', 'http://ping_me', 600, {},
+                          project=self.project)
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+            self.assertEqual(1, ctlr.list.call_count)
+
+            purges = [
+                lambda: purger.create('fake_queue', 'http://ping_me', 600, {},
+                                      project=self.project),
+                lambda: purger.update('fake_queue', 'sub_id',
+                                      project=self.project, ttl=600),
+                lambda: purger.delete('fake_queue', 'sub_id',
+                                      project=self.project),
+                lambda: purger.confirm('fake_queue', 'sub_id',
+                                       project=self.project)]
+            for count, purge in enumerate(purges, 2):
+                purge()
+                driver.post('fake_queue', self.messages, self.client_id,
+                            self.project)
+                self.assertEqual(count, ctlr.list.call_count)
+
+            driver.executor.shutdown()
+            self.dispatcher.wait()
+
     @mock.patch('subprocess.Popen')
     def test_mailto(self, mock_popen):
         subscription = [{'subscriber': 'mailto:aaa@example.com',
@@ -205,6 +322,7 @@ class NotifierTest(testing.TestBase):
                                      'from': 'zaqar@example.com'}}]
         ctlr = mock.MagicMock()
         ctlr.list = mock.Mock(return_value=iter([subscription, {}]))
+        ctlr.driver.conf = self.conf
         queue_ctlr = mock.MagicMock()
         queue_ctlr.get = mock.Mock(return_value={})
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
@@ -262,10 +380,11 @@ class NotifierTest(testing.TestBase):
         queue_ctlr.get = mock.Mock(return_value={})
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             driver.post('fake_queue', self.messages, self.client_id,
                         self.project)
             driver.executor.shutdown()
+            self.dispatcher.wait()
             self.assertEqual(0, mock_post.call_count)
 
     def test_proper_notification_data(self):
@@ -278,17 +397,22 @@ class NotifierTest(testing.TestBase):
         queue_ctlr.get = mock.Mock(return_value={})
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
-        with mock.patch('requests.post') as mock_post:
-            mock_post.return_value = None
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
             driver.post('fake_queue', self.messages, self.client_id,
                         self.project)
             driver.executor.shutdown()
+            self.dispatcher.wait()
             self.assertEqual(2, mock_post.call_count)
-            self.assertEqual(self.notifications[1],
-                             json.loads(mock_post.call_args[1]['data']))
+            # NOTE: Notifications are sent concurrently, so the last call
+            # is not necessarily the one of the last message.
+            bodies = [json.loads(call[1]['data'])
+                      for call in mock_post.call_args_list]
+            self.assertIn(self.notifications[1], bodies)
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_send_confirm_notification(self, mock_request):
+        mock_request.return_value = mock.Mock(status_code=200)
         self.conf.notification.require_confirmation = True
         subscription = {'id': '5760c9fb3990b42e8b7c20bd',
                         'subscriber': 'http://trigger_me',
@@ -303,6 +427,7 @@ class NotifierTest(testing.TestBase):
                                          str(self.project),
                                          api_version=self.api_version)
         driver.executor.shutdown()
+        self.dispatcher.wait()
 
         self.assertEqual(1, mock_request.call_count)
         expect_args = ['SubscribeBody', 'queue_name', 'URL-Methods',
@@ -313,7 +438,7 @@ class NotifierTest(testing.TestBase):
         self.assertEqual(expect_args.sort(),
                          list(actual_args).sort())
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_send_confirm_notification_without_signed_url(self, mock_request):
         subscription = [{'subscriber': 'http://trigger_me',
                          'source': 'fake_queue', 'options': {}}]
@@ -447,3 +572,284 @@ class NotifierTest(testing.TestBase):
         expect = [30, 30, 32, 34, 37, 41, 46, 51, 57, 64, 72, 80, 90, 100]
         sec = webhook._Arithmetic_function(30, 100, 5)
         self.assertEqual(expect, sec)
+
+    def test_webhook_retry_delays(self):
+        policy = {'retries_with_no_delay': 1,
+                  'minimum_delay_retries': 2,
+                  'minimum_delay': 10,
+                  'maximum_delay': 60,
+                  'maximum_delay_retries': 1,
+                  'retry_backoff_function': 'exponential'}
+        expect = [0, 10, 10, 10, 12, 14, 18, 22, 27, 33, 40, 49, 60, 60]
+        self.assertEqual(expect, list(webhook._retry_delays(policy)))
+
+    def test_webhook_retry_does_not_block(self):
+        dispatcher = webhook.Dispatcher(max_workers=1, max_per_subscriber=1,
+                                        timeout=1)
+        self.addCleanup(dispatcher.shutdown)
+        calls = []
+
+        def post(url, **kwargs):
+            calls.append(url)
+            return mock.Mock(status_code=503 if url == 'http://down' else 200)
+
+        with mock.patch('requests.Session.post', side_effect=post):
+            dispatcher.submit('http://down', 'data', {}, [0.2, 0.2])
+            dispatcher.submit('http://up', 'data', {})
+            self.assertTrue(dispatcher.wait(5))
+
+        # NOTE: The only worker thread was free to notify the other
+        # subscriber while the first one was waiting for its retries.
+        self.assertEqual(['http://down', 'http://up',
+                          'http://down', 'http://down'], calls)
+
+    def test_webhook_subscriber_concurrency(self):
+        dispatcher = webhook.Dispatcher(max_workers=4, max_per_subscriber=1,
+                                        timeout=1)
+        self.addCleanup(dispatcher.shutdown)
+        lock = threading.Lock()
+        active = {'http://a': 0, 'http://b': 0}
+        peaks = {'http://a': 0, 'http://b': 0}
+
+        def post(url, **kwargs):
+            with lock:
+                active[url] += 1
+                peaks[url] = max(peaks[url], active[url])
+            time.sleep(0.05)
+            with lock:
+                active[url] -= 1
+            return mock.Mock(status_code=200)
+
+        with mock.patch('requests.Session.post',
+                        side_effect=post) as mock_post:
+            for i in range(3):
+                dispatcher.submit('http://a', 'data', {})
+                dispatcher.submit('http://b', 'data', {})
+            self.assertTrue(dispatcher.wait(5))
+
+        self.assertEqual(6, mock_post.call_count)
+        self.assertEqual({'http://a': 1, 'http://b': 1}, peaks)
+
+    def test_webhook_session_per_host(self):
+        session = self.dispatcher._get_session('http://host:80/a')
+        self.assertIs(session,
+                      self.dispatcher._get_session('http://host:80/b'))
+        self.assertIsNot(session,
+                         self.dispatcher._get_session('https://host:80/a'))
+        self.assertIsNot(session, self.dispatcher._get_session('http://other'))
+
+    def test_post_to_outbox(self):
+        subscription = [{'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': {}}]
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(return_value=iter([subscription, {}]))
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(
+            return_value={'_retry_policy': {'retries_with_no_delay': 1}})
+        outbox = mock.Mock()
+        driver = notifier.NotifierDriver(subscription_controller=ctlr,
+                                         queue_controller=queue_ctlr,
+                                         outbox_controller=outbox)
+        with mock.patch('requests.Session.post') as mock_post:
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+            driver.executor.shutdown()
+            self.dispatcher.wait()
+            self.assertEqual(0, mock_post.call_count)
+
+        outbox.put.assert_called_once_with(
+            'fake_queue', subscription[0], self.messages,
+            project=self.project,
+            retry_policy={'retries_with_no_delay': 1})
+
+    def test_post_batches_transport_subscriptions(self):
+        options = {'_batch_url': 'http://ws:9100/batch'}
+        subscription = [{'subscriber': 'http://ws:9100/a',
+                         'source': 'fake_queue',
+                         'options': options},
+                        {'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': {}},
+                        {'subscriber': 'http://ws:9100/b',
+                         'source': 'fake_queue',
+                         'options': options}]
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(return_value=iter([subscription, {}]))
+        ctlr.driver.conf = self.conf
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(return_value={})
+        driver = notifier.NotifierDriver(subscription_controller=ctlr,
+                                         queue_controller=queue_ctlr)
+        headers = {'Content-Type': 'application/json'}
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
+            driver.post('fake_queue', self.messages, self.client_id,
+                        self.project)
+            driver.executor.shutdown()
+            self.dispatcher.wait()
+
+            batch = {'subscribers': ['http://ws:9100/a', 'http://ws:9100/b'],
+                     'messages': self.notifications}
+            self.assertEqual(3, mock_post.call_count)
+            mock_post.assert_any_call('http://ws:9100/batch',
+                                      data=mock.ANY, headers=headers,
+                                      timeout=self.timeout)
+            for call in mock_post.call_args_list:
+                if call[0][0] == 'http://ws:9100/batch':
+                    self.assertEqual(batch, json.loads(call[1]['data']))
+                else:
+                    self.assertEqual('http://trigger_me', call[0][0])
+
+    def test_webhook_deliver(self):
+        subscription = {'subscriber': 'http://trigger_me',
+                        'source': 'fake_queue',
+                        'options': {'post_batch': True}}
+        for msg in self.messages:
+            msg['Message_Type'] = 'Notification'
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=200)
+            self.assertTrue(webhook.WebhookTask().deliver(
+                subscription, self.messages, conf=self.conf))
+            self.assertEqual(1, mock_post.call_count)
+
+            # NOTE: Failures are not retried, but reported to the caller.
+            mock_post.return_value = mock.Mock(status_code=503)
+            self.assertFalse(webhook.WebhookTask().deliver(
+                subscription, self.messages, conf=self.conf))
+            self.assertEqual(2, mock_post.call_count)
+
+    def test_tasks_are_loaded_once(self):
+        self.addCleanup(tasks._tasks.clear)
+        tasks._tasks.clear()
+        with mock.patch('zaqar.notification.tasks.driver') as drv:
+            drv.DriverManager.side_effect = (
+                lambda *args, **kwargs: mock.Mock(driver=mock.Mock()))
+            task = tasks.get_task('http')
+            self.assertIs(task, tasks.get_task('http'))
+            self.assertIsNot(task, tasks.get_task('trust+http'))
+            self.assertEqual(2, drv.DriverManager.call_count)
+            drv.DriverManager.assert_any_call('zaqar.notification.tasks',
+                                              'http', invoke_on_load=True)
+
+    def _smtp_server(self):
+        server = _SMTPServer(('127.0.0.1', 0), _SMTPHandler)
+        server.daemon_threads = True
+        server.connections = 0
+        server.mails = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.config(group='notification', smtp_host='127.0.0.1',
+                    smtp_port=server.server_address[1])
+        pool_patch = mock.patch.object(mailto, '_pool', None)
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+        self.addCleanup(lambda: mailto._pool and mailto._pool.close())
+        return server
+
+    @mock.patch('subprocess.Popen')
+    def test_mailto_smtp(self, mock_popen):
+        server = self._smtp_server()
+        subscription = {'subscriber': 'mailto:aaa@example.com',
+                        'source': 'fake_queue',
+                        'options': {'subject': 'Hello',
+                                    'from': 'zaqar@example.com'}}
+        for msg in self.messages:
+            msg['Message_Type'] = 'Notification'
+        task = mailto.MailtoTask()
+
+        task.execute(subscription, self.messages, conf=self.conf)
+        task.execute(subscription, self.messages, conf=self.conf)
+
+        self.assertFalse(mock_popen.called)
+        # NOTE: Both batches were sent over the same connection.
+        self.assertEqual(1, server.connections)
+        self.assertEqual(4, len(server.mails))
+        for sender, recipients, data in server.mails:
+            self.assertEqual('zaqar@example.com', sender)
+            self.assertEqual(['aaa@example.com'], recipients)
+            self.assertIn('subject: Hello', data)
+        bodies = [json.loads(data.split('\r\n\r\n', 1)[1])
+                  for __, __, data in server.mails]
+        self.assertEqual(self.notifications * 2, bodies)
+
+    def test_mailto_smtp_reconnects(self):
+        server = self._smtp_server()
+        subscription = {'subscriber': 'mailto:aaa@example.com',
+                        'source': 'fake_queue',
+                        'options': {}}
+        task = mailto.MailtoTask()
+
+        task.execute(subscription, self.messages[:1], conf=self.conf)
+        # NOTE: The server dropping an idle connection must not lose the
+        # next email.
+        for connection in list(mailto._pool._idle):
+            connection.sock.shutdown(socket.SHUT_RDWR)
+        task.execute(subscription, self.messages[1:], conf=self.conf)
+
+        self.assertEqual(2, server.connections)
+        self.assertEqual(2, len(server.mails))
+
+    @mock.patch('subprocess.Popen')
+    def test_mailto_smtp_error(self, mock_popen):
+        self.config(group='notification', smtp_host='127.0.0.1')
+        subscription = {'subscriber': 'mailto:aaa@example.com',
+                        'source': 'fake_queue',
+                        'options': {}}
+        pool = mock.Mock()
+        pool.send.side_effect = socket.error('connection refused')
+        task = mailto.MailtoTask()
+
+        with mock.patch.object(mailto, 'get_pool', return_value=pool), \
+                mock.patch.object(mailto.LOG, 'exception') as log:
+            task.execute(subscription, self.messages, conf=self.conf)
+
+        self.assertFalse(mock_popen.called)
+        log.assert_called_once_with(mock.ANY, {'host': '127.0.0.1',
+                                               'err': 'connection refused'})
+        self.assertIn('SMTP server', log.call_args[0][0])
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """A minimal SMTP server, recording the emails it receives."""
+
+    def _reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self.server.connections += 1
+        self._reply('220 localhost ESMTP')
+        sender, recipients = None, []
+        for line in iter(self.rfile.readline, b''):
+            command = line.decode('ascii').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self._reply('250 localhost')
+            elif verb == 'MAIL':
+                sender = command.split(':', 1)[1].strip('<> ')
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip('<> '))
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in iter(self.rfile.readline, b'.\r\n'):
+                    lines.append(data.decode('ascii'))
+                self.server.mails.append((sender, recipients,
+                                          ''.join(lines)))
+                sender, recipients = None, []
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('250 OK')
@@ -226,6 +226,37 @@ class MessageControllerTest(ControllerBaseTest):
         self.assertNotIn('newest', message_stats)
         self.assertNotIn('oldest', message_stats)
 
+    def test_bulk_stats(self):
+        for name in ('test-a', 'test-b'):
+            self.addCleanup(self.queue_controller.delete, name,
+                            project=self.project)
+            self.queue_controller.create(name, project=self.project)
+
+        client_uuid = uuid.uuid4()
+        _insert_fixtures(self.controller, 'test-a', project=self.project,
+                         client_uuid=client_uuid, num=3)
+        self.claim_controller.create('test-a', {'ttl': 60, 'grace': 0},
+                                     project=self.project, limit=1)
+
+        stats = self.queue_controller.bulk_stats(
+            ['test-a', 'test-b', 'nonexistent'], project=self.project)
+        self.assertEqual(set(['test-a', 'test-b']), set(stats))
+
+        message_stats = stats['test-a']['messages']
+        self.assertEqual(3, message_stats['total'])
+        self.assertEqual(1, message_stats['claimed'])
+        self.assertEqual(2, message_stats['free'])
+
+        expected = self.queue_controller.stats('test-a',
+                                               project=self.project)
+        for message_stat in ('oldest', 'newest'):
+            self.assertEqual(expected['messages'][message_stat]['id'],
+                             message_stats[message_stat]['id'])
+
+        message_stats = stats['test-b']['messages']
+        self.assertEqual(0, message_stats['total'])
+        self.assertNotIn('oldest', message_stats)
+
     def test_queue_count_on_bulk_delete(self):
         self.addCleanup(self.queue_controller.delete, 'test-queue',
                         project=self.project)
@@ -1466,6 +1497,94 @@ class SubscriptionControllerTest(ControllerBaseTest):
                           )
 
 
+class OutboxControllerTest(ControllerBaseTest):
+    """Outbox Controller base tests.
+
+    NOTE(flaper87): Implementations of this class should
+    override the tearDown method in order
+    to clean up storage's state.
+    """
+    queue_name = 'test_queue'
+    controller_base_class = storage.Outbox
+
+    def setUp(self):
+        super(OutboxControllerTest, self).setUp()
+        self.subscription = {'id': 'sub-id',
+                             'source': self.queue_name,
+                             'subscriber': 'http://fake.example.com',
+                             'options': {}}
+        self.messages = [{'body': {'event': 'BackupStarted'}, 'ttl': 300}]
+
+    def _put(self, **kwargs):
+        return self.controller.put(self.queue_name, self.subscription,
+                                   self.messages, project=self.project,
+                                   **kwargs)
+
+    def test_put_lease_delete(self):
+        entry_id = self._put(retry_policy={'retries_with_no_delay': 1})
+        self.assertEqual(1, self.controller.depth())
+
+        entries = self.controller.lease(10, 60)
+        self.assertEqual(1, len(entries))
+        entry = entries[0]
+        self.assertEqual(entry_id, entry['id'])
+        self.assertEqual(self.project, entry['project'])
+        self.assertEqual(self.queue_name, entry['queue'])
+        self.assertEqual(self.subscription, entry['subscription'])
+        self.assertEqual(self.messages, entry['messages'])
+        self.assertEqual({'retries_with_no_delay': 1}, entry['retry_policy'])
+        self.assertEqual(0, entry['attempts'])
+
+        self.controller.delete(entry_id)
+        self.assertEqual(0, self.controller.depth())
+        self.assertEqual([], self.controller.lease(10, 60))
+
+    def test_lease_hides_entries(self):
+        for __ in range(3):
+            self._put()
+
+        self.assertEqual(2, len(self.controller.lease(2, 60)))
+        self.assertEqual(1, len(self.controller.lease(2, 60)))
+        self.assertEqual([], self.controller.lease(2, 60))
+
+        # NOTE: Leased entries are still part of the backlog.
+        self.assertEqual(3, self.controller.depth())
+
+    def test_health_reports_backlog(self):
+        self._put()
+        self.assertNotIn('notification_backlog', self.pipeline.health())
+
+        self.config(group='notification', use_outbox=True)
+        self.assertEqual(1, self.pipeline.health()['notification_backlog'])
+
+    def test_expired_lease(self):
+        entry_id = self._put()
+        self.controller.lease(10, 60)
+
+        future = timeutils.utcnow_ts() + 61
+        with mock.patch('oslo_utils.timeutils.utcnow_ts',
+                        return_value=future):
+            entries = self.controller.lease(10, 60)
+
+        self.assertEqual([entry_id], [entry['id'] for entry in entries])
+
+    def test_defer(self):
+        entry_id = self._put()
+        self.controller.lease(10, 60)
+
+        self.controller.defer(entry_id, 0)
+        entries = self.controller.lease(10, 60)
+        self.assertEqual(1, len(entries))
+        self.assertEqual(1, entries[0]['attempts'])
+
+        self.controller.defer(entry_id, 30)
+        self.assertEqual([], self.controller.lease(10, 60))
+
+    def test_delete_nonexistent(self):
+        self.controller.delete('5a4c1b2f9e3d7a6b8c0d1e2f')
+        self.assertEqual(0, self.controller.depth())
+
+
 class PoolsControllerTest(ControllerBaseTest):
     """Pools Controller base tests.
 
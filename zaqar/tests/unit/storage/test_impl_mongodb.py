@@ -301,6 +301,18 @@ class MongodbMessageTests(MongodbSetupMixin, base.MessageControllerTest):
             self.assertIn('queue_marker', indexes)
             self.assertIn('counting', indexes)
 
+    def test_bulk_stats_finds_queues_at_once(self):
+        for name in ('test-a', 'test-b'):
+            self.queue_controller.create(name, project=self.project)
+
+        with mock.patch.object(controllers.QueueController,
+                               'exists') as exists:
+            stats = self.queue_controller.bulk_stats(
+                ['test-a', 'nonexistent', 'test-b'], project=self.project)
+            self.assertFalse(exists.called)
+
+        self.assertEqual(set(['test-a', 'test-b']), set(stats))
+
     def test_message_counter(self):
         queue_name = self.queue_name
         iterations = 10
@@ -368,6 +380,60 @@ class MongodbMessageTests(MongodbSetupMixin, base.MessageControllerTest):
 
         timeutils.clear_time_override()
 
+    def test_pop_skips_claimed_messages(self):
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=uuid.uuid4(),
+                              num=5)
+
+        claim_id, claimed = self.claim_controller.create(
+            self.queue_name, {'ttl': 60, 'grace': 0},
+            project=self.project, limit=2)
+        claimed_ids = set(msg['id'] for msg in claimed)
+
+        popped = self.controller.pop(self.queue_name, limit=10,
+                                     project=self.project)
+        self.assertEqual(3, len(popped))
+        for msg in popped:
+            self.assertNotIn(msg['id'], claimed_ids)
+            self.assertIn('body', msg)
+
+        interaction = self.controller.list(self.queue_name,
+                                           project=self.project,
+                                           include_claimed=True)
+        remaining = set(msg['id'] for msg in next(interaction))
+        self.assertEqual(claimed_ids, remaining)
+
+    def test_pop_skips_messages_claimed_in_parallel(self):
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=uuid.uuid4(),
+                              num=3)
+
+        # Simulate a parallel claim between the time the messages to pop
+        # are listed, and the time they are tagged.
+        collection = self.controller._collection(self.queue_name,
+                                                 self.project)
+        update_many = collection.update_many
+
+        def claim_then_update(*args, **kwargs):
+            self.claim_controller.create(self.queue_name,
+                                         {'ttl': 60, 'grace': 0},
+                                         project=self.project, limit=1)
+            return update_many(*args, **kwargs)
+
+        with mock.patch.object(self.controller, '_collection') as coll:
+            coll.return_value = mock.Mock(wraps=collection)
+            coll.return_value.update_many.side_effect = claim_then_update
+
+            popped = self.controller.pop(self.queue_name, limit=3,
+                                         project=self.project)
+
+        self.assertEqual(2, len(popped))
+
+        interaction = self.controller.list(self.queue_name,
+                                           project=self.project,
+                                           include_claimed=True)
+        self.assertEqual(1, len(list(next(interaction))))
+
 
 @testing.requires_mongodb
 class MongodbFIFOMessageTests(MongodbSetupMixin, base.MessageControllerTest):
@@ -449,6 +515,165 @@ class MongodbFIFOMessageTests(MongodbSetupMixin, base.MessageControllerTest):
         self.assertEqual(expected_ids, actual_ids)
 
 
+@testing.requires_mongodb
+class MongodbMaintainedStatsTests(MongodbMessageTests):
+
+    def _prepare_conf(self):
+        super(MongodbMaintainedStatsTests, self)._prepare_conf()
+        self.config(options.MESSAGE_MONGODB_GROUP, stats_mode='maintained',
+                    stats_reconcile_interval=3600)
+
+    def _stats(self):
+        return self.queue_controller.stats(self.queue_name,
+                                           project=self.project)['messages']
+
+    def test_stats_are_maintained(self):
+        # NOTE: The first read creates the stats record.
+        self.assertEqual(0, self._stats()['total'])
+
+        client_uuid = uuid.uuid4()
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=client_uuid,
+                              num=5)
+
+        with mock.patch('zaqar.storage.mongodb.messages.'
+                        'MessageQueueHandler._exact_stats') as exact_stats:
+            stats = self._stats()
+            self.assertFalse(exact_stats.called)
+
+        self.assertEqual(5, stats['total'])
+        self.assertEqual(5, stats['free'])
+        self.assertLess(stats['oldest']['id'], stats['newest']['id'])
+
+        claim_id, messages = self.claim_controller.create(
+            self.queue_name, {'ttl': 60, 'grace': 0},
+            project=self.project, limit=2)
+        messages = list(messages)
+        stats = self._stats()
+        self.assertEqual(2, stats['claimed'])
+        self.assertEqual(3, stats['free'])
+
+        self.controller.delete(self.queue_name, messages[0]['id'],
+                               project=self.project, claim=claim_id)
+        stats = self._stats()
+        self.assertEqual(4, stats['total'])
+        self.assertEqual(1, stats['claimed'])
+
+        self.claim_controller.delete(self.queue_name, claim_id,
+                                     project=self.project)
+        stats = self._stats()
+        self.assertEqual(4, stats['total'])
+        self.assertEqual(0, stats['claimed'])
+
+    def test_oldest_follows_deletes(self):
+        self._stats()
+
+        client_uuid = uuid.uuid4()
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=client_uuid,
+                              num=3)
+        oldest = self._stats()['oldest']['id']
+
+        self.controller.delete(self.queue_name, oldest,
+                               project=self.project)
+        stats = self._stats()
+        self.assertNotEqual(oldest, stats['oldest']['id'])
+        self.assertEqual(2, stats['total'])
+
+        self.controller.pop(self.queue_name, 2, project=self.project)
+        stats = self._stats()
+        self.assertEqual(0, stats['total'])
+        self.assertNotIn('oldest', stats)
+
+    def test_claimed_messages_bulk_deleted(self):
+        self._stats()
+
+        client_uuid = uuid.uuid4()
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=client_uuid,
+                              num=4)
+        claim_id, messages = self.claim_controller.create(
+            self.queue_name, {'ttl': 60, 'grace': 0},
+            project=self.project, limit=2)
+        claimed_ids = [msg['id'] for msg in messages]
+        free_id = self._stats()['newest']['id']
+
+        self.controller.bulk_delete(self.queue_name,
+                                    claimed_ids + [free_id],
+                                    project=self.project)
+        stats = self._stats()
+        self.assertEqual(1, stats['total'])
+        self.assertEqual(0, stats['claimed'])
+        self.assertEqual(1, stats['free'])
+
+    def test_popped_messages_with_expired_claims(self):
+        self._stats()
+
+        client_uuid = uuid.uuid4()
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=client_uuid,
+                              num=5)
+        self.claim_controller.create(self.queue_name, {'ttl': 60, 'grace': 0},
+                                     project=self.project, limit=2)
+        self.assertEqual(2, self._stats()['claimed'])
+
+        # NOTE: The two messages whose claim expired are claimed again,
+        # along with a single new one.
+        future = timeutils.utcnow_ts() + 120
+        with mock.patch('oslo_utils.timeutils.utcnow_ts',
+                        return_value=future):
+            popped = self.controller.pop(self.queue_name, 3,
+                                         project=self.project)
+        self.assertEqual(3, len(popped))
+
+        stats = self._stats()
+        self.assertEqual(0, stats['total'])
+        self.assertEqual(0, stats['claimed'])
+
+    def _reclaim_expired(self):
+        self._stats()
+
+        client_uuid = uuid.uuid4()
+        base._insert_fixtures(self.controller, self.queue_name,
+                              project=self.project, client_uuid=client_uuid,
+                              num=5)
+        self.claim_controller.create(self.queue_name, {'ttl': 60, 'grace': 0},
+                                     project=self.project, limit=2)
+        self.assertEqual(2, self._stats()['claimed'])
+
+        # NOTE: The two messages whose claim expired are claimed again,
+        # along with a single new one.
+        future = timeutils.utcnow_ts() + 120
+        with mock.patch('oslo_utils.timeutils.utcnow_ts',
+                        return_value=future):
+            claim_id, messages = self.claim_controller.create(
+                self.queue_name, {'ttl': 60, 'grace': 0},
+                project=self.project, limit=3)
+        self.assertEqual(3, len(list(messages)))
+
+        stats = self._stats()
+        self.assertEqual(5, stats['total'])
+        self.assertEqual(3, stats['claimed'])
+
+    def test_reclaimed_messages_are_counted_once(self):
+        self._reclaim_expired()
+
+    def test_reclaimed_messages_are_counted_once_legacy(self):
+        self.config(options.MESSAGE_MONGODB_GROUP, bulk_claims=False)
+        self._reclaim_expired()
+
+    def test_stats_are_reconciled(self):
+        self._stats()
+
+        collection = self.controller._stats_collection(self.queue_name,
+                                                       self.project)
+        scope = utils.scope_queue_name(self.queue_name, self.project)
+        collection.update_one({'_id': scope}, {'$set': {'t': 42, 'r': 0}})
+
+        self.assertEqual(0, self._stats()['total'])
+        self.assertEqual(0, collection.find_one({'_id': scope})['t'])
+
+
 @testing.requires_mongodb
 class MongodbClaimTests(MongodbSetupMixin, base.ClaimControllerTest):
 
@@ -484,6 +709,147 @@ class MongodbClaimTests(MongodbSetupMixin, base.ClaimControllerTest):
                           claim_id, {'ttl': 1, 'grace': 0},
                           project=self.project)
 
+    def test_claim_count_is_incremented(self):
+        self.message_controller.post(self.queue_name,
+                                     [{'ttl': 300, 'body': 'yo gabba'}],
+                                     client_uuid=str(uuid.uuid4()),
+                                     project=self.project)
+
+        meta = {'ttl': 60, 'grace': 0}
+        claim_id, messages = self.controller.create(self.queue_name, meta,
+                                                    project=self.project)
+        messages = list(messages)
+        self.assertEqual(1, len(messages))
+        self.assertEqual(1, messages[0]['claim_count'])
+        self.assertEqual(claim_id, messages[0]['claim_id'])
+
+        future = timeutils.utcnow_ts() + 61
+        with mock.patch('oslo_utils.timeutils.utcnow_ts') as mock_utcnow:
+            mock_utcnow.return_value = future
+            claim_id, messages = self.controller.create(self.queue_name,
+                                                        meta,
+                                                        project=self.project)
+            messages = list(messages)
+
+        self.assertEqual(1, len(messages))
+        self.assertEqual(2, messages[0]['claim_count'])
+
+    def test_claim_extends_message_ttl(self):
+        self.message_controller.post(self.queue_name,
+                                     [{'ttl': 60, 'body': 'yo gabba'}],
+                                     client_uuid=str(uuid.uuid4()),
+                                     project=self.project)
+
+        meta = {'ttl': 100, 'grace': 50}
+        claim_id, messages = self.controller.create(self.queue_name, meta,
+                                                    project=self.project)
+        self.assertEqual(150, list(messages)[0]['ttl'])
+
+        claim, messages = self.controller.get(self.queue_name, claim_id,
+                                              project=self.project)
+        self.assertEqual(150, list(messages)[0]['ttl'])
+
+    def test_claim_skips_messages_claimed_in_parallel(self):
+        base._insert_fixtures(self.message_controller, self.queue_name,
+                              project=self.project, client_uuid=uuid.uuid4(),
+                              num=4)
+
+        meta = {'ttl': 60, 'grace': 0}
+        first_id, first = self.controller.create(self.queue_name, meta,
+                                                 project=self.project,
+                                                 limit=2)
+        first_ids = set(msg['id'] for msg in first)
+
+        # Simulate a parallel claim by returning the already claimed
+        # messages as candidates.
+        msg_ctrl = self.driver.message_controller
+        list_messages = msg_ctrl._list
+
+        def active(queue_name, **kwargs):
+            return list_messages(queue_name, include_claimed=True, **kwargs)
+
+        with mock.patch.object(msg_ctrl, '_active', side_effect=active):
+            claim_id, messages = self.controller.create(
+                self.queue_name, meta, project=self.project, limit=4)
+            messages = list(messages)
+
+        self.assertEqual(2, len(messages))
+        for msg in messages:
+            self.assertNotIn(msg['id'], first_ids)
+            self.assertEqual(claim_id, msg['claim_id'])
+
+    def _test_dead_letter_queue_batch(self, dlq_name):
+        self.queue_controller.create(dlq_name, project=self.project)
+        self.addCleanup(self.queue_controller.delete, dlq_name,
+                        project=self.project)
+        metadata = {'_max_claim_count': 1,
+                    '_dead_letter_queue': dlq_name,
+                    '_dead_letter_queue_messages_ttl': 9999}
+        self.queue_controller.set_metadata(self.queue_name, metadata,
+                                           project=self.project)
+
+        base._insert_fixtures(self.message_controller, self.queue_name,
+                              project=self.project, client_uuid=uuid.uuid4(),
+                              num=5)
+
+        meta = {'ttl': 60, 'grace': 0}
+        claim_id, messages = self.controller.create(self.queue_name, meta,
+                                                    project=self.project)
+        self.assertEqual(5, len(list(messages)))
+
+        future = timeutils.utcnow_ts() + 61
+        with mock.patch('oslo_utils.timeutils.utcnow_ts') as mock_utcnow:
+            mock_utcnow.return_value = future
+            claim_id, messages = self.controller.create(self.queue_name,
+                                                        meta,
+                                                        project=self.project)
+            self.assertIsNone(claim_id)
+            self.assertEqual(0, len(list(messages)))
+
+        interaction = self.message_controller.list(self.queue_name,
+                                                   project=self.project,
+                                                   include_claimed=True)
+        self.assertEqual(0, len(list(next(interaction))))
+
+        interaction = self.message_controller.list(dlq_name,
+                                                   project=self.project,
+                                                   include_claimed=True)
+        dead_letters = list(next(interaction))
+        self.assertEqual(5, len(dead_letters))
+        for msg in dead_letters:
+            self.assertEqual(9999, msg['ttl'])
+            self.assertEqual(1, msg['claim_count'])
+
+    def test_dead_letter_queue_batch_same_partition(self):
+        msg_ctrl = self.driver.message_controller
+        with mock.patch.object(msg_ctrl, '_collection',
+                               return_value=msg_ctrl._collections[0]):
+            self._test_dead_letter_queue_batch('DLQ')
+
+    def test_dead_letter_queue_batch_cross_partition(self):
+        msg_ctrl = self.driver.message_controller
+        collections = {self.queue_name: msg_ctrl._collections[0],
+                       'DLQ': msg_ctrl._collections[1]}
+
+        def collection(queue_name, project=None):
+            return collections[queue_name]
+
+        with mock.patch.object(msg_ctrl, '_collection',
+                               side_effect=collection):
+            self._test_dead_letter_queue_batch('DLQ')
+
+
+@testing.requires_mongodb
+class MongodbLegacyClaimTests(MongodbClaimTests):
+
+    def setUp(self):
+        super(MongodbLegacyClaimTests, self).setUp()
+        self.config(options.MESSAGE_MONGODB_GROUP, bulk_claims=False)
+
+    def test_claim_count_is_incremented(self):
+        self.skipTest('The legacy claim algorithm only maintains the claim '
+                      'count for queues with a dead letter queue.')
+
 
 @testing.requires_mongodb
 class MongodbSubscriptionTests(MongodbSetupMixin,
@@ -494,6 +860,14 @@ class MongodbSubscriptionTests(MongodbSetupMixin,
     control_driver_class = mongodb.ControlDriver
 
 
+@testing.requires_mongodb
+class MongodbOutboxTests(MongodbSetupMixin, base.OutboxControllerTest):
+    driver_class = mongodb.DataDriver
+    config_file = 'wsgi_mongodb.conf'
+    controller_class = controllers.OutboxController
+    control_driver_class = mongodb.ControlDriver
+
+
 #
 # TODO(kgriffs): Do these need database purges as well as those above?
 #
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import collections
+import itertools
 import time
 import uuid
 
@@ -332,6 +333,18 @@ class RedisMessagesTest(base.MessageControllerTest):
         num_msg = self.controller._count(queue_name, None)
         self.assertEqual(10, num_msg)
 
+    def test_bulk_stats_checks_queues_at_once(self):
+        for name in ('test-a', 'test-b'):
+            self.queue_controller.create(name, project=self.project)
+
+        with mock.patch.object(controllers.QueueController,
+                               'exists') as exists:
+            stats = self.queue_controller.bulk_stats(
+                ['test-a', 'nonexistent', 'test-b'], project=self.project)
+            self.assertFalse(exists.called)
+
+        self.assertEqual(set(['test-a', 'test-b']), set(stats))
+
     def test_empty_queue_exception(self):
         queue_name = 'empty-queue-test'
         self.queue_controller.create(queue_name)
@@ -356,6 +369,54 @@ class RedisMessagesTest(base.MessageControllerTest):
         num_removed = self.controller.gc()
         self.assertEqual(100, num_removed)
 
+    def test_gc_incremental(self):
+        self.config(options.MESSAGE_REDIS_GROUP, gc_time_budget=60)
+        client_uuid = uuidutils.generate_uuid()
+
+        for queue_name in (self.queue_name, 'fizbit'):
+            self.queue_controller.create(queue_name)
+            self.controller.post(queue_name,
+                                 [{'ttl': 0, 'body': {}}
+                                  for _ in range(150)],
+                                 client_uuid=client_uuid)
+
+        self.controller.post('fizbit', [{'ttl': 300, 'body': {}}],
+                             client_uuid=client_uuid)
+
+        self.assertEqual(300, self.controller.gc())
+        self.assertEqual(0, self.controller.gc())
+
+        # NOTE: Only the queue that still has messages is left in
+        # the expiry index, and it is not due yet.
+        expiry_index = self.connection.zrange(
+            messages.MSGSET_EXPIRY_INDEX_KEY, 0, -1, withscores=True)
+        self.assertEqual(1, len(expiry_index))
+        self.assertEqual(utils.msgset_key('fizbit').encode(),
+                         expiry_index[0][0])
+        self.assertGreater(expiry_index[0][1], timeutils.utcnow_ts())
+
+    def test_gc_incremental_resumes(self):
+        self.config(options.MESSAGE_REDIS_GROUP, gc_time_budget=2.5)
+        self.queue_controller.create(self.queue_name)
+        self.controller.post(self.queue_name,
+                             [{'ttl': 0, 'body': {}} for _ in range(150)],
+                             client_uuid=uuidutils.generate_uuid())
+
+        # NOTE: Every call to time.time() advances the clock by one
+        # second, so that the budget only allows for a single batch.
+        with mock.patch.object(messages, 'time') as mock_time:
+            mock_time.time.side_effect = itertools.count()
+            self.assertEqual(messages.GC_BATCH_SIZE, self.controller.gc())
+
+        cursor = self.connection.hgetall(messages.GC_CURSOR_KEY)
+        self.assertEqual(utils.msgset_key(self.queue_name).encode(),
+                         cursor[b'q'])
+
+        with mock.patch.object(messages, 'time') as mock_time:
+            mock_time.time.side_effect = itertools.count()
+            self.assertEqual(150 - messages.GC_BATCH_SIZE,
+                             self.controller.gc())
+
     def test_invalid_uuid(self):
         queue_name = 'invalid-uuid-test'
         msgs = [{
@@ -466,6 +527,93 @@ class RedisClaimsTest(base.ClaimControllerTest):
         num_removed = self.controller._gc(self.queue_name, None)
         self.assertEqual(5, num_removed)
 
+    def test_claimed_messages_are_indexed_separately(self):
+        self.message_controller.post(self.queue_name,
+                                     [{'ttl': 300, 'body': {}}
+                                      for _ in range(5)],
+                                     client_uuid=uuidutils.generate_uuid(),
+                                     project=self.project)
+
+        unclaimed_key = utils.unclaimed_set_key(self.queue_name,
+                                                self.project)
+        claimed_key = utils.claimed_set_key(self.queue_name, self.project)
+        meta = {'ttl': 60, 'grace': 60}
+
+        claim_id, claimed = self.controller.create(
+            self.queue_name, meta, project=self.project, limit=2)
+        self.assertEqual(3, self.connection.zcard(unclaimed_key))
+        self.assertEqual(2, self.connection.zcard(claimed_key))
+
+        _, claimed_next = self.controller.create(
+            self.queue_name, meta, project=self.project, limit=5)
+        self.assertEqual(3, len(claimed_next))
+        self.assertEqual(0, self.connection.zcard(unclaimed_key))
+
+        # NOTE: Deleting the claim releases its messages, which are
+        # listed again in their original order.
+        self.controller.delete(self.queue_name, claim_id,
+                               project=self.project)
+
+        listed = list(next(self.message_controller.list(
+            self.queue_name, project=self.project)))
+        self.assertEqual([msg['id'] for msg in claimed],
+                         [msg['id'] for msg in listed])
+        self.assertEqual(3, self.connection.zcard(claimed_key))
+
+    def test_legacy_msgset_is_migrated(self):
+        msg_ctrl = self.driver.message_controller
+        self.message_controller.post(self.queue_name,
+                                     [{'ttl': 300, 'body': {}}
+                                      for _ in range(4)],
+                                     client_uuid=uuidutils.generate_uuid(),
+                                     project=self.project)
+        meta = {'ttl': 60, 'grace': 60}
+        self.controller.create(self.queue_name, meta,
+                               project=self.project, limit=1)
+
+        # NOTE: Simulate a queue written before the unclaimed and
+        # claimed sets were introduced.
+        msgset_key = utils.msgset_key(self.queue_name, self.project)
+        unclaimed_key = utils.unclaimed_set_key(self.queue_name,
+                                                self.project)
+        claimed_key = utils.claimed_set_key(self.queue_name, self.project)
+        self.connection.delete(unclaimed_key, claimed_key)
+        self.connection.zadd(messages.MSGSET_INDEX_KEY, 1, msgset_key)
+        msg_ctrl._indexed_msgsets.clear()
+
+        _, claimed = self.controller.create(self.queue_name, meta,
+                                            project=self.project, limit=10)
+        self.assertEqual(3, len(claimed))
+        self.assertEqual(4, self.connection.zcard(claimed_key))
+        self.assertEqual(0, self.connection.zcard(unclaimed_key))
+        self.assertEqual(messages.MSGSET_INDEX_VERSION,
+                         self.connection.zscore(messages.MSGSET_INDEX_KEY,
+                                                msgset_key))
+
+    @mock.patch.object(messages, 'MAX_INDEXED_MSGSETS', 2)
+    def test_indexed_msgsets_are_bounded(self):
+        msg_ctrl = self.driver.message_controller
+        msg_ctrl._indexed_msgsets.clear()
+        for name in ('q1', 'q2', 'q3'):
+            self.queue_controller.create(name, project=self.project)
+            self.addCleanup(self.queue_controller.delete, name,
+                            project=self.project)
+            msg_ctrl._ensure_claim_index(name, self.project)
+
+        self.assertEqual({utils.msgset_key('q3', self.project)},
+                         msg_ctrl._indexed_msgsets)
+
+    def test_deleted_queue_is_not_indexed(self):
+        msg_ctrl = self.driver.message_controller
+        self.queue_controller.create('gone', project=self.project)
+        self.queue_controller.delete('gone', project=self.project)
+        msg_ctrl._ensure_claim_index('gone', self.project)
+
+        msgset_key = utils.msgset_key('gone', self.project)
+        self.assertNotIn(msgset_key, msg_ctrl._indexed_msgsets)
+        self.assertIsNone(self.connection.zscore(messages.MSGSET_INDEX_KEY,
+                                                 msgset_key))
+
 
 @testing.requires_redis
 class RedisSubscriptionTests(base.SubscriptionControllerTest):
@@ -473,3 +621,19 @@ class RedisSubscriptionTests(base.SubscriptionControllerTest):
     config_file = 'wsgi_redis.conf'
     controller_class = controllers.SubscriptionController
     control_driver_class = driver.ControlDriver
+
+
+@testing.requires_redis
+class RedisOutboxTests(base.OutboxControllerTest):
+    driver_class = driver.DataDriver
+    config_file = 'wsgi_redis.conf'
+    controller_class = controllers.OutboxController
+    control_driver_class = driver.ControlDriver
+
+    def setUp(self):
+        super(RedisOutboxTests, self).setUp()
+        self.connection = self.driver.connection
+
+    def tearDown(self):
+        super(RedisOutboxTests, self).tearDown()
+        self.connection.flushdb()
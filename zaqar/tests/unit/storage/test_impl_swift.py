@@ -10,14 +10,36 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import threading
+import time
+import uuid
+
+import futurist
+import mock
+from oslo_cache import core
+import swiftclient
+
 from zaqar.common import cache as oslo_cache
+from zaqar.storage import errors
 from zaqar.storage import mongodb
 from zaqar.storage.swift import controllers
 from zaqar.storage.swift import driver
+from zaqar.storage.swift import options
+from zaqar.storage.swift import utils
 from zaqar import tests as testing
 from zaqar.tests.unit.storage import base
 
 
+def _message_id(timestamp):
+    """Creates a version 1 UUID for the given creation time."""
+    ts = int(timestamp * 1e7) + utils._UUID_EPOCH_OFFSET
+    node = uuid.uuid1()
+    return uuid.UUID(fields=(ts & 0xffffffff, (ts >> 32) & 0xffff,
+                             (ts >> 48) & 0x0fff | 0x1000,
+                             node.clock_seq_hi_variant,
+                             node.clock_seq_low, node.node))
+
+
 @testing.requires_swift
 class SwiftMessagesTest(base.MessageControllerTest):
     driver_class = driver.DataDriver
@@ -27,6 +49,58 @@ class SwiftMessagesTest(base.MessageControllerTest):
     gc_interval = 1
 
 
+@testing.requires_swift
+class SwiftBucketedMessagesTest(SwiftMessagesTest):
+
+    def _prepare_conf(self):
+        self.config(options.MESSAGE_SWIFT_GROUP, message_bucket_width=3600)
+
+    def _post_at(self, timestamp, num):
+        ids = [_message_id(timestamp + i) for i in range(num)]
+        with mock.patch.object(uuid, 'uuid1', side_effect=ids):
+            self.controller.post(self.queue_name, [{'ttl': 300}] * num,
+                                 uuid.uuid4(), project=self.project)
+        return set(str(message_id) for message_id in ids)
+
+    def _page_through(self, sort):
+        listed = []
+        marker = None
+        while True:
+            cursor = self.controller._list(self.queue_name, self.project,
+                                           marker=marker, limit=3,
+                                           echo=True, sort=sort)
+            messages = list(next(cursor))
+            if not messages:
+                return listed
+            listed.extend(msg['id'] for msg in messages)
+            marker = next(cursor)
+
+    def test_paging_across_containers(self):
+        self.queue_controller.create(self.queue_name, project=self.project)
+        now = time.time()
+
+        # NOTE: Messages posted before buckets were enabled are stored
+        # in the container of the queue.
+        self.controller._bucket_width = 0
+        legacy = self._post_at(now - 7200, 2)
+        self.controller._bucket_width = 3600
+
+        previous = self._post_at(now - 3600, 3)
+        current = self._post_at(now, 3)
+
+        listed = self._page_through(1)
+        self.assertEqual(8, len(listed))
+        self.assertEqual(legacy, set(listed[:2]))
+        self.assertEqual(previous, set(listed[2:5]))
+        self.assertEqual(current, set(listed[5:]))
+
+        listed = self._page_through(-1)
+        self.assertEqual(8, len(listed))
+        self.assertEqual(current, set(listed[:3]))
+        self.assertEqual(previous, set(listed[3:6]))
+        self.assertEqual(legacy, set(listed[6:]))
+
+
 @testing.requires_swift
 class SwiftClaimsTest(base.ClaimControllerTest):
     driver_class = driver.DataDriver
@@ -35,6 +109,13 @@ class SwiftClaimsTest(base.ClaimControllerTest):
     control_driver_class = mongodb.ControlDriver
 
 
+@testing.requires_swift
+class SwiftBucketedClaimsTest(SwiftClaimsTest):
+
+    def _prepare_conf(self):
+        self.config(options.MESSAGE_SWIFT_GROUP, message_bucket_width=3600)
+
+
 @testing.requires_swift
 class SwiftSubscriptionsTest(base.SubscriptionControllerTest):
     driver_class = driver.DataDriver
@@ -55,3 +136,320 @@ class SwiftDriverTest(testing.TestBase):
                                          (self.conf, cache))
 
         self.assertTrue(swift_driver.is_alive())
+
+
+class SwiftUtilsTest(testing.TestBase):
+
+    def test_listing_params(self):
+        content_type = utils._message_content_type('c1', 1500000000)
+        params = utils._listing_params({'content_type': content_type})
+        self.assertEqual({'claim_id': 'c1', 'expires': '1500000000'}, params)
+
+        content_type = utils._message_content_type(None, 1500000000)
+        params = utils._listing_params({'content_type': content_type})
+        self.assertEqual('', params['claim_id'])
+
+    def test_listing_params_legacy_object(self):
+        obj = {'content_type': 'application/json'}
+        self.assertEqual({}, utils._listing_params(obj))
+
+    def test_message_created(self):
+        now = time.time()
+        created = utils._message_created(str(uuid.uuid1()))
+        self.assertAlmostEqual(now, created, delta=1)
+
+    def test_bucket_container(self):
+        first = utils._bucket_container('q', 'p', 999999999)
+        second = utils._bucket_container('q', 'p', 1000000000)
+        self.assertEqual('zaqar_message_bucket:q:p:0999999999', first)
+        self.assertLess(first, second)
+
+    def test_bucket_container_start(self):
+        prefix = utils._bucket_prefix('q', 'p')
+        container = utils._bucket_container('q', 'p', 3600)
+        self.assertEqual(3600, utils._bucket_container_start(container,
+                                                             prefix))
+
+        # NOTE: Buckets of the same queue in a project whose ID starts
+        # with 'p:' share the prefix, but are not buckets of 'p'.
+        container = utils._bucket_container('q', 'p:x', 3600)
+        self.assertIsNone(utils._bucket_container_start(container, prefix))
+        self.assertIsNone(utils._bucket_container_start(
+            utils._message_container('q', 'p'), prefix))
+
+    def test_map(self):
+        executor = futurist.ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(executor.shutdown)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def square(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return item * item
+
+        results = utils._map(executor, square, range(8))
+        self.assertEqual([item * item for item in range(8)], results)
+        self.assertGreater(running[1], 1)
+        self.assertLessEqual(running[1], 4)
+
+    def test_map_raises_after_all_calls(self):
+        executor = futurist.ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(executor.shutdown)
+        done = []
+
+        def fail_first(item):
+            if item == 0:
+                raise ValueError()
+            time.sleep(0.05)
+            done.append(item)
+
+        self.assertRaises(ValueError, utils._map, executor, fail_first,
+                          range(4))
+        self.assertEqual([1, 2, 3], sorted(done))
+
+
+class SwiftClientWrapperTest(testing.TestBase):
+    config_file = 'wsgi_swift.conf'
+
+    def setUp(self):
+        super(SwiftClientWrapperTest, self).setUp()
+        self.conf.register_opts(options.MESSAGE_SWIFT_OPTIONS,
+                                group=options.MESSAGE_SWIFT_GROUP)
+        self.swift_conf = self.conf[options.MESSAGE_SWIFT_GROUP]
+        self.wrapper = driver._ClientWrapper(self.swift_conf)
+        self.wrapper.session = mock.Mock()
+
+    @mock.patch('swiftclient.Connection.head_object')
+    @mock.patch('swiftclient.Connection.close')
+    def test_connections_are_reused(self, close, head_object):
+        self.wrapper.head_object('container', 'object')
+        self.wrapper.head_object('container', 'object')
+
+        first = head_object.call_args_list[0][0][0]
+        second = head_object.call_args_list[1][0][0]
+        self.assertIs(first, second)
+        self.assertFalse(close.called)
+
+    @mock.patch('swiftclient.Connection.close')
+    def test_pool_is_bounded(self, close):
+        self.conf.set_override('connection_pool_size', 1,
+                               options.MESSAGE_SWIFT_GROUP)
+        wrapper = driver._ClientWrapper(self.swift_conf)
+        first = wrapper._get_client()
+        second = wrapper._get_client()
+        self.assertIsNot(first, second)
+
+        wrapper._put_client(first)
+        wrapper._put_client(second)
+        self.assertEqual(1, close.call_count)
+        self.assertIs(first, wrapper._get_client())
+
+    def test_unknown_attribute(self):
+        self.assertRaises(AttributeError, getattr, self.wrapper, 'missing')
+
+
+class SwiftMessageGCTest(testing.TestBase):
+
+    def setUp(self):
+        super(SwiftMessageGCTest, self).setUp()
+        self.driver = mock.Mock()
+        self.driver.executor = futurist.SynchronousExecutor()
+        self.driver.swift_conf.message_bucket_width = 3600
+        self.client = self.driver.connection
+        self.controller = controllers.MessageController(self.driver)
+
+    def _object(self, name, expires):
+        return {'name': name,
+                'content_type': utils._message_content_type(None, expires)}
+
+    @mock.patch('oslo_utils.timeutils.utcnow_ts')
+    def test_gc(self, utcnow_ts):
+        now = 1500001000
+        utcnow_ts.return_value = now
+        expired = utils._bucket_container('q', 'p', 1499990400)
+        live = utils._bucket_container('q', 'p', 1499994000)
+        current = utils._bucket_container('q', 'p', 1499997600)
+        objects = {
+            expired: [self._object('m1', now - 10),
+                      self._object('m2', now - 20)],
+            live: [self._object('m3', now - 10),
+                   self._object('m4', now + 10)],
+        }
+        self.client.get_account.return_value = (
+            {}, [{'name': name} for name in (expired, live, current)])
+        self.client.get_container.side_effect = (
+            lambda container, **kwargs: ({}, objects[container]))
+
+        self.assertEqual(2, self.controller.gc())
+        self.client.delete_object.assert_has_calls([
+            mock.call(expired, 'm1', headers={'X-If-Delete-At': str(
+                now - 10)}),
+            mock.call(expired, 'm2', headers={'X-If-Delete-At': str(
+                now - 20)})])
+        self.assertEqual(2, self.client.delete_object.call_count)
+        self.client.delete_container.assert_called_once_with(expired)
+
+    def test_gc_without_buckets(self):
+        self.driver.swift_conf.message_bucket_width = 0
+        controller = controllers.MessageController(self.driver)
+        self.assertEqual(0, controller.gc())
+        self.assertFalse(self.client.get_account.called)
+
+
+class SwiftMessageBucketTest(testing.TestBase):
+
+    def setUp(self):
+        super(SwiftMessageBucketTest, self).setUp()
+        self.driver = mock.Mock()
+        self.driver.executor = futurist.SynchronousExecutor()
+        self.driver.swift_conf.message_bucket_width = 3600
+        self.driver.cache.get.return_value = core.NO_VALUE
+        self.client = self.driver.connection
+        self.controller = controllers.MessageController(self.driver)
+
+        self.now = 1500001000
+        patcher = mock.patch('oslo_utils.timeutils.utcnow_ts',
+                             return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.legacy = utils._message_container('q', 'p')
+        self.older = utils._bucket_container('q', 'p', 1499994000)
+        self.current = utils._bucket_container('q', 'p', 1499997600)
+
+    def _not_found(self, *args, **kwargs):
+        raise swiftclient.ClientException('Not found', http_status=404)
+
+    def _list_containers(self, legacy_count):
+        self.client.head_container.return_value = {
+            'x-container-object-count': str(legacy_count)}
+        self.client.get_account.return_value = (
+            {}, [{'name': self.older}])
+
+    def test_message_containers(self):
+        self._list_containers(2)
+        self.assertEqual([self.legacy, self.older, self.current],
+                         self.controller._message_containers('q', 'p'))
+
+        self._list_containers(0)
+        self.assertEqual([self.older, self.current],
+                         self.controller._message_containers('q', 'p'))
+
+    def test_message_containers_without_buckets(self):
+        self.driver.swift_conf.message_bucket_width = 0
+        controller = controllers.MessageController(self.driver)
+        self.assertEqual([self.legacy],
+                         controller._message_containers('q', 'p'))
+        self.assertFalse(self.client.get_account.called)
+
+    def test_containers_after(self):
+        containers = [self.legacy, self.older, self.current]
+        marker = str(_message_id(1499995000))
+        self.client.head_object.side_effect = self._not_found
+
+        self.assertEqual(
+            [(self.older, marker), (self.current, None)],
+            self.controller._containers_after('q', 'p', marker,
+                                              containers, 1))
+        self.assertEqual(
+            [(self.older, marker), (self.legacy, None)],
+            self.controller._containers_after('q', 'p', marker,
+                                              containers[::-1], -1))
+
+    def test_containers_after_legacy_marker(self):
+        containers = [self.legacy, self.older, self.current]
+        marker = str(_message_id(1499995000))
+
+        self.assertEqual(
+            [(self.legacy, marker), (self.older, None),
+             (self.current, None)],
+            self.controller._containers_after('q', 'p', marker,
+                                              containers, 1))
+        self.assertEqual(
+            [(self.legacy, marker)],
+            self.controller._containers_after('q', 'p', marker,
+                                              containers[::-1], -1))
+        self.client.head_object.assert_called_with(self.legacy, marker)
+
+    def test_filter_containers_carries_limit(self):
+        objects = {
+            self.legacy: [{'name': 'm1'}],
+            self.older: [{'name': 'm2'}, {'name': 'm3'}],
+            self.current: [{'name': 'm4'}, {'name': 'm5'}],
+        }
+
+        def get_container(container, marker=None, **kwargs):
+            return {}, [] if marker else objects[container]
+
+        self.client.get_container.side_effect = get_container
+        self.client.get_object.return_value = (
+            {'x-object-meta-clientid': 'c', 'x-timestamp': self.now},
+            '{"body": {}, "ttl": 60, "claim_id": null}')
+
+        containers = [(self.legacy, None), (self.older, None),
+                      (self.current, None)]
+        messages = list(self.controller._filter_containers(
+            'q', 'p', containers, [], [], {}, 4, None, True))
+
+        self.assertEqual(['m1', 'm2', 'm3', 'm4'],
+                         [msg['id'] for msg in messages])
+        self.assertEqual([self.legacy, self.older, self.older, self.current],
+                         [msg['container'] for msg in messages])
+        self.client.get_container.assert_any_call(
+            self.current, marker=None, limit=2, query_string=None)
+
+    def test_locate_legacy_message(self):
+        self._list_containers(2)
+        message_id = str(_message_id(1499995000))
+        self.client.get_object.side_effect = [
+            swiftclient.ClientException('Not found', http_status=404),
+            ({'x-timestamp': self.now}, '{}')]
+
+        container, _, _ = self.controller._locate_message('q', message_id,
+                                                          'p')
+        self.assertEqual(self.legacy, container)
+        self.client.get_object.assert_has_calls([
+            mock.call(self.older, message_id),
+            mock.call(self.legacy, message_id)])
+
+    def test_locate_missing_message(self):
+        self._list_containers(0)
+        self.client.get_object.side_effect = self._not_found
+
+        self.assertRaises(errors.MessageDoesNotExist,
+                          self.controller._locate_message, 'q',
+                          str(_message_id(1499995000)), 'p')
+
+    def test_locate_message_without_uuid(self):
+        self._list_containers(2)
+        self.client.get_object.return_value = (
+            {'x-timestamp': self.now}, '{}')
+
+        container, _, _ = self.controller._locate_message('q', 'name', 'p')
+        self.assertEqual(self.legacy, container)
+        self.client.get_object.assert_called_once_with(self.legacy, 'name')
+
+    def test_delete_legacy_message(self):
+        self._list_containers(2)
+        message_id = str(_message_id(1499995000))
+        self.client.delete_object.side_effect = [
+            swiftclient.ClientException('Not found', http_status=404),
+            None]
+
+        self.controller._delete('q', message_id, 'p')
+        self.client.delete_object.assert_has_calls([
+            mock.call(self.older, message_id),
+            mock.call(self.legacy, message_id)])
+
+    def test_delete_bucketed_message(self):
+        self._list_containers(2)
+        message_id = str(_message_id(1499995000))
+
+        self.controller._delete('q', message_id, 'p')
+        self.client.delete_object.assert_called_once_with(self.older,
+                                                          message_id)
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import mock
+
 from zaqar import bootstrap
 from zaqar.common import errors
 from zaqar.storage import pooling
@@ -51,3 +53,34 @@ class TestBootstrap(base.TestBase):
     def test_transport_websocket(self):
         bootstrap = self._bootstrap('websocket_mongodb.conf')
         self.assertIsInstance(bootstrap.transport, websocket.Driver)
+
+    @mock.patch('zaqar.transport.wsgi.server.Server')
+    def test_run_wsgi_workers(self, server):
+        bootstrap = self._bootstrap('wsgi_mongodb.conf')
+        for group, opts in wsgi.driver._config_options():
+            self.conf.register_opts(opts, group=group)
+        self.config(workers=2, group='drivers:transport:wsgi')
+
+        bootstrap.run()
+
+        server.return_value.run.assert_called_once_with()
+        self.assertEqual(2, server.call_args[1]['workers'])
+        # NOTE: The transport and the storage are only loaded by the
+        # workers, once forked.
+        self.assertFalse(hasattr(bootstrap, '_lazy_transport'))
+        self.assertFalse(hasattr(bootstrap, '_lazy_storage'))
+
+    @mock.patch('zaqar.common.prefork.Master')
+    def test_run_websocket_workers(self, master):
+        bootstrap = self._bootstrap('websocket_mongodb.conf')
+        for group, opts in websocket.driver._config_options():
+            self.conf.register_opts(opts, group=group)
+        self.config(workers=3, group='drivers:transport:websocket')
+
+        bootstrap.run()
+
+        master.return_value.run.assert_called_once_with()
+        self.assertEqual(3, master.call_args[0][1])
+        self.assertFalse(hasattr(bootstrap, '_lazy_transport'))
+        self.assertFalse(hasattr(bootstrap, '_lazy_api'))
+        self.assertFalse(hasattr(bootstrap, '_lazy_storage'))
@@ -39,6 +39,9 @@ class TestBase(testing.TestBase):
         self.conf.register_opts(driver._WS_OPTIONS,
                                 group=driver._WS_GROUP)
         self.ws_cfg = self.conf[driver._WS_GROUP]
+        # NOTE: Process the requests right away, so that the tests can
+        # check the responses without running the event loop.
+        self.config(group=driver._WS_GROUP, max_workers=0)
 
         self.conf.unreliable = True
         self.conf.admin_mode = True
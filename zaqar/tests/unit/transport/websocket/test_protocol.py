@@ -14,14 +14,26 @@
 #    under the License.
 
 import json
+import threading
+import time
 
 import ddt
 import mock
+import msgpack
 
 from oslo_utils import uuidutils
 import zaqar
+from zaqar.api import handler
+from zaqar.common import consts
+from zaqar import tests as testing
 from zaqar.tests.unit.transport.websocket import base
 from zaqar.tests.unit.transport.websocket import utils as test_utils
+from zaqar.transport.websocket import factory as ws_factory
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
 
 
 @ddt.ddt
@@ -105,3 +117,213 @@ class TestMessagingProtocol(base.TestBase):
             delattr(self.transport, '_lazy_factory')
             self.transport.factory()
             self.assertEqual('ws://[1::4]:9000', mock_pf.mock_calls[0][1][0])
+
+
+class _Handler(handler.Handler):
+
+    def __init__(self, delays):
+        self._subscription_factory = None
+        self._delays = delays
+        self.actions = []
+
+    def process_request(self, req, protocol):
+        self.actions.append(req._action)
+        time.sleep(self._delays.get(req._body['queue_name'], 0))
+        if req._action == consts.CLAIM_CREATE:
+            body = {'claim_id': 'claim', 'messages': [{'body': 1}]}
+            return self.create_response(201, body, req)
+        return self.create_response(200, {}, req)
+
+
+class TestThreadedMessagingProtocol(testing.TestBase):
+
+    def setUp(self):
+        super(TestThreadedMessagingProtocol, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.headers = {
+            'Client-ID': uuidutils.generate_uuid(),
+            'X-Project-ID': 'protocol-test'
+        }
+        self.responses = []
+        self.loop_thread = threading.current_thread()
+
+    def _factory(self, delays, **kwargs):
+        self.handler = _Handler(delays)
+        factory = ws_factory.ProtocolFactory(
+            'ws://127.0.0.1:9000', self.handler, None, None, self.loop,
+            None, max_workers=4, **kwargs)
+        self.addCleanup(factory._executor.shutdown)
+        return factory
+
+    def _connect(self, factory):
+        protocol = factory()
+        protocol.transport = mock.Mock()
+
+        def send(data, is_binary):
+            # NOTE: Responses are sent from the event loop.
+            self.assertIs(self.loop_thread, threading.current_thread())
+            resp = json.loads(data)
+            self.responses.append((protocol, resp['request']['body']))
+
+        protocol.sendMessage = send
+        return protocol
+
+    def _send(self, protocol, queue_name):
+        req = test_utils.create_request(consts.QUEUE_GET,
+                                        {'queue_name': queue_name},
+                                        self.headers)
+        self.loop.call_soon(protocol.onMessage, req, False)
+
+    def _run_until(self, count):
+        deadline = time.time() + 5
+        while len(self.responses) < count and time.time() < deadline:
+            self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(count, len(self.responses))
+
+    def test_requests_are_processed_in_order(self):
+        protocol = self._connect(self._factory({'q0': 0.1, 'q2': 0.05}))
+        for i in range(5):
+            self._send(protocol, 'q%d' % i)
+
+        self._run_until(5)
+        self.assertEqual(['q%d' % i for i in range(5)],
+                         [body['queue_name'] for __, body in self.responses])
+
+    def test_slow_connection_does_not_block_others(self):
+        factory = self._factory({'slow': 0.5})
+        slow = self._connect(factory)
+        fast = self._connect(factory)
+        self._send(slow, 'slow')
+        for i in range(3):
+            self._send(fast, 'fast')
+
+        self._run_until(4)
+        self.assertEqual([fast, fast, fast, slow],
+                         [protocol for protocol, __ in self.responses])
+
+    def test_backpressure(self):
+        protocol = self._connect(self._factory({'q': 0.05},
+                                               max_pending_requests=2))
+        for i in range(4):
+            self._send(protocol, 'q')
+
+        self.loop.run_until_complete(asyncio.sleep(0))
+        protocol.transport.pause_reading.assert_called_once_with()
+        self.assertFalse(protocol.transport.resume_reading.called)
+
+        self._run_until(4)
+        protocol.transport.resume_reading.assert_called_once_with()
+
+    def test_close_during_claim_subscribe(self):
+        protocol = self._connect(self._factory({'q': 0.2}))
+        req = test_utils.create_request(consts.CLAIM_SUBSCRIBE,
+                                        {'queue_name': 'q', 'credit': 5},
+                                        self.headers)
+        self.loop.call_soon(protocol.onMessage, req, False)
+
+        # NOTE: The connection is closed while the first claim is being
+        # made, so the messages it claimed are released instead of being
+        # pushed, and nothing else is claimed.
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        protocol.onClose(True, 1000, u'Bye.')
+        self._run_until(1)
+        self.loop.run_until_complete(asyncio.sleep(0.3))
+
+        self.assertEqual([consts.CLAIM_CREATE, consts.CLAIM_DELETE],
+                         self.handler.actions)
+        self.assertEqual({}, protocol._claim_pushes)
+
+
+class TestNotificationProtocol(testing.TestBase):
+
+    def setUp(self):
+        super(TestNotificationProtocol, self).setUp()
+        self.protos = {'a': mock.Mock(notify_in_binary=False),
+                       'b': mock.Mock(notify_in_binary=True)}
+        factory = ws_factory.NotificationFactory(
+            mock.Mock(_protos=self.protos))
+        factory.set_subscription_url('http://ws:9100/')
+        self.transport = mock.Mock()
+        self.protocol = factory()
+        self.protocol.connection_made(self.transport)
+
+    def _request(self, path, body, headers=b''):
+        return (b'POST /' + path + b' HTTP/1.1\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\n' +
+                headers + b'\r\n' + body)
+
+    def _responses(self):
+        return [call[0][0].split(b'\r\n', 1)[0]
+                for call in self.transport.write.call_args_list]
+
+    def test_pipelined_requests(self):
+        data = (self._request(b'a', b'{"m": 1}') +
+                self._request(b'a', b'{"m": 2}'))
+        # NOTE: The requests are split across several reads.
+        for i in range(0, len(data), 7):
+            self.protocol.data_received(data[i:i + 7])
+
+        self.assertEqual([mock.call(b'{"m": 1}', False),
+                          mock.call(b'{"m": 2}', False)],
+                         self.protos['a'].sendMessage.call_args_list)
+        self.assertEqual([b'HTTP/1.1 200 OK'] * 2, self._responses())
+        self.assertFalse(self.transport.close.called)
+
+    def test_buffer_is_compacted(self):
+        data = (self._request(b'a', b'{"m": 1}') +
+                self._request(b'b', b'{"m": 2}'))
+        split = len(data) - 3
+        self.protocol.data_received(data[:split])
+
+        # NOTE: Only the part of the second body received so far is
+        # left in the buffer, the rest was dropped once parsed.
+        self.assertEqual(b'{"m":', bytes(self.protocol._data))
+        self.protocol.data_received(data[split:])
+
+        self.assertEqual(b'', bytes(self.protocol._data))
+        self.assertEqual([mock.call(b'{"m": 1}', False)],
+                         self.protos['a'].sendMessage.call_args_list)
+        self.assertEqual([mock.call(msgpack.packb({'m': 2}), True)],
+                         self.protos['b'].sendMessage.call_args_list)
+
+    def test_connection_close(self):
+        self.protocol.data_received(
+            self._request(b'a', b'{}', b'Connection: close\r\n'))
+
+        self.assertEqual([b'HTTP/1.1 200 OK'], self._responses())
+        self.assertIn(b'Connection: close',
+                      self.transport.write.call_args[0][0])
+        self.transport.close.assert_called_once_with()
+
+    def test_batch(self):
+        messages = [{'body': 1}, {'body': 2}]
+        batch = {'subscribers': ['http://ws:9100/a', 'http://ws:9100/b',
+                                 'http://ws:9100/a/claims/q',
+                                 'http://ws:9100/gone'],
+                 'messages': messages}
+        self.protocol.data_received(
+            self._request(b'batch', json.dumps(batch).encode()))
+
+        self.assertEqual([b'HTTP/1.1 200 OK'], self._responses())
+        self.assertEqual(
+            [mock.call(json.dumps(msg).encode(), False) for msg in messages],
+            self.protos['a'].sendMessage.call_args_list)
+        self.assertEqual(
+            [mock.call(msgpack.packb(msg), True) for msg in messages],
+            self.protos['b'].sendMessage.call_args_list)
+        self.protos['a'].notify_claims.assert_called_once_with('q')
+
+    def test_bad_requests(self):
+        requests = [
+            (b'GET /a HTTP/1.1\r\n\r\n', b'HTTP/1.1 405 Method Not Allowed'),
+            (b'POST /a HTTP/1.1\r\n\r\n', b'HTTP/1.1 411 Length Required'),
+            (self._request(b'', b'{}'), b'HTTP/1.1 400 Bad Request'),
+            (self._request(b'batch', b'[]'), b'HTTP/1.1 400 Bad Request'),
+        ]
+        for data, status in requests:
+            self.transport.reset_mock()
+            self.protocol.connection_made(self.transport)
+            self.protocol.data_received(data)
+            self.assertEqual([status], self._responses())
+            self.transport.close.assert_called_once_with()
@@ -12,6 +12,7 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import functools
 import json
 
 import ddt
@@ -22,6 +23,7 @@ from oslo_utils import uuidutils
 from zaqar.common import consts
 from zaqar.tests.unit.transport.websocket import base
 from zaqar.tests.unit.transport.websocket import utils as test_utils
+from zaqar.transport.websocket import factory
 
 
 @ddt.ddt
@@ -422,6 +424,85 @@ class ClaimsBaseTest(base.V1_1Base):
         resp = json.loads(send_mock.call_args[0][0])
         self.assertEqual(404,  resp['headers']['status'])
 
+    def _send(self, action, body):
+        send_mock = mock.Mock()
+        self.protocol.sendMessage = send_mock
+
+        req = test_utils.create_request(action, body, self.headers)
+        self.protocol.onMessage(req, False)
+        return [json.loads(call[0][0]) for call in send_mock.call_args_list]
+
+    def _pushed(self, loop):
+        send_mock = mock.Mock()
+        self.protocol.sendMessage = send_mock
+        loop.run_ready()
+        resps = [json.loads(call[0][0]) for call in send_mock.call_args_list]
+        for resp in resps:
+            self.assertEqual(consts.CLAIM_CREATE, resp['request']['action'])
+            self.assertEqual(201, resp['headers']['status'])
+        return [len(resp['body']['messages']) for resp in resps]
+
+    def test_claim_subscribe(self):
+        loop = _FakeLoop()
+        self.protocol._loop = loop
+
+        body = {"queue_name": "skittle", "credit": 4, "limit": 3,
+                "ttl": 100, "grace": 60}
+        resp, = self._send(consts.CLAIM_SUBSCRIBE, body)
+        self.assertEqual(201, resp['headers']['status'])
+
+        # NOTE: Messages are pushed until the credit is used.
+        self.assertEqual([3, 1], self._pushed(loop))
+        self.assertEqual([], loop.callbacks)
+
+        body = {"queue_name": "skittle", "credit": 10}
+        resp, = self._send(consts.CLAIM_CREDIT, body)
+        self.assertEqual(200, resp['headers']['status'])
+        self.assertEqual(10, resp['body']['credit'])
+
+        # NOTE: Then until the queue is empty, and it is polled again
+        # later.
+        self.assertEqual([3, 2], self._pushed(loop))
+        self.assertEqual([self.protocol.factory._claim_poll_interval],
+                         [delay for delay, __ in loop.callbacks])
+
+        resp, = self._send(consts.CLAIM_UNSUBSCRIBE,
+                           {"queue_name": "skittle"})
+        self.assertEqual(204, resp['headers']['status'])
+        self.assertEqual([], loop.callbacks)
+
+    def test_claim_subscribe_notified(self):
+        loop = _FakeLoop()
+        self.protocol._loop = loop
+        self._send(consts.CLAIM_SUBSCRIBE,
+                   {"queue_name": "skittle", "credit": 20})
+        self.assertEqual([9], self._pushed(loop))
+
+        body = {"queue_name": "skittle",
+                "messages": [{'body': 1, 'ttl': 300}]}
+        self._send(consts.MESSAGE_POST, body)
+
+        notification_factory = factory.NotificationFactory(
+            self.protocol.factory)
+        notification_factory.send_data(
+            b'{}', self.protocol.proto_id + '/claims/skittle')
+        self.assertEqual([1], self._pushed(loop))
+
+    def test_claim_subscribe_invalid_claim(self):
+        body = {"queue_name": "skittle", "credit": 4, "ttl": 1}
+        resp, = self._send(consts.CLAIM_SUBSCRIBE, body)
+        self.assertEqual(400, resp['headers']['status'])
+
+        body = {"queue_name": "skittle", "credit": 4}
+        resp, = self._send(consts.CLAIM_CREDIT, body)
+        self.assertEqual(404, resp['headers']['status'])
+
+    @ddt.data(0, -1, 'a')
+    def test_claim_credit_invalid(self, credit):
+        body = {"queue_name": "skittle", "credit": credit}
+        resp, = self._send(consts.CLAIM_SUBSCRIBE, body)
+        self.assertEqual(400, resp['headers']['status'])
+
     def _get_a_claim(self):
         action = consts.CLAIM_CREATE
         body = {"queue_name": "skittle",
@@ -437,3 +518,35 @@ class ClaimsBaseTest(base.V1_1Base):
         self.assertEqual(201, resp['headers']['status'])
 
         return resp
+
+
+class _FakeLoop(object):
+    """Runs the callbacks scheduled without delay on demand."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def time(self):
+        return 0
+
+    def call_soon(self, callback, *args):
+        return self.call_later(0, callback, *args)
+
+    call_soon_threadsafe = call_soon
+
+    def call_later(self, delay, callback, *args):
+        entry = (delay, functools.partial(callback, *args))
+        self.callbacks.append(entry)
+        handle = mock.Mock()
+        handle.cancel.side_effect = lambda: (
+            entry in self.callbacks and self.callbacks.remove(entry))
+        return handle
+
+    def run_ready(self):
+        while True:
+            ready = [entry for entry in self.callbacks if not entry[0]]
+            if not ready:
+                return
+            for entry in ready:
+                self.callbacks.remove(entry)
+                entry[1]()
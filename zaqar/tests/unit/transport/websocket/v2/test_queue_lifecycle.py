@@ -602,6 +602,62 @@ class QueueLifecycleBaseTest(base.V2Base):
             mock_queue_list.return_value = fake_generator()
             self.protocol.onMessage(req, False)
 
+    def test_get_stats_many(self):
+        headers = {
+            'Client-ID': uuidutils.generate_uuid(),
+            'X-Project-ID': 'test-project'
+        }
+
+        for queue_name in ('q1', 'q2', 'q3'):
+            req = test_utils.create_request(consts.QUEUE_CREATE,
+                                            {'queue_name': queue_name},
+                                            headers)
+            self.protocol.onMessage(req, False)
+        self._post_messages('q2', headers, repeat=2)
+
+        send_mock = mock.patch.object(self.protocol, 'sendMessage')
+        self.addCleanup(send_mock.stop)
+        sender = send_mock.start()
+
+        action = consts.QUEUE_GET_STATS_MANY
+        body = {'queue_names': ['q2', 'nonexistent']}
+        req = test_utils.create_request(action, body, headers)
+
+        def validator(resp, isBinary):
+            resp = json.loads(resp)
+            self.assertEqual(200, resp['headers']['status'])
+            queues = resp['body']['queues']
+            self.assertEqual(['q2'], [queue['name'] for queue in queues])
+            self.assertEqual(2, queues[0]['messages']['total'])
+
+        sender.side_effect = validator
+        self.protocol.onMessage(req, False)
+
+        # Pages of the project's queues
+        body = {'limit': 2}
+        req = test_utils.create_request(action, body, headers)
+
+        def validator(resp, isBinary):
+            resp = json.loads(resp)
+            self.assertEqual(200, resp['headers']['status'])
+            queues = resp['body']['queues']
+            self.assertEqual(['q1', 'q2'],
+                             [queue['name'] for queue in queues])
+            self.assertEqual('q2', resp['body']['marker'])
+
+        sender.side_effect = validator
+        self.protocol.onMessage(req, False)
+
+        body = {'queue_names': ['q1'] * 21}
+        req = test_utils.create_request(action, body, headers)
+
+        def validator(resp, isBinary):
+            resp = json.loads(resp)
+            self.assertEqual(400, resp['headers']['status'])
+
+        sender.side_effect = validator
+        self.protocol.onMessage(req, False)
+
     def _post_messages(self, queue_name, headers, repeat=1):
         messages = [{'body': 239, 'ttl': 300}] * repeat
 
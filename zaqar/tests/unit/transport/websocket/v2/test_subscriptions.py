@@ -22,6 +22,7 @@ import msgpack
 from oslo_utils import uuidutils
 from zaqar.common import auth
 from zaqar.common import consts
+from zaqar.notification.tasks import webhook
 from zaqar.storage import errors as storage_errors
 from zaqar.tests.unit.transport.websocket import base
 from zaqar.tests.unit.transport.websocket import utils as test_utils
@@ -321,9 +322,10 @@ class SubscriptionTest(base.V1_1Base):
             subscriber['id'], project=self.project_id)
 
         # Send a message in text format
-        webhook_notification_send_mock = mock.patch('requests.post')
+        webhook_notification_send_mock = mock.patch('requests.Session.post')
         self.addCleanup(webhook_notification_send_mock.stop)
         webhook_notification_sender = webhook_notification_send_mock.start()
+        webhook_notification_sender.return_value = mock.Mock(status_code=200)
 
         action = consts.MESSAGE_POST
         body = {"queue_name": "kitkat",
@@ -337,6 +339,8 @@ class SubscriptionTest(base.V1_1Base):
         message_create_response = json.loads(sender.call_args_list[1][0][0])
         self.assertEqual(201, message_create_response['headers']['status'])
 
+        webhook.get_dispatcher(self.boot.conf).wait()
+
         # Fetch webhook notification that was intended to arrive to
         # notification protocol's listen address. Make subscription factory
         # send it as websocket notification to the client
@@ -0,0 +1,81 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from six.moves import http_client
+import testtools
+
+from zaqar.common import prefork
+from zaqar.transport.wsgi import server
+
+
+def _app(environ, start_response):
+    # NOTE: Ignore the request body, so that the server has to skip it.
+    body = environ['PATH_INFO'].encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+class TestWSGIServer(testtools.TestCase):
+
+    def _serve(self, keepalive_timeout):
+        sock = prefork.listen('127.0.0.1', 0)
+        httpd = server.WSGIServer(sock, _app, threads=2,
+                                  keepalive_timeout=keepalive_timeout)
+
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.start()
+
+        def stop():
+            httpd.stop()
+            thread.join()
+            httpd.server_close()
+
+        self.addCleanup(stop)
+
+        conn = http_client.HTTPConnection(*sock.getsockname())
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_keep_alive(self):
+        conn = self._serve(keepalive_timeout=5)
+
+        conn.request('POST', '/first', body=b'{"ignored": true}')
+        resp = conn.getresponse()
+        self.assertEqual(b'/first', resp.read())
+        self.assertIsNone(resp.getheader('Connection'))
+        first_sock = conn.sock
+
+        conn.request('GET', '/second')
+        resp = conn.getresponse()
+        self.assertEqual(200, resp.status)
+        self.assertEqual(b'/second', resp.read())
+        self.assertIs(first_sock, conn.sock)
+
+    def test_keep_alive_disabled(self):
+        conn = self._serve(keepalive_timeout=0)
+
+        conn.request('GET', '/only')
+        resp = conn.getresponse()
+        self.assertEqual(b'/only', resp.read())
+        self.assertEqual('close', resp.getheader('Connection'))
+
+    def test_connection_close_requested(self):
+        conn = self._serve(keepalive_timeout=5)
+
+        conn.request('GET', '/only', headers={'Connection': 'close'})
+        resp = conn.getresponse()
+        self.assertEqual(b'/only', resp.read())
+        self.assertEqual('close', resp.getheader('Connection'))
@@ -187,3 +187,61 @@ class TestUtils(testtools.TestCase):
         length = None
         self.assertRaises(falcon.HTTPBadRequest,
                           utils.deserialize, stream, length)
+
+    def _array_stream(self, document):
+        data = document.encode('utf-8')
+        return io.BytesIO(data), len(data)
+
+    def test_deserialize_array(self):
+        messages = [{u'body': {u'event': u'café' * 20000}, u'ttl': 60},
+                    {u'body': 12345678901234, u'ttl': 300, u'bogus': 1}]
+        document = json.dumps({u'extra': [1, {u'a': 2}],
+                               u'messages': messages,
+                               u'trailing': 1.5}, ensure_ascii=False)
+        spec = (('ttl', int, None), ('body', '*', None))
+
+        stream, length = self._array_stream(document)
+        items = list(utils.deserialize_array(stream, length,
+                                             'messages', spec))
+
+        self.assertEqual([{u'body': m[u'body'], u'ttl': m[u'ttl']}
+                          for m in messages], items)
+
+    def test_deserialize_array_is_incremental(self):
+        document = json.dumps({u'messages': [{u'ttl': 60}, u'x' * 10]})
+        stream, length = self._array_stream(document)
+
+        items = utils.deserialize_array(stream, length, 'messages')
+
+        self.assertEqual({u'ttl': 60}, next(items))
+        self.assertRaises(falcon.HTTPBadRequest, next, items)
+
+    def test_deserialize_array_errors(self):
+        for document in (u'{"messages": [{"ttl": 60}',
+                         u'{"messages": {"ttl": 60}}',
+                         u'{"messages": [], "messages": []}',
+                         u'{"messages": []} {}',
+                         u'[{"ttl": 60}]',
+                         u'{"messages": [{"ttl": 99999999999999999999}]}',
+                         u'{"other": []}'):
+            stream, length = self._array_stream(document)
+            items = utils.deserialize_array(stream, length, 'messages')
+            self.assertRaises(falcon.HTTPBadRequest, list, items)
+
+        self.assertRaises(falcon.HTTPBadRequest,
+                          utils.deserialize_array, None, None, 'messages')
+
+    def test_deserialize_array_error_descriptions(self):
+        for document, description in (
+                (u'{"messages": {"ttl": 60}}',
+                 u'Document type not supported.'),
+                (u'[{"ttl": 60}]',
+                 u'No messages were found in the request body.'),
+                (u'{"other": []}',
+                 u'No messages were found in the request body.'),
+                (u'{"messages": [{"ttl": 60}',
+                 u'Request body could not be parsed.')):
+            stream, length = self._array_stream(document)
+            items = utils.deserialize_array(stream, length, 'messages')
+            ex = self.assertRaises(falcon.HTTPBadRequest, list, items)
+            self.assertEqual(description, ex.description)
@@ -448,6 +448,56 @@ class TestQueueLifecycleMongoDB(base.V2Base):
         self.simulate_get(target, headers=header, query_string='marker=zzz')
         self.assertEqual(falcon.HTTP_200, self.srmock.status)
 
+    def test_bulk_stats(self):
+        stats_path = self.url_prefix + '/stats'
+
+        for name in ('q1', 'q2', 'q3'):
+            self.simulate_put(self.queue_path + '/' + name,
+                              headers=self.headers)
+            self.assertEqual(falcon.HTTP_201, self.srmock.status)
+
+        doc = '{"messages": [{"ttl": 300, "body": {}}]}'
+        self.simulate_post(self.queue_path + '/q2/messages',
+                           headers=self.headers, body=doc)
+        self.assertEqual(falcon.HTTP_201, self.srmock.status)
+
+        # Given queues, unknown ones are left out
+        result = self.simulate_get(stats_path, headers=self.headers,
+                                   query_string='queues=q2,q1,nonexistent')
+        self.assertEqual(falcon.HTTP_200, self.srmock.status)
+        result_doc = jsonutils.loads(result[0])
+        self.assertEqual([], result_doc['links'])
+
+        queues = result_doc['queues']
+        self.assertEqual(['q2', 'q1'], [queue['name'] for queue in queues])
+        self.assertEqual(1, queues[0]['messages']['total'])
+        self.assertIn('/queues/q2/messages/',
+                      queues[0]['messages']['oldest']['href'])
+        self.assertEqual(0, queues[1]['messages']['total'])
+
+        # Pages of the project's queues
+        result = self.simulate_get(stats_path, headers=self.headers,
+                                   query_string='limit=2')
+        result_doc = jsonutils.loads(result[0])
+        self.assertEqual(['q1', 'q2'],
+                         [queue['name'] for queue in result_doc['queues']])
+
+        [target, params] = result_doc['links'][0]['href'].split('?')
+        result = self.simulate_get(target, headers=self.headers,
+                                   query_string=params)
+        result_doc = jsonutils.loads(result[0])
+        self.assertEqual(['q3'],
+                         [queue['name'] for queue in result_doc['queues']])
+
+        # Too many queues
+        self.simulate_get(stats_path, headers=self.headers,
+                          query_string='queues=' + ','.join(['q1'] * 21))
+        self.assertEqual(falcon.HTTP_400, self.srmock.status)
+
+        self.simulate_get(stats_path, headers=self.headers,
+                          query_string='queues=Nice-Bo@t')
+        self.assertEqual(falcon.HTTP_400, self.srmock.status)
+
     def test_list_returns_503_on_nopoolfound_exception(self):
         arbitrary_number = 644079696574693
         project_id = str(arbitrary_number)
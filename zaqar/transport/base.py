@@ -99,6 +99,21 @@ class DriverBase(object):
         self._conf.register_opts(_GENERAL_TRANSPORT_OPTIONS)
         self._defaults = ResourceDefaults(self._conf)
 
+    @classmethod
+    def prefork(cls, conf, load):
+        """Serve from worker processes, if configured to.
+
+        The workers are forked before the driver is loaded, so that the
+        storage drivers it uses are loaded in each of them.
+
+        :param conf: configuration instance
+        :type conf: oslo_config.cfg.CONF
+        :param load: Function loading the driver, called in each worker
+        :returns: False if the driver is to be loaded and served from
+            the current process instead
+        """
+        return False
+
     @abc.abstractmethod
     def listen(self):
         """Start listening for client requests (self-hosting mode)."""
@@ -13,9 +13,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import codecs
 import json
 
 from oslo_utils import encodeutils
+import six
+
+# NOTE(kgriffs): Large enough to amortize the cost of each read, small
+# enough that a streamed request never buffers much more than one item.
+_READ_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = u' \t\n\r'
 
 
 class MalformedJSON(ValueError):
@@ -28,6 +36,16 @@ class OverflowedJSONInteger(OverflowError):
     pass
 
 
+class MissingJSONField(KeyError):
+    """JSON object does not contain the requested field."""
+    pass
+
+
+class UnexpectedJSONType(TypeError):
+    """JSON value is not of the expected type."""
+    pass
+
+
 def _json_int(s):
     """Parse a string as a base 10 64-bit signed integer."""
     i = int(s)
@@ -55,6 +73,196 @@ def read_json(stream, len):
         raise MalformedJSON(ex)
 
 
+class _JSONStreamReader(object):
+    """Decodes JSON tokens and values incrementally from a stream.
+
+    Only the unconsumed tail of the input is kept in memory, so the
+    footprint is bounded by the largest single value plus one chunk.
+    """
+
+    def __init__(self, stream, length, chunk_size=_READ_CHUNK_SIZE):
+        self._stream = stream
+        self._remaining = length
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder(parse_int=_json_int)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = u''
+        self._pos = 0
+
+    def _fill(self):
+        """Appends the next chunk to the buffer.
+
+        :returns: False if the stream is exhausted, True otherwise
+        """
+        if self._remaining <= 0:
+            return False
+
+        data = self._stream.read(min(self._chunk_size, self._remaining))
+        if not data:
+            self._remaining = 0
+            text = self._utf8.decode(b'', True)
+        elif isinstance(data, six.text_type):
+            self._remaining -= len(data)
+            text = data
+        else:
+            self._remaining -= len(data)
+            text = self._utf8.decode(data, self._remaining <= 0)
+
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return bool(data)
+
+    def peek(self):
+        """Returns the next non-whitespace character, or None at EOF."""
+        while True:
+            buf = self._buffer
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+
+            if pos < len(buf):
+                return buf[pos]
+
+            if not self._fill():
+                return None
+
+    def next_char(self):
+        """Consumes and returns the next non-whitespace character."""
+        char = self.peek()
+        if char is None:
+            raise MalformedJSON('Unexpected end of JSON input')
+
+        self._pos += 1
+        return char
+
+    def expect(self, char):
+        if self.next_char() != char:
+            raise MalformedJSON('Expected %r' % char)
+
+    def value(self):
+        """Consumes and returns the next complete JSON value."""
+        if self.peek() is None:
+            raise MalformedJSON('Unexpected end of JSON input')
+
+        while True:
+            try:
+                result, end = self._decoder.raw_decode(self._buffer,
+                                                       self._pos)
+            except ValueError:
+                # NOTE(kgriffs): Most likely the value straddles a chunk
+                # boundary; only give up once there is nothing left.
+                if not self._fill():
+                    raise
+                continue
+
+            # NOTE(kgriffs): A number that ends exactly at the end of
+            # the buffer may continue in the next chunk.
+            if end == len(self._buffer) and self._fill():
+                continue
+
+            self._pos = end
+            return result
+
+
+def _read_fields(reader):
+    """Yields the key of each field of an object, once its '{' is read.
+
+    The caller must consume the value of each field before asking for
+    the next key.
+    """
+    if reader.peek() == u'}':
+        reader.next_char()
+        return
+
+    while True:
+        key = reader.value()
+        if not isinstance(key, six.text_type):
+            raise MalformedJSON('Object keys must be strings')
+
+        reader.expect(u':')
+        yield key
+
+        char = reader.next_char()
+        if char == u'}':
+            return
+        if char != u',':
+            raise MalformedJSON('Expected "," or "}"')
+
+
+def _read_array(reader):
+    """Yields the items of the array starting at the next character."""
+    if reader.peek() != u'[':
+        raise UnexpectedJSONType('Expected an array')
+
+    reader.next_char()
+    if reader.peek() == u']':
+        reader.next_char()
+        return
+
+    while True:
+        yield reader.value()
+
+        char = reader.next_char()
+        if char == u']':
+            return
+        if char != u',':
+            raise MalformedJSON('Expected "," or "]"')
+
+
+def read_json_array(stream, len, field):
+    """Incrementally yields the items of an array field of a JSON object.
+
+    Unlike read_json, the document is never buffered in full; each item
+    of the array is decoded and yielded as soon as it has been read from
+    the stream, and the remaining fields of the object are parsed and
+    discarded. Errors are raised lazily, as they are encountered.
+
+    :param stream: a file-like object
+    :param len: the number of bytes to read from stream
+    :param field: name of the top-level field containing the array
+    :raises MalformedJSON: if the document is not valid JSON, is not an
+        object or an array, or the field is repeated
+    :raises OverflowedJSONInteger: if an integer is too large
+    :raises MissingJSONField: if the document does not contain the field
+    :raises UnexpectedJSONType: if the field is not an array
+    """
+    try:
+        reader = _JSONStreamReader(stream, len)
+        found = False
+
+        if reader.peek() == u'[':
+            # NOTE: Like read_json, accept a top-level array, which
+            # then has no field at all.
+            reader.value()
+        else:
+            reader.expect(u'{')
+            for key in _read_fields(reader):
+                if key != field:
+                    reader.value()
+                    continue
+
+                if found:
+                    raise MalformedJSON('Duplicate field: %s' % field)
+
+                found = True
+                for item in _read_array(reader):
+                    yield item
+
+        if reader.peek() is not None:
+            raise MalformedJSON('Extra data after JSON document')
+
+    except UnicodeDecodeError as ex:
+        raise MalformedJSON(ex)
+    except MalformedJSON:
+        raise
+    except ValueError as ex:
+        raise MalformedJSON(ex)
+
+    if not found:
+        raise MissingJSONField(field)
+
+
 def to_json(obj):
     """Like json.dumps, but outputs a UTF-8 encoded string.
 
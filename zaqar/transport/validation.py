@@ -440,6 +440,28 @@ class Validator(object):
         for msg in messages:
             self.message_content(msg)
 
+    def message_stream(self, messages):
+        """Restrictions on a stream of messages.
+
+        Like message_posting, but validates each message as it is
+        consumed from the given iterable, so that a bad message is
+        reported before the rest of the stream has been read.
+
+        :param messages: An iterable of messages
+        :returns: A generator yielding each message once validated
+        :raises ValidationFailed: if any message has a out-of-range
+            TTL, or the stream is empty.
+        """
+
+        empty = True
+        for msg in messages:
+            self.message_content(msg)
+            empty = False
+            yield msg
+
+        if empty:
+            raise ValidationFailed(_(u'No messages to enqueu.'))
+
     def message_length(self, content_length, max_msg_post_size=None):
         """Restrictions on message post length.
 
@@ -637,6 +659,7 @@ class Validator(object):
             raise ValidationFailed(msg)
 
         self._validate_retry_policy(options)
+        self._validate_post_batch(options)
 
         ttl = subscription.get('ttl')
         if ttl:
@@ -663,6 +686,22 @@ class Validator(object):
             except OverflowError:
                 raise ValidationFailed(msg, datetime.datetime.max)
 
+    def _validate_post_batch(self, options):
+        if not options:
+            return
+
+        post_batch = options.get('post_batch')
+        if post_batch is not None and not isinstance(post_batch, bool):
+            msg = _(u'post_batch must be a boolean.')
+            raise ValidationFailed(msg)
+
+        batch_size = options.get('post_batch_size')
+        if batch_size is not None and (
+                isinstance(batch_size, bool) or
+                not isinstance(batch_size, int) or batch_size < 1):
+            msg = _(u'post_batch_size must be a positive integer.')
+            raise ValidationFailed(msg)
+
     def subscription_confirming(self, confirmed):
         confirmed = confirmed.get('confirmed')
         if not isinstance(confirmed, bool):
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import signal
 import socket
 
 from oslo_config import cfg
@@ -25,6 +26,8 @@ except ImportError:
     import trollius as asyncio
 
 from zaqar.common import decorators
+from zaqar.common import errors
+from zaqar.common import prefork
 from zaqar.i18n import _
 from zaqar.transport import base
 from zaqar.transport.middleware import auth
@@ -47,12 +50,47 @@ _WS_OPTIONS = (
                             'listen.'),
 
     cfg.PortOpt('notification-port', default=0,
-                help='Port on which the notification server will listen.'),
+                help='Port on which the notification server will listen. '
+                     'When several workers are running, each of them '
+                     'runs its own notification server, listening on this '
+                     'port plus the index of the worker, or on a random '
+                     'port if set to 0.'),
+
+    cfg.IntOpt('workers', default=1, min=1,
+               help='Number of processes serving connections. When greater '
+                    'than 1, worker processes are pre-forked by a master '
+                    'process, which restarts them if they die. Each worker '
+                    'binds its own socket using SO_REUSEPORT, so that the '
+                    'kernel balances incoming connections across workers.'),
+
+    cfg.FloatOpt('claim-poll-interval', default=5, min=0.1,
+                 help='Number of seconds between two claims of the messages '
+                      'pushed to a consumer subscribed with claim_subscribe, '
+                      'while it has credit left but no message is posted. '
+                      'Claims are otherwise made as soon as messages are '
+                      'posted. This catches up with the messages released '
+                      'by other claims.'),
+
+    cfg.IntOpt('max-workers', default=20, min=0,
+               help='Number of threads processing the requests, so that '
+                    'slow storage calls do not block the other connections. '
+                    'The requests of each connection are processed one at a '
+                    'time and in order. Set to 0 to process the requests in '
+                    'the event loop.'),
+
+    cfg.IntOpt('max-pending-requests', default=20, min=1,
+               help='Number of requests of a connection waiting to be '
+                    'processed above which the server stops reading from '
+                    'the connection.'),
 
 )
 
 _WS_GROUP = 'drivers:transport:websocket'
 
+# NOTE: Number of seconds workers are given to exit once asked to,
+# before being killed.
+_SHUTDOWN_TIMEOUT = 10
+
 LOG = logging.getLogger(__name__)
 
 
@@ -95,12 +133,36 @@ class Driver(base.DriverBase):
             external_port=self._ws_conf.external_port,
             auth_strategy=self._auth_strategy,
             loop=asyncio.get_event_loop(),
-            secret_key=self._conf.signed_url.secret_key)
+            secret_key=self._conf.signed_url.secret_key,
+            claim_poll_interval=self._ws_conf.claim_poll_interval,
+            max_workers=self._ws_conf.max_workers,
+            max_pending_requests=self._ws_conf.max_pending_requests)
 
     @decorators.lazy_property(write=False)
     def notification_factory(self):
         return factory.NotificationFactory(self.factory)
 
+    @classmethod
+    def prefork(cls, conf, load):
+        conf.register_opts(_WS_OPTIONS, group=_WS_GROUP)
+        ws_conf = conf[_WS_GROUP]
+        if ws_conf.workers == 1:
+            return False
+
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise errors.ConfigurationError(
+                u'SO_REUSEPORT is not supported on this platform')
+
+        msgtmpl = _(u'Serving on host %(bind)s:%(port)s')
+        LOG.info(msgtmpl, {'bind': ws_conf.bind, 'port': ws_conf.port})
+
+        # NOTE: Each worker loads the driver, with its own API handler and
+        # storage, once forked.
+        prefork.Master(lambda index: load()._serve_worker(index),
+                       ws_conf.workers, u'WebSocket',
+                       shutdown_timeout=_SHUTDOWN_TIMEOUT).run()
+        return True
+
     def listen(self):
         """Self-host the WebSocket server.
 
@@ -112,15 +174,53 @@ class Driver(base.DriverBase):
         LOG.info(msgtmpl,
                  {'bind': self._ws_conf.bind, 'port': self._ws_conf.port})
 
+        self._serve(self._ws_conf.notification_port)
+
+    def _serve_worker(self, index):
+        """Run the servers of a worker process until stopped by SIGTERM.
+
+        Each worker binds its own socket to the WebSocket address using
+        SO_REUSEPORT, and runs its own notification server, since the
+        connections it notifies only live in this worker.
+
+        :param index: Index of the worker, from 0 to 'workers' - 1
+        """
+        # NOTE: The event loop is set before the factories, which hold a
+        # reference to it, are created.
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        def stop(signum, frame):
+            loop.call_soon_threadsafe(loop.stop)
+
+        signal.signal(signal.SIGTERM, stop)
+
+        sock = prefork.listen(self._ws_conf.bind, self._ws_conf.port,
+                              reuse_port=True)
+        notification_port = self._ws_conf.notification_port
+        if notification_port:
+            notification_port += index
+        self._serve(notification_port, sock=sock)
+
+    def _serve(self, notification_port, sock=None):
+        """Run the WebSocket and notification servers until stopped.
+
+        :param notification_port: Port the notification server listens on
+        :param sock: Listening socket to serve WebSocket connections from,
+            instead of binding one from the 'bind' and 'port' options
+        """
         loop = asyncio.get_event_loop()
         coro_notification = loop.create_server(
             self.notification_factory,
             self._ws_conf.notification_bind,
-            self._ws_conf.notification_port)
-        coro = loop.create_server(
-            self.factory,
-            self._ws_conf.bind,
-            self._ws_conf.port)
+            notification_port)
+        if sock is not None:
+            coro = loop.create_server(self.factory, sock=sock)
+        else:
+            coro = loop.create_server(
+                self.factory,
+                self._ws_conf.bind,
+                self._ws_conf.port)
 
         def got_server(task):
             # Retrieve the port number of the listening socket
@@ -136,7 +236,7 @@ class Driver(base.DriverBase):
         task = asyncio.Task(coro_notification)
         task.add_done_callback(got_server)
 
-        loop.run_until_complete(asyncio.wait([coro, task]))
+        loop.run_until_complete(asyncio.wait([asyncio.Task(coro), task]))
 
         try:
             loop.run_forever()
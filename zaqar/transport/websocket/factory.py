@@ -16,30 +16,44 @@
 import json
 
 from autobahn.asyncio import websocket
+import futurist
 import msgpack
 from oslo_utils import uuidutils
+from six.moves import urllib_parse
 
 from zaqar.transport.websocket import protocol
 
+_CLAIMS_PATH = '/claims/'
+
+# NOTE: Can't clash with a connection, whose ID is a UUID.
+_BATCH_PATH = 'batch'
+
 
 class ProtocolFactory(websocket.WebSocketServerFactory):
 
     protocol = protocol.MessagingProtocol
 
     def __init__(self, uri, handler, external_port, auth_strategy,
-                 loop, secret_key):
+                 loop, secret_key, claim_poll_interval=5, max_workers=0,
+                 max_pending_requests=20):
         websocket.WebSocketServerFactory.__init__(
             self, url=uri, externalPort=external_port)
         self._handler = handler
         self._auth_strategy = auth_strategy
         self._loop = loop
         self._secret_key = secret_key
+        self._claim_poll_interval = claim_poll_interval
+        self._max_pending_requests = max_pending_requests
+        self._executor = None
+        if max_workers:
+            self._executor = futurist.ThreadPoolExecutor(
+                max_workers=max_workers)
         self._protos = {}
 
     def __call__(self):
         proto_id = uuidutils.generate_uuid()
         proto = self.protocol(self._handler, proto_id, self._auth_strategy,
-                              self._loop)
+                              self._loop, executor=self._executor)
         self._protos[proto_id] = proto
         proto.factory = self
         return proto
@@ -61,14 +75,78 @@ class NotificationFactory(object):
     def get_subscriber(self, protocol):
         return '%s%s' % (self._subscription_url, protocol.proto_id)
 
+    def get_claim_subscriber(self, protocol, queue_name):
+        return '%s%s%s%s' % (self._subscription_url, protocol.proto_id,
+                             _CLAIMS_PATH, queue_name)
+
+    def get_batch_url(self):
+        return self._subscription_url + _BATCH_PATH
+
+    def _get_instance(self, path):
+        proto_id, claims, queue_name = path.partition(_CLAIMS_PATH)
+        return self.message_factory._protos.get(proto_id), queue_name
+
+    def deliver(self, path, body):
+        """Delivers the body of a notification request.
+
+        :param path: Path the request was sent to, without the leading
+            slash
+        :param body: Body of the request, as a memoryview
+        :raises ValueError: if the body of a batch is invalid
+        """
+        if path == _BATCH_PATH:
+            self.send_batch(body)
+        else:
+            self.send_data(body.tobytes(), path)
+
     def send_data(self, data, proto_id):
-        instance = self.message_factory._protos.get(proto_id)
-        if instance:
+        instance, queue_name = self._get_instance(proto_id)
+        if instance and queue_name:
+            # NOTE: The connection only needs to know that messages
+            # were posted, it claims them itself.
+            instance.notify_claims(queue_name)
+        elif instance:
             # NOTE(Eva-i): incoming data is encoded in JSON, let's convert it
             # to MsgPack, if notification should be encoded in binary format.
             if instance.notify_in_binary:
                 data = msgpack.packb(json.loads(data))
             instance.sendMessage(data, instance.notify_in_binary)
 
+    def send_batch(self, body):
+        """Sends each message of a batch to each of its subscribers.
+
+        The batch is a JSON document holding the URLs of the subscribers
+        and the messages, as in
+        ``{"subscribers": [url, ...], "messages": [message, ...]}``.
+        Messages are encoded once for all the subscribers.
+        """
+        batch = json.loads(body.tobytes().decode('utf-8'))
+        try:
+            subscribers = batch['subscribers']
+            messages = batch['messages']
+        except (KeyError, TypeError):
+            raise ValueError('Invalid notification batch')
+
+        encoded = {}
+        for subscriber in subscribers:
+            path = urllib_parse.urlsplit(subscriber).path[1:]
+            instance, queue_name = self._get_instance(path)
+            if not instance:
+                continue
+            if queue_name:
+                instance.notify_claims(queue_name)
+                continue
+
+            binary = instance.notify_in_binary
+            if binary not in encoded:
+                if binary:
+                    encoded[binary] = [msgpack.packb(message)
+                                       for message in messages]
+                else:
+                    encoded[binary] = [json.dumps(message).encode('utf-8')
+                                       for message in messages]
+            for data in encoded[binary]:
+                instance.sendMessage(data, binary)
+
     def __call__(self):
         return self.protocol(self)
@@ -13,8 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import datetime
-import io
+import functools
 import json
 import sys
 
@@ -23,6 +24,7 @@ import msgpack
 from oslo_log import log as logging
 from oslo_utils import timeutils
 import pytz
+import six
 import txaio
 
 try:
@@ -30,14 +32,8 @@ try:
 except ImportError:
     import trollius as asyncio
 
-try:
-    import mimetools
-    Message = mimetools.Message
-except ImportError:
-    from email.mime import message
-    Message = message.MIMEMessage
-
 from zaqar.common import consts
+from zaqar import storage
 
 
 LOG = logging.getLogger(__name__)
@@ -55,7 +51,8 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
         'wsgi.url_scheme': 'http'
     }
 
-    def __init__(self, handler, proto_id, auth_strategy, loop):
+    def __init__(self, handler, proto_id, auth_strategy, loop,
+                 executor=None):
         txaio.use_asyncio()
         websocket.WebSocketServerProtocol.__init__(self)
         self._handler = handler
@@ -69,6 +66,12 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
         self._deauth_handle = None
         self.notify_in_binary = None
         self._subscriptions = []
+        self._claim_pushes = {}
+        self._executor = executor
+        self._pending = collections.deque()
+        self._busy = False
+        self._paused = False
+        self._closed = False
 
     def onConnect(self, request):
         LOG.info("Client connecting: %s", request.peer)
@@ -77,6 +80,58 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
         LOG.info("WebSocket connection open.")
 
     def onMessage(self, payload, isBinary):
+        self._submit(functools.partial(self._process_message, payload,
+                                       isBinary))
+
+        # NOTE: Stop reading from the socket while the client sends
+        # requests faster than they are processed.
+        if (self._executor is not None and not self._paused and
+                len(self._pending) >= self.factory._max_pending_requests):
+            self._paused = True
+            self.transport.pause_reading()
+
+    def _submit(self, func):
+        """Runs `func` once the previous requests are processed.
+
+        Requests are processed by the thread pool of the factory, one at
+        a time for each connection so that their order is preserved, or
+        right away in the event loop if the factory has no thread pool.
+        Must be called from the event loop.
+        """
+        if self._executor is None:
+            func()
+            return
+
+        self._pending.append(func)
+        if not self._busy:
+            self._process_next()
+
+    def _process_next(self, future=None):
+        if future is not None and future.exception() is not None:
+            LOG.error('Failed to process a request: %s', future.exception())
+
+        if not self._pending:
+            self._busy = False
+            return
+
+        self._busy = True
+        func = self._pending.popleft()
+        if (self._paused and
+                len(self._pending) < self.factory._max_pending_requests):
+            self._paused = False
+            self.transport.resume_reading()
+
+        future = self._loop.run_in_executor(self._executor, func)
+        future.add_done_callback(self._process_next)
+
+    def _in_loop(self, func, *args):
+        """Calls `func` from the event loop."""
+        if self._executor is None:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _process_message(self, payload, isBinary):
         # Deserialize the request
         try:
             if isBinary:
@@ -113,7 +168,7 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
                     if 'URL-Signature' in payload.get('headers', {}):
                         if self._handler.verify_signature(
                                 self.factory._secret_key, payload):
-                            resp = self._handler.process_request(req, self)
+                            resp = self._process_request(req, isBinary)
                         else:
                             body = {'error': 'Not authentified.'}
                             resp = self._handler.create_response(
@@ -126,7 +181,7 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
             elif payload.get('action') == 'authenticate':
                 return self._authenticate(payload, isBinary)
             else:
-                resp = self._handler.process_request(req, self)
+                resp = self._process_request(req, isBinary)
             if payload.get('action') == consts.SUBSCRIPTION_CREATE:
                 # NOTE(Eva-i): this will make further websocket
                 # notifications encoded in the same format as the last
@@ -141,10 +196,114 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
         return self._send_response(resp, isBinary)
 
     def onClose(self, wasClean, code, reason):
-        self._handler.clean_subscriptions(self._subscriptions)
+        self._closed = True
+        self._pending.clear()
+        # NOTE: A request still being processed may subscribe to claims,
+        # so claim pushes are cancelled once it is done.
+        self._submit(self._clean_up)
         self.factory.unregister(self.proto_id)
         LOG.info("WebSocket connection closed: %s", reason)
 
+    def _clean_up(self):
+        for push in self._claim_pushes.values():
+            self._in_loop(push.cancel)
+        self._claim_pushes = {}
+        self._handler.clean_subscriptions(self._subscriptions)
+
+    def _process_request(self, req, in_binary):
+        if req._action == consts.CLAIM_SUBSCRIBE:
+            return self._claim_subscribe(req, in_binary)
+        elif req._action == consts.CLAIM_CREDIT:
+            return self._claim_credit(req)
+        elif req._action == consts.CLAIM_UNSUBSCRIBE:
+            return self._claim_unsubscribe(req)
+        return self._handler.process_request(req, self)
+
+    def _claim_subscribe(self, req, in_binary):
+        if self._closed:
+            body = {'error': 'Connection closed.'}
+            return self._handler.create_response(410, body, req)
+
+        queue_name = req._body['queue_name']
+        push = ClaimPush(self, req, in_binary, self._loop,
+                         self.factory._claim_poll_interval)
+
+        # NOTE: Claim once right away, so that invalid claim parameters
+        # are reported in the response to the subscription.
+        resp = push.claim()
+        status = resp._headers['status']
+        if status not in (201, 204):
+            return self._handler.create_response(status, resp._body, req)
+
+        previous = self._claim_pushes.pop(queue_name, None)
+        if previous is not None:
+            self._in_loop(previous.cancel)
+            push.subscription = previous.subscription
+        self._claim_pushes[queue_name] = push
+
+        if push.subscription is None:
+            push.subscription = self._subscribe_claims(req)
+
+        # NOTE: Messages are pushed after the response to this request.
+        if status == 201:
+            self._loop.call_soon_threadsafe(
+                self._submit, functools.partial(push.push, resp))
+        else:
+            self._in_loop(push.schedule, push.poll_interval)
+
+        body = {'queue_name': queue_name, 'credit': push.credit}
+        return self._handler.create_response(201, body, req)
+
+    def _subscribe_claims(self, req):
+        """Subscribes to the posts of a queue, to claim messages sooner."""
+        queue_name = req._body['queue_name']
+        subscriber = self._handler.get_claim_subscriber(self, queue_name)
+        if subscriber is None:
+            return None
+
+        payload = {'action': consts.SUBSCRIPTION_CREATE,
+                   'headers': req._headers,
+                   'body': {'queue_name': queue_name,
+                            'subscriber': subscriber,
+                            'options':
+                                self._handler.get_subscription_options()}}
+        sub_req = self._handler.create_request(payload, self._auth_env)
+        resp = self._handler.process_request(sub_req, self)
+        if resp._headers['status'] != 201:
+            LOG.debug('Claims of queue %(queue)s will only be polled: '
+                      '%(body)s', {'queue': queue_name, 'body': resp._body})
+            return None
+        self._subscriptions.append(resp)
+        return resp
+
+    def _claim_credit(self, req):
+        queue_name = req._body['queue_name']
+        push = self._claim_pushes.get(queue_name)
+        if push is None:
+            body = {'error': 'Not subscribed to the claims of queue %s.' %
+                    queue_name}
+            return self._handler.create_response(404, body, req)
+
+        push.credit += req._body['credit']
+        self._in_loop(push.schedule)
+        body = {'queue_name': queue_name, 'credit': push.credit}
+        return self._handler.create_response(200, body, req)
+
+    def _claim_unsubscribe(self, req):
+        push = self._claim_pushes.pop(req._body['queue_name'], None)
+        if push is not None:
+            self._in_loop(push.cancel)
+            if push.subscription is not None:
+                self._subscriptions.remove(push.subscription)
+                self._handler.clean_subscriptions([push.subscription])
+        return self._handler.create_response(204, {}, req)
+
+    def notify_claims(self, queue_name):
+        """Claims messages of a queue, once messages were posted to it."""
+        push = self._claim_pushes.get(queue_name)
+        if push is not None:
+            push.schedule()
+
     def _authenticate(self, payload, in_binary):
         self._auth_in_binary = in_binary
         self._auth_app = self._auth_strategy(self._auth_start)
@@ -164,12 +323,15 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
         expire_time = timeutils.parse_isotime(expire)
         now = datetime.datetime.now(tz=pytz.UTC)
         delta = (expire_time - now).total_seconds()
+        self._in_loop(self._schedule_deauthentication, delta)
+
+        start_response('200 OK', [])
+
+    def _schedule_deauthentication(self, delay):
         if self._deauth_handle is not None:
             self._deauth_handle.cancel()
         self._deauth_handle = self._loop.call_later(
-            delta, self._deauthenticate)
-
-        start_response('200 OK', [])
+            delay, self._deauthenticate)
 
     def _deauthenticate(self):
         self._authentified = False
@@ -204,10 +366,12 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
     def _send_response(self, resp, in_binary):
         if in_binary:
             pack_name = 'bin'
-            self.sendMessage(msgpack.packb(resp.get_response()), True)
+            self._in_loop(self.sendMessage,
+                          msgpack.packb(resp.get_response()), True)
         else:
             pack_name = 'txt'
-            self.sendMessage(json.dumps(resp.get_response()), False)
+            self._in_loop(self.sendMessage,
+                          json.dumps(resp.get_response()), False)
         if LOG.isEnabledFor(logging.INFO):
             api = resp._request._api
             status = resp._headers['status']
@@ -221,7 +385,149 @@ class MessagingProtocol(websocket.WebSocketServerProtocol):
                      var_dict)
 
 
+class ClaimPush(object):
+    """Claims messages on behalf of a consumer, and pushes them to it.
+
+    The consumer grants credit, the number of messages it is ready to
+    receive: every pushed message uses one credit, which the consumer
+    grants back with `claim_credit` once done with the message. Messages
+    are claimed whenever the queue notifies the connection that messages
+    were posted, as long as credit is left. Since messages can also
+    become available without being posted, e.g. when a claim expires,
+    the queue is additionally claimed every `poll_interval` seconds.
+
+    :param protocol: connection of the consumer
+    :param req: `claim_subscribe` request
+    :param in_binary: whether to push the messages in binary format
+    :param loop: event loop of the connection
+    :param poll_interval: number of seconds between two claims while
+        nothing is posted to the queue
+    """
+
+    def __init__(self, protocol, req, in_binary, loop, poll_interval):
+        self._protocol = protocol
+        self._headers = req._headers
+        self._in_binary = in_binary
+        self._loop = loop
+        self.poll_interval = poll_interval
+
+        body = req._body
+        self.credit = body['credit']
+        self._limit = body.get('limit', storage.DEFAULT_MESSAGES_PER_CLAIM)
+        self._claim_body = dict((key, body[key])
+                                for key in ('queue_name', 'ttl', 'grace')
+                                if key in body)
+
+        self.subscription = None
+        self._handle = None
+        self._due = None
+
+    def claim(self):
+        """Claims as many messages as the credit allows.
+
+        :returns: the `claim_create` response
+        """
+        body = dict(self._claim_body, limit=min(self.credit, self._limit))
+        payload = {'action': consts.CLAIM_CREATE,
+                   'headers': self._headers,
+                   'body': body}
+        handler = self._protocol._handler
+        req = handler.create_request(payload, self._protocol._auth_env)
+        resp = handler.process_request(req, self._protocol)
+        if resp._headers['status'] == 201:
+            self.credit -= len(resp._body['messages'])
+        return resp
+
+    def push(self, resp=None):
+        """Pushes messages until the queue is empty or the credit is used.
+
+        :param resp: response of a claim made beforehand, if any
+        """
+        while True:
+            # NOTE: The connection may have been closed since the push
+            # was scheduled; messages claimed for it are released.
+            if self._protocol._closed:
+                if resp is not None and resp._headers['status'] == 201:
+                    self.release(resp._body['claim_id'])
+                return
+
+            if resp is None:
+                if self.credit <= 0:
+                    return
+                limit = min(self.credit, self._limit)
+                resp = self.claim()
+            else:
+                limit = len(resp._body.get('messages', ()))
+
+            status = resp._headers['status']
+            if status != 204:
+                self._protocol._send_response(resp, self._in_binary)
+            if (status != 201 or self.credit <= 0 or
+                    len(resp._body['messages']) < limit):
+                break
+            resp = None
+
+        self._protocol._in_loop(self.schedule, self.poll_interval)
+
+    def release(self, claim_id):
+        """Deletes a claim, so that its messages can be claimed again."""
+        payload = {'action': consts.CLAIM_DELETE,
+                   'headers': self._headers,
+                   'body': {'queue_name': self._claim_body['queue_name'],
+                            'claim_id': claim_id}}
+        handler = self._protocol._handler
+        req = handler.create_request(payload, self._protocol._auth_env)
+        handler.process_request(req, self._protocol)
+
+    def schedule(self, delay=0):
+        """Claims messages after `delay` seconds, unless done sooner."""
+        if self.credit <= 0:
+            return
+        due = self._loop.time() + delay
+        if self._handle is not None:
+            if self._due <= due:
+                return
+            self._handle.cancel()
+        self._due = due
+        self._handle = self._loop.call_later(delay, self._run)
+
+    def _run(self):
+        self._handle = None
+        self._protocol._submit(self.push)
+
+    def cancel(self):
+        """Stops claiming messages."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+class _HTTPError(Exception):
+
+    def __init__(self, status):
+        super(_HTTPError, self).__init__(status)
+        self.status = status
+
+
+def _release(view):
+    # NOTE: Python 2 views have no release(), they are only released
+    # once every reference to them is dropped.
+    if six.PY3:
+        view.release()
+
+
 class NotificationProtocol(asyncio.Protocol):
+    """Receives the notifications sent to the subscribers of connections.
+
+    Notifications are HTTP/1.1 POST requests. Connections are kept open
+    unless the client asks otherwise, and pipelined requests are
+    processed in order. The body of each request is sliced out of the
+    receive buffer without copying the rest of the buffer.
+    """
+
+    # NOTE: Same limit as the one used by the WSGI server for the
+    # request line alone.
+    _MAX_HEAD_SIZE = 65536
 
     def __init__(self, factory):
         self._factory = factory
@@ -229,44 +535,95 @@ class NotificationProtocol(asyncio.Protocol):
     def connection_made(self, transport):
         self._transport = transport
         self._data = bytearray()
-        self._state = 'INIT'
-        self._subscriber_id = None
-        self._length = 0
+        # NOTE: Path, body length and keep-alive flag of the request
+        # whose head was parsed but whose body is not fully received.
+        self._request = None
+
+    def write_status(self, status, keep_alive=False):
+        if keep_alive:
+            self._transport.write(b'HTTP/1.1 ' + status +
+                                  b'\r\nContent-Length: 0\r\n\r\n')
+        else:
+            self._transport.write(b'HTTP/1.1 ' + status +
+                                  b'\r\nContent-Length: 0\r\n'
+                                  b'Connection: close\r\n\r\n')
+            self._transport.close()
+
+    def _parse_head(self, head):
+        lines = head.split(b'\r\n')
+        try:
+            verb, uri, version = lines[0].split()
+        except ValueError:
+            raise _HTTPError(b'400 Bad Request')
+        if verb != b'POST':
+            raise _HTTPError(b'405 Method Not Allowed')
+
+        headers = {}
+        for line in lines[1:]:
+            name, __, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if b'transfer-encoding' in headers:
+            raise _HTTPError(b'411 Length Required')
+        try:
+            length = int(headers[b'content-length'])
+        except (KeyError, ValueError):
+            raise _HTTPError(b'411 Length Required')
+
+        connection = headers.get(b'connection')
+        if version == b'HTTP/1.1':
+            keep_alive = connection != b'close'
+        else:
+            keep_alive = connection == b'keep-alive'
 
-    def write_status(self, status):
-        self._transport.write(b'HTTP/1.0 %s\r\n\r\n' % status)
-        self._transport.close()
+        return uri[1:].decode('utf-8'), length, keep_alive
 
     def data_received(self, data):
         self._data.extend(data)
-        if self._state == 'INIT' and b'\r\n' in self._data:
-            first_line, self._data = self._data.split(b'\r\n', 1)
-            verb, uri, version = first_line.split()
-            if verb != b'POST':
-                self.write_status(b'405 Not Allowed')
-                return
-            self._state = 'HEADERS'
-            self._subscriber_id = uri[1:]
-
-        if self._state == 'HEADERS' and b'\r\n\r\n' in self._data:
-            headers, self._data = self._data.split(b'\r\n\r\n', 1)
-            headers = Message(io.BytesIO(headers))
-            length = headers.get(b'content-length')
-            if not length:
-                self.write_status(b'400 Bad Request')
-                return
-            self._length = int(length)
-            self._state = 'BODY'
-
-        if self._state == 'BODY':
-            if len(self._data) >= self._length:
-                if self._subscriber_id:
-                    self._factory.send_data(bytes(self._data),
-                                            str(self._subscriber_id))
-                    self.write_status(b'200 OK')
-                else:
-                    self.write_status(b'400 Bad Request')
+        offset = 0
+        view = memoryview(self._data)
+        try:
+            while True:
+                if self._request is None:
+                    end = self._data.find(b'\r\n\r\n', offset)
+                    if end < 0:
+                        if len(self._data) - offset > self._MAX_HEAD_SIZE:
+                            raise _HTTPError(
+                                b'431 Request Header Fields Too Large')
+                        break
+                    self._request = self._parse_head(
+                        view[offset:end].tobytes())
+                    offset = end + 4
+
+                path, length, keep_alive = self._request
+                if len(self._data) - offset < length:
+                    break
+                body = view[offset:offset + length]
+                offset += length
+                self._request = None
+
+                try:
+                    if not path:
+                        raise ValueError('Missing subscriber')
+                    self._factory.deliver(path, body)
+                except ValueError:
+                    raise _HTTPError(b'400 Bad Request')
+                finally:
+                    _release(body)
+                    del body
+
+                self.write_status(b'200 OK', keep_alive)
+                if not keep_alive:
+                    break
+        except _HTTPError as ex:
+            LOG.debug('Rejected notification: %s', ex.status)
+            self.write_status(ex.status)
+        finally:
+            # NOTE: The buffer can't be resized while a view on it
+            # exists.
+            _release(view)
+            del view
+            del self._data[:offset]
 
     def connection_lost(self, exc):
-        self._data = self._subscriber_id = None
-        self._length = 0
+        self._data = self._request = None
@@ -32,6 +32,7 @@ from zaqar.transport.middleware import auth
 from zaqar.transport.middleware import cors
 from zaqar.transport.middleware import profile
 from zaqar.transport import validation
+from zaqar.transport.wsgi import server
 from zaqar.transport.wsgi import v1_0
 from zaqar.transport.wsgi import v1_1
 from zaqar.transport.wsgi import v2_0
@@ -44,6 +45,36 @@ _WSGI_OPTIONS = (
 
     cfg.PortOpt('port', default=8888,
                 help='Port on which the self-hosting server will listen.'),
+
+    cfg.IntOpt('workers', default=1, min=1,
+               help=('Number of processes serving requests. When greater '
+                     'than 1, worker processes are pre-forked by a master '
+                     'process, which restarts them if they die. On SIGHUP, '
+                     'the master reads the configuration files again and '
+                     'gracefully replaces the workers with new ones, '
+                     'loaded with the new options. The options of the '
+                     'server itself, such as its address, are kept.')),
+
+    cfg.IntOpt('threads', default=1, min=1,
+               help=('Number of threads serving connections in each worker '
+                     'process. When both this option and "workers" are set '
+                     'to 1, the single-threaded wsgiref server is used.')),
+
+    cfg.BoolOpt('reuse_port', default=False,
+                help=('Have each worker process bind its own socket using '
+                      'SO_REUSEPORT, so that the kernel balances incoming '
+                      'connections across workers, instead of sharing a '
+                      'single listening socket.')),
+
+    cfg.IntOpt('keepalive_timeout', default=5, min=0,
+               help=('Number of seconds an idle connection is kept open '
+                     'waiting for the next request. Set to 0 to close '
+                     'connections after each request.')),
+
+    cfg.IntOpt('shutdown_timeout', default=30, min=0,
+               help=('Number of seconds worker processes are given to '
+                     'finish serving their requests when stopped or '
+                     'reloaded, before being killed.')),
 )
 
 _WSGI_GROUP = 'drivers:transport:wsgi'
@@ -179,15 +210,47 @@ class Driver(transport.DriverBase):
                     address_family = socket.AF_INET6
         return server_cls
 
+    @classmethod
+    def prefork(cls, conf, load):
+        conf.register_opts(_WSGI_OPTIONS, group=_WSGI_GROUP)
+        wsgi_conf = conf[_WSGI_GROUP]
+        if wsgi_conf.workers == 1:
+            return False
+
+        msgtmpl = _(u'Serving on host %(bind)s:%(port)s')
+        LOG.info(msgtmpl, {'bind': wsgi_conf.bind, 'port': wsgi_conf.port})
+
+        # NOTE: The configuration files are read again on SIGHUP, so that
+        # the new workers load the driver with the new options. Those of
+        # the server itself, such as its address, are kept.
+        _server(wsgi_conf, lambda: load().app, workers=wsgi_conf.workers,
+                reload=conf.reload_config_files).run()
+        return True
+
     def listen(self):
         """Self-host using 'bind' and 'port' from the WSGI config group."""
 
         msgtmpl = _(u'Serving on host %(bind)s:%(port)s')
         LOG.info(msgtmpl,
                  {'bind': self._wsgi_conf.bind, 'port': self._wsgi_conf.port})
+
+        if self._wsgi_conf.threads > 1:
+            _server(self._wsgi_conf, lambda: self.app).run()
+            return
+
         server_cls = self._get_server_cls(self._wsgi_conf.bind)
         httpd = simple_server.make_server(self._wsgi_conf.bind,
                                           self._wsgi_conf.port,
                                           self.app,
                                           server_cls)
         httpd.serve_forever()
+
+
+def _server(wsgi_conf, app_factory, workers=1, reload=None):
+    return server.Server(app_factory, wsgi_conf.bind, wsgi_conf.port,
+                         workers=workers,
+                         threads=wsgi_conf.threads,
+                         reuse_port=wsgi_conf.reuse_port,
+                         keepalive_timeout=wsgi_conf.keepalive_timeout,
+                         shutdown_timeout=wsgi_conf.shutdown_timeout,
+                         reload=reload)
@@ -0,0 +1,331 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-forking, multi-threaded WSGI server for self-hosting Zaqar.
+
+The server forks a number of worker processes that either share a single
+listening socket or, if SO_REUSEPORT is enabled, bind their own socket to
+the same address. Each worker builds its own application once forked,
+serves connections from a pool of threads, and supports HTTP/1.1
+keep-alive.
+
+Workers are run by a `zaqar.common.prefork.Master`. On SIGHUP, a new set
+of workers is started, and the old ones are asked to stop once they are
+done with the requests they are serving. On SIGTERM or SIGINT, all the
+workers are stopped the same way.
+"""
+
+import signal
+import socket
+import threading
+from wsgiref import simple_server
+
+import futurist
+from oslo_log import log as logging
+
+from zaqar.common import errors
+from zaqar.common import prefork
+
+LOG = logging.getLogger(__name__)
+
+# NOTE: Same limit as the one used by the standard library.
+_MAX_REQUEST_LINE = 65536
+
+# NOTE: Maximum number of bytes of an unread request body that are
+# discarded to keep a connection alive; above that, the connection
+# is closed instead.
+_MAX_DRAIN_SIZE = 65536
+
+
+class _Input(object):
+    """Request body stream that stops at the end of the body.
+
+    Keeping track of how much of the body was read makes it possible to
+    skip the remainder when the application does not read all of it, so
+    that the next request on the connection can be parsed.
+    """
+
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self.remaining = length
+
+    def _limit(self, size):
+        if size is None or size < 0 or size > self.remaining:
+            return self.remaining
+        return size
+
+    def read(self, size=-1):
+        size = self._limit(size)
+        data = self._rfile.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        size = self._limit(size)
+        data = self._rfile.readline(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        """Discard the unread part of the body.
+
+        :returns: True if the body was fully consumed, False if it was
+            too large to be discarded.
+        """
+
+        if self.remaining > _MAX_DRAIN_SIZE:
+            return False
+
+        while self.remaining:
+            if not self.read(self.remaining):
+                return False
+
+        return True
+
+
+class _ServerHandler(simple_server.ServerHandler):
+    http_version = '1.1'
+
+    keep_alive = False
+
+    def cleanup_headers(self):
+        simple_server.ServerHandler.cleanup_headers(self)
+
+        # NOTE: The connection can only be kept open if the end of the
+        # response can be found without closing it.
+        request_handler = self.request_handler
+        server = request_handler.server
+        status = self.status or ''
+
+        self.keep_alive = (not request_handler.close_connection and
+                           bool(server.keepalive_timeout) and
+                           not server.stopping and
+                           ('Content-Length' in self.headers or
+                            status[:3] in ('204', '304')))
+
+        if not self.keep_alive:
+            self.headers['Connection'] = 'close'
+
+    def handle_error(self):
+        self.keep_alive = False
+        simple_server.ServerHandler.handle_error(self)
+
+
+class RequestHandler(simple_server.WSGIRequestHandler):
+    """HTTP/1.1 request handler supporting persistent connections."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # NOTE: Also bounds the time a thread spends waiting for the
+        # next request on an idle connection.
+        self.timeout = self.server.keepalive_timeout or None
+        simple_server.WSGIRequestHandler.setup(self)
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(_MAX_REQUEST_LINE + 1)
+        except socket.timeout:
+            self.close_connection = True
+            return
+
+        if len(self.raw_requestline) > _MAX_REQUEST_LINE:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+
+        if not self.parse_request():
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        stdin = _Input(self.rfile, length)
+
+        # NOTE: Chunked request bodies are not supported by wsgiref,
+        # so there is no telling where the next request would start.
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True
+
+        handler = _ServerHandler(stdin, self.wfile, self.get_stderr(),
+                                 self.get_environ(), multithread=True,
+                                 multiprocess=self.server.multiprocess)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+        if not handler.keep_alive or not stdin.drain():
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        LOG.debug(u'%(client)s - %(message)s',
+                  {'client': self.client_address[0],
+                   'message': format % args})
+
+
+class WSGIServer(simple_server.WSGIServer):
+    """WSGI server serving connections from a pool of threads.
+
+    :param sock: Listening socket to accept connections from
+    :param app: WSGI application to serve
+    :param threads: Number of threads serving connections
+    :param keepalive_timeout: Number of seconds an idle connection is
+        kept open, or 0 to close connections after each request
+    :param multiprocess: Whether other processes serve the same app
+    """
+
+    def __init__(self, sock, app, threads=1, keepalive_timeout=0,
+                 multiprocess=False):
+        self.address_family = sock.family
+        simple_server.WSGIServer.__init__(self, sock.getsockname(),
+                                          RequestHandler,
+                                          bind_and_activate=False)
+
+        # NOTE: Use the socket that is already listening instead of
+        # the one created by the base class.
+        self.socket.close()
+        self.socket = sock
+
+        host, port = self.server_address[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+
+        self.keepalive_timeout = keepalive_timeout
+        self.multiprocess = multiprocess
+        self.stopping = False
+
+        self._executor = futurist.ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process_request, request,
+                              client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def stop(self):
+        """Stop accepting connections, without waiting.
+
+        Connections being served are closed once their current request
+        is answered. Safe to call from a signal handler.
+        """
+
+        self.stopping = True
+        threading.Thread(target=self.shutdown).start()
+
+    def server_close(self):
+        simple_server.WSGIServer.server_close(self)
+        self._executor.shutdown(wait=True)
+
+
+class Server(object):
+    """Serves a WSGI application from pre-forked worker processes.
+
+    :param app_factory: Function returning the WSGI application to
+        serve, called in each worker process once it is forked
+    :param host: Address to listen on
+    :param port: Port to listen on
+    :param workers: Number of worker processes. With a single worker,
+        connections are served from the current process.
+    :param threads: Number of threads serving connections per worker
+    :param reuse_port: Have each worker bind its own socket using
+        SO_REUSEPORT, so that the kernel balances connections across
+        workers, instead of sharing a single listening socket
+    :param keepalive_timeout: Number of seconds an idle connection is
+        kept open, or 0 to disable keep-alive
+    :param shutdown_timeout: Number of seconds workers are given to
+        finish serving their requests when stopped, before being killed
+    :param reload: Function called on SIGHUP before the workers are
+        replaced, or None to leave SIGHUP unhandled
+    """
+
+    def __init__(self, app_factory, host, port, workers=1, threads=1,
+                 reuse_port=False, keepalive_timeout=0,
+                 shutdown_timeout=30, reload=None):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.reuse_port = reuse_port
+        self.keepalive_timeout = keepalive_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.reload = reload
+
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise errors.ConfigurationError(
+                u'SO_REUSEPORT is not supported on this platform')
+
+    def run(self):
+        """Serve until stopped by a signal."""
+
+        if self.workers == 1:
+            self._serve(prefork.listen(self.host, self.port,
+                                       self.reuse_port))
+            return
+
+        # NOTE: With SO_REUSEPORT, every worker binds its own socket.
+        sock = None
+        if not self.reuse_port:
+            sock = prefork.listen(self.host, self.port)
+
+        def serve(index):
+            self._serve(sock or prefork.listen(self.host, self.port, True))
+
+        try:
+            prefork.Master(serve, self.workers, u'WSGI',
+                           shutdown_timeout=self.shutdown_timeout,
+                           reload=self.reload).run()
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def _serve(self, sock):
+        httpd = WSGIServer(sock, self.app_factory(), threads=self.threads,
+                           keepalive_timeout=self.keepalive_timeout,
+                           multiprocess=self.workers > 1)
+
+        def stop(signum, frame):
+            httpd.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
@@ -54,9 +54,6 @@ def deserialize(stream, len):
         raise errors.HTTPBadRequestBody(description)
 
     try:
-        # TODO(kgriffs): read_json should stream the resulting list
-        # of messages, returning a generator rather than buffering
-        # everything in memory (bp/streaming-serialization).
         return utils.read_json(stream, len)
 
     except utils.MalformedJSON as ex:
@@ -76,6 +73,73 @@ def deserialize(stream, len):
         raise errors.HTTPServiceUnavailable(description)
 
 
+def deserialize_array(stream, len, field, spec=None):
+    """Incrementally deserializes the items of a JSON array field.
+
+    Returns a generator that reads the request body a chunk at a time,
+    yielding each object in document[field] as soon as it has been
+    parsed and, if a spec is given, filtered. Read and parsing errors
+    are translated to HTTP error types as they are encountered, so
+    callers can reject a bad item without reading the rest of the body.
+
+    :param stream: file-like object from which to read a JSON object
+    :param len: number of bytes to read from stream
+    :param field: name of the field holding the array of objects
+    :param spec: (Default None) field spec passed to `filter` for each
+        object; see `sanitize` for details.
+    :raises HTTPBadRequest: if the request is invalid
+    :raises HTTPServiceUnavailable: if the http service is unavailable
+    """
+
+    if len is None:
+        description = _(u'Request body can not be empty')
+        raise errors.HTTPBadRequestBody(description)
+
+    return _deserialize_array(stream, len, field, spec)
+
+
+def _deserialize_array(stream, len, field, spec):
+    items = utils.read_json_array(stream, len, field)
+
+    while True:
+        try:
+            item = next(items)
+
+        except StopIteration:
+            return
+
+        except utils.MissingJSONField as ex:
+            LOG.debug(ex)
+            description = _(u'No {0} were found in the request '
+                            u'body.').format(field)
+            raise errors.HTTPBadRequestAPI(description)
+
+        except utils.MalformedJSON as ex:
+            LOG.debug(ex)
+            description = _(u'Request body could not be parsed.')
+            raise errors.HTTPBadRequestBody(description)
+
+        except utils.OverflowedJSONInteger as ex:
+            LOG.debug(ex)
+            description = _(u'JSON contains integer that is too large.')
+            raise errors.HTTPBadRequestBody(description)
+
+        except utils.UnexpectedJSONType as ex:
+            LOG.debug(ex)
+            raise errors.HTTPDocumentTypeNotSupported()
+
+        except Exception as ex:
+            # Error while reading from the network/server
+            LOG.exception(ex)
+            description = _(u'Request body could not be read.')
+            raise errors.HTTPServiceUnavailable(description)
+
+        if not isinstance(item, JSONObject):
+            raise errors.HTTPDocumentTypeNotSupported()
+
+        yield item if spec is None else filter(item, spec)
+
+
 def sanitize(document, spec=None, doctype=JSONObject):
     """Validates a document and drops undesired fields.
 
@@ -161,20 +161,20 @@ class CollectionResource(object):
             LOG.debug(ex)
             raise wsgi_errors.HTTPBadRequestAPI(six.text_type(ex))
 
-        # Deserialize and validate the incoming messages
-        document = wsgi_utils.deserialize(req.stream, req.content_length)
-
-        if 'messages' not in document:
-            description = _(u'No messages were found in the request body.')
-            raise wsgi_errors.HTTPBadRequestAPI(description)
-
-        messages = wsgi_utils.sanitize(document['messages'],
-                                       self._message_post_spec,
-                                       doctype=wsgi_utils.JSONArray)
+        # Deserialize and validate the incoming messages one at a time,
+        # as they are read from the request body.
+        messages = wsgi_utils.deserialize_array(req.stream,
+                                                req.content_length,
+                                                'messages',
+                                                self._message_post_spec)
 
         try:
-            self._validate.message_posting(messages)
+            messages = list(self._validate.message_stream(messages))
+        except validation.ValidationFailed as ex:
+            LOG.debug(ex)
+            raise wsgi_errors.HTTPBadRequestAPI(six.text_type(ex))
 
+        try:
             if not self._queue_controller.exists(queue_name, project_id):
                 self._queue_controller.create(queue_name, project=project_id)
 
@@ -70,6 +70,9 @@ def public_endpoints(driver, conf):
                              message_controller)),
         ('/queues/{queue_name}/stats',
          stats.Resource(queue_controller)),
+        ('/stats',
+         stats.CollectionResource(driver._validate,
+                                  queue_controller)),
         ('/queues/{queue_name}/purge',
          purge.Resource(driver)),
         # Messages Endpoints
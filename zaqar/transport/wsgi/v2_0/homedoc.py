@@ -59,6 +59,20 @@ JSON_HOME = {
                 },
             },
         },
+        'rel/queues_stats': {
+            'href-template': '/v2/stats{?queues,marker,limit}',
+            'href-vars': {
+                'queues': 'param/queue_names',
+                'marker': 'param/marker',
+                'limit': 'param/queue_limit',
+            },
+            'hints': {
+                'allow': ['GET'],
+                'formats': {
+                    'application/json': {},
+                },
+            },
+        },
         'rel/queue_share': {
             'href-template': '/v2/queues/{queue_name}/share',
             'href-vars': {
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import falcon
 from oslo_log import log as logging
 import six
 
@@ -21,12 +22,25 @@ from zaqar.i18n import _
 from zaqar.storage import errors as storage_errors
 from zaqar.transport import acl
 from zaqar.transport import utils
+from zaqar.transport import validation
 from zaqar.transport.wsgi import errors as wsgi_errors
 
 
 LOG = logging.getLogger(__name__)
 
 
+def _link_messages(message_stats, base_path):
+    """Replaces the IDs of the oldest and newest messages with links."""
+    if message_stats['total'] != 0:
+        newest = message_stats['newest']
+        newest['href'] = base_path + newest['id']
+        del newest['id']
+
+        oldest = message_stats['oldest']
+        oldest['href'] = base_path + oldest['id']
+        del oldest['id']
+
+
 class Resource(object):
 
     __slots__ = '_queue_ctrl'
@@ -41,18 +55,8 @@ class Resource(object):
             resp_dict = self._queue_ctrl.stats(queue_name,
                                                project=project_id)
 
-            message_stats = resp_dict['messages']
-
-            if message_stats['total'] != 0:
-                base_path = req.path[:req.path.rindex('/')] + '/messages/'
-
-                newest = message_stats['newest']
-                newest['href'] = base_path + newest['id']
-                del newest['id']
-
-                oldest = message_stats['oldest']
-                oldest['href'] = base_path + oldest['id']
-                del oldest['id']
+            base_path = req.path[:req.path.rindex('/')] + '/messages/'
+            _link_messages(resp_dict['messages'], base_path)
 
             resp.body = utils.to_json(resp_dict)
             # status defaults to 200
@@ -76,3 +80,79 @@ class Resource(object):
             LOG.exception(ex)
             description = _(u'Queue stats could not be read.')
             raise wsgi_errors.HTTPServiceUnavailable(description)
+
+
+class CollectionResource(object):
+
+    __slots__ = ('_validate', '_queue_ctrl')
+
+    def __init__(self, validate, queue_controller):
+        self._validate = validate
+        self._queue_ctrl = queue_controller
+
+    @decorators.TransportLog("Queues stats collection")
+    @acl.enforce("queues:stats_all")
+    def on_get(self, req, resp, project_id):
+        kwargs = {}
+
+        # NOTE: The stats of the given queues are returned, or else
+        # the stats of a page of the project's queues.
+        queue_names = req.get_param_as_list('queues')
+        if not queue_names:
+            req.get_param('marker', store=kwargs)
+            req.get_param_as_int('limit', store=kwargs)
+
+        try:
+            if queue_names:
+                self._validate.queue_listing(limit=len(queue_names))
+                for queue_name in queue_names:
+                    self._validate.queue_identification(queue_name,
+                                                        project_id)
+            else:
+                self._validate.queue_listing(**kwargs)
+                results = self._queue_ctrl.list(project=project_id,
+                                                **kwargs)
+                queue_names = [queue['name'] for queue in next(results)]
+                kwargs['marker'] = next(results) or kwargs.get('marker', '')
+
+            stats = self._queue_ctrl.bulk_stats(queue_names,
+                                                project=project_id)
+
+        except validation.ValidationFailed as ex:
+            LOG.debug(ex)
+            raise wsgi_errors.HTTPBadRequestAPI(six.text_type(ex))
+
+        except Exception as ex:
+            LOG.exception(ex)
+            description = _(u'Queues stats could not be read.')
+            raise wsgi_errors.HTTPServiceUnavailable(description)
+
+        base_path = req.path[:req.path.rindex('/')] + '/queues/'
+        queues = []
+        for queue_name in queue_names:
+            if queue_name not in stats:
+                continue
+
+            queue_stats = stats[queue_name]
+            _link_messages(queue_stats['messages'],
+                           base_path + queue_name + '/messages/')
+            queue_stats['name'] = queue_name
+            queue_stats['href'] = base_path + queue_name
+            queues.append(queue_stats)
+
+        links = []
+        if 'marker' in kwargs and queue_names:
+            links = [
+                {
+                    'rel': 'next',
+                    'href': req.path + falcon.to_query_str(kwargs)
+                }
+            ]
+
+        response_body = {
+            'queues': queues,
+            'links': links
+        }
+
+        resp.body = utils.to_json(response_body)
+        # status defaults to 200
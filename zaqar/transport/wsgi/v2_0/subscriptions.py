@@ -19,11 +19,11 @@ from oslo_log import log as logging
 from oslo_utils import netutils
 from oslo_utils import timeutils
 import six
-from stevedore import driver
 
 from zaqar.common import decorators
 from zaqar.i18n import _
 from zaqar.notification import notifier
+from zaqar.notification import tasks
 from zaqar.storage import errors as storage_errors
 from zaqar.transport import acl
 from zaqar.transport import utils
@@ -187,11 +187,10 @@ class CollectionResource(object):
             options = document.get('options', {})
             url = netutils.urlsplit(subscriber)
             ttl = document.get('ttl', self._default_subscription_ttl)
-            mgr = driver.DriverManager('zaqar.notification.tasks', url.scheme,
-                                       invoke_on_load=True)
             req_data = req.headers.copy()
             req_data.update(req.env)
-            mgr.driver.register(subscriber, options, ttl, project_id, req_data)
+            tasks.get_task(url.scheme).register(
+                subscriber, options, ttl, project_id, req_data)
 
             created = self._subscription_controller.create(queue_name,
                                                            subscriber,